@@ -4,12 +4,24 @@ from fastapi import FastAPI, Depends, HTTPException
 from sqlalchemy import create_engine, Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 import os
+from contextlib import asynccontextmanager
 
 from routes.job_routes import router
+from database import async_engine
+from services.stream import stream_hub
+from services.job_cache import job_cache
 
 # from app.database import get_db
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await stream_hub.stop()
+    await job_cache.stop()
+    # close the pooled connections while their event loop is still running
+    await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(router)
 
@@ -0,0 +1,33 @@
+"""add job idempotency key
+
+Revision ID: 071509d1fd74
+Revises: 0a56bba5553d
+Create Date: 2026-10-18 00:43:06.923978
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '071509d1fd74'
+down_revision: Union[str, Sequence[str], None] = '0a56bba5553d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('jobs', sa.Column('idempotency_key', sa.String(), nullable=True))
+    op.create_index(
+        'uq_jobs_idempotency_key', 'jobs', ['idempotency_key'], unique=True,
+        postgresql_where=sa.text("idempotency_key IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_jobs_idempotency_key', table_name='jobs')
+    op.drop_column('jobs', 'idempotency_key')
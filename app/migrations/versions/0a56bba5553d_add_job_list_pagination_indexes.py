@@ -0,0 +1,38 @@
+"""add job list pagination indexes
+
+Revision ID: 0a56bba5553d
+Revises: 838fa2a4a323
+Create Date: 2026-10-18 00:22:21.436993
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a56bba5553d'
+down_revision: Union[str, Sequence[str], None] = '838fa2a4a323'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # keyset pagination needs a created_time on every row
+    op.execute("UPDATE jobs SET created_time = now() WHERE created_time IS NULL")
+    op.alter_column('jobs', 'created_time', nullable=False, server_default=sa.func.now())
+    op.create_index('ix_jobs_created_id', 'jobs', ['created_time', 'id'], unique=False)
+    op.create_index('ix_jobs_status_created_id', 'jobs', ['status', 'created_time', 'id'], unique=False)
+    op.create_index('ix_jobs_priority_created_id', 'jobs', ['priority', 'created_time', 'id'], unique=False)
+    op.create_index('ix_jobs_status_priority_created_id', 'jobs', ['status', 'priority', 'created_time', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_jobs_status_priority_created_id', table_name='jobs')
+    op.drop_index('ix_jobs_priority_created_id', table_name='jobs')
+    op.drop_index('ix_jobs_status_created_id', table_name='jobs')
+    op.drop_index('ix_jobs_created_id', table_name='jobs')
+    op.alter_column('jobs', 'created_time', nullable=True, server_default=None)
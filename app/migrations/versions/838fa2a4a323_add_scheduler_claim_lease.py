@@ -0,0 +1,35 @@
+"""add scheduler claim lease
+
+Revision ID: 838fa2a4a323
+Revises: e95bdda76f9b
+Create Date: 2026-10-18 00:08:20.068215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '838fa2a4a323'
+down_revision: Union[str, Sequence[str], None] = 'e95bdda76f9b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('jobs', sa.Column('claimed_by', sa.String(), nullable=True))
+    op.add_column('jobs', sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(
+        'ix_jobs_claim_lease', 'jobs', ['lease_expires_at'], unique=False,
+        postgresql_where=sa.text("status = 'claimed'"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_jobs_claim_lease', table_name='jobs')
+    op.drop_column('jobs', 'lease_expires_at')
+    op.drop_column('jobs', 'claimed_by')
@@ -0,0 +1,64 @@
+"""add access path indexes
+
+Revision ID: 93ec357ac801
+Revises: 071509d1fd74
+Create Date: 2026-10-18 01:03:01.369919
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '93ec357ac801'
+down_revision: Union[str, Sequence[str], None] = '071509d1fd74'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# jobs is written on every state change: build without locking it out
+# (CONCURRENTLY cannot run inside the migration's transaction)
+READY = "unmet_dependencies = 0 AND status IN ('waiting', 'ready', 'retrying')"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        # scheduler: ready jobs in (priority, run_at) order, read up to the batch size
+        op.create_index(
+            'ix_jobs_ready_priority_run_at', 'jobs', ['priority', 'run_at'], unique=False,
+            postgresql_where=sa.text(READY), postgresql_concurrently=True,
+        )
+        # job_id is the public identifier, every API lookup goes through it
+        op.create_index('uq_jobs_job_id', 'jobs', ['job_id'], unique=True, postgresql_concurrently=True)
+        # children of a job (complete_job, cancel_job), answered from the index alone
+        op.create_index(
+            'ix_job_dependencies_depends_on_id', 'job_dependencies', ['depends_on_id'], unique=False,
+            postgresql_include=['dependant_id'], postgresql_concurrently=True,
+        )
+        # GET /jobs/{id}/logs
+        op.create_index(
+            'ix_execution_logs_job_id_log_timestamp', 'execution_logs', ['job_id', 'log_timestamp'], unique=False,
+            postgresql_concurrently=True,
+        )
+        # covered by the indexes above and the (status|priority, created_time, id) ones,
+        # they only cost writes
+        op.drop_index('ix_jobs_job_id', table_name='jobs', postgresql_concurrently=True)
+        op.drop_index('ix_jobs_status', table_name='jobs', postgresql_concurrently=True)
+        op.drop_index('ix_jobs_priority', table_name='jobs', postgresql_concurrently=True)
+        op.drop_index('ix_jobs_run_at', table_name='jobs', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_jobs_run_at', 'jobs', ['run_at'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_jobs_priority', 'jobs', ['priority'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_jobs_status', 'jobs', ['status'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_jobs_job_id', 'jobs', ['job_id'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_execution_logs_job_id_log_timestamp', table_name='execution_logs', postgresql_concurrently=True)
+        op.drop_index('ix_job_dependencies_depends_on_id', table_name='job_dependencies', postgresql_concurrently=True)
+        op.drop_index('uq_jobs_job_id', table_name='jobs', postgresql_concurrently=True)
+        op.drop_index('ix_jobs_ready_priority_run_at', table_name='jobs', postgresql_concurrently=True)
@@ -0,0 +1,167 @@
+"""partition execution logs and add job archive
+
+Revision ID: e467efb87478
+Revises: 93ec357ac801
+Create Date: 2026-10-18 01:06:17.388901
+
+"""
+from typing import Sequence, Union
+
+from datetime import datetime, timedelta, timezone
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e467efb87478'
+down_revision: Union[str, Sequence[str], None] = '93ec357ac801'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# daily partitions created in advance, services/retention.py keeps them coming
+PARTITIONS_AHEAD = 7
+
+
+def log_columns():
+    return [
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('job_uuid', sa.UUID(), nullable=True),
+        sa.Column('log_timestamp', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('message', sa.String(), nullable=False),
+        sa.Column('duration_seconds', sa.DECIMAL(), nullable=True),
+        sa.Column('is_successful', sa.Boolean(), nullable=True),
+        sa.Column('results', sa.JSON(), nullable=True),
+        sa.Column('cpu_units', sa.Integer(), nullable=True),
+        sa.Column('memory_mb', sa.Integer(), nullable=True),
+        sa.Column('execution_start_time', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('execution_end_time', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('attempt_number', sa.Integer(), nullable=False),
+    ]
+
+
+def day_bound(day):
+    return f"'{day.isoformat()} 00:00:00+00'"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    # The existing table becomes the partition of everything before the first
+    # daily partition, no row is copied. Retention detaches it like any other.
+    newest = conn.execute(sa.text("SELECT max(log_timestamp) FROM execution_logs")).scalar()
+    first_day = datetime.now(timezone.utc).date() + timedelta(days=1)
+    if newest is not None:
+        first_day = max(first_day, newest.astimezone(timezone.utc).date() + timedelta(days=1))
+
+    op.drop_constraint('execution_logs_job_id_fkey', 'execution_logs', type_='foreignkey')
+    op.drop_constraint('execution_logs_pkey', 'execution_logs', type_='primary')
+    op.rename_table('execution_logs', 'execution_logs_legacy')
+    op.execute("ALTER TABLE execution_logs_legacy ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER INDEX ix_execution_logs_log_timestamp RENAME TO execution_logs_legacy_log_timestamp_idx")
+    op.execute("ALTER INDEX ix_execution_logs_job_id_log_timestamp RENAME TO execution_logs_legacy_job_id_log_timestamp_idx")
+
+    op.create_table(
+        'execution_logs',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('execution_logs_id_seq'::regclass)"), nullable=False),
+        *log_columns(),
+        sa.PrimaryKeyConstraint('id', 'log_timestamp'),
+        postgresql_partition_by='RANGE (log_timestamp)',
+    )
+    op.execute("ALTER SEQUENCE execution_logs_id_seq OWNED BY execution_logs.id")
+    # created on every partition, the legacy table's equivalent indexes are reused
+    op.create_index('ix_execution_logs_log_timestamp', 'execution_logs', ['log_timestamp'], unique=False)
+    op.create_index('ix_execution_logs_job_id_log_timestamp', 'execution_logs', ['job_id', 'log_timestamp'], unique=False)
+    op.execute(
+        "ALTER TABLE execution_logs ATTACH PARTITION execution_logs_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ({day_bound(first_day)})"
+    )
+    op.execute("CREATE TABLE execution_logs_default PARTITION OF execution_logs DEFAULT")
+    last_day = max(first_day, datetime.now(timezone.utc).date() + timedelta(days=PARTITIONS_AHEAD))
+    day = first_day
+    while day <= last_day:
+        op.execute(
+            f"CREATE TABLE execution_logs_p{day:%Y%m%d} PARTITION OF execution_logs "
+            f"FOR VALUES FROM ({day_bound(day)}) TO ({day_bound(day + timedelta(days=1))})"
+        )
+        day += timedelta(days=1)
+
+    op.create_index(
+        'ix_jobs_terminal_modified_time', 'jobs', ['modified_time'], unique=False,
+        postgresql_where=sa.text("status IN ('completed', 'cancelled', 'failed')"),
+    )
+    op.create_table(
+        'jobs_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('job_id', sa.UUID(), nullable=True),
+        sa.Column('job_name', sa.String(), nullable=True),
+        sa.Column('type', sa.String(), nullable=True),
+        sa.Column('payload', sa.JSON(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('cpu_units', sa.Integer(), nullable=True),
+        sa.Column('memory_mb', sa.Integer(), nullable=True),
+        sa.Column('max_attempts', sa.Integer(), nullable=True),
+        sa.Column('backoff_multiplier', sa.DECIMAL(), nullable=True),
+        sa.Column('initial_delay', sa.DECIMAL(), nullable=True),
+        sa.Column('timeout', sa.Integer(), nullable=True),
+        sa.Column('created_time', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('modified_time', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('priority', postgresql.ENUM(name='job_priority_enum', create_type=False), nullable=True),
+        sa.Column('times_attempted', sa.Integer(), nullable=True),
+        sa.Column('unmet_dependencies', sa.Integer(), nullable=True),
+        sa.Column('claimed_by', sa.String(), nullable=True),
+        sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('idempotency_key', sa.String(), nullable=True),
+        sa.Column('run_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('results', sa.JSON(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_jobs_archive_job_id', 'jobs_archive', ['job_id'], unique=False)
+    op.create_table(
+        'job_dependencies_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('dependant_id', sa.Integer(), nullable=True),
+        sa.Column('depends_on_id', sa.Integer(), nullable=True),
+        sa.Column('dependant_uuid', sa.UUID(), nullable=True),
+        sa.Column('depends_on_uuid', sa.UUID(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # archived jobs go back to the live tables
+    op.execute(
+        "INSERT INTO jobs (id, job_id, job_name, type, payload, status, cpu_units, memory_mb, max_attempts, "
+        "backoff_multiplier, initial_delay, timeout, created_time, modified_time, priority, times_attempted, "
+        "unmet_dependencies, claimed_by, lease_expires_at, idempotency_key, run_at, results) "
+        "SELECT id, job_id, job_name, type, payload, status, cpu_units, memory_mb, max_attempts, "
+        "backoff_multiplier, initial_delay, timeout, created_time, modified_time, priority, times_attempted, "
+        "unmet_dependencies, claimed_by, lease_expires_at, idempotency_key, run_at, results FROM jobs_archive"
+    )
+    op.execute(
+        "INSERT INTO job_dependencies (id, dependant_id, depends_on_id, dependant_uuid, depends_on_uuid) "
+        "SELECT id, dependant_id, depends_on_id, dependant_uuid, depends_on_uuid FROM job_dependencies_archive"
+    )
+    op.drop_table('job_dependencies_archive')
+    op.drop_index('ix_jobs_archive_job_id', table_name='jobs_archive')
+    op.drop_table('jobs_archive')
+    op.drop_index('ix_jobs_terminal_modified_time', table_name='jobs')
+
+    # back to one plain table, with the rows of the attached partitions
+    op.create_table(
+        'execution_logs_plain',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('execution_logs_id_seq'::regclass)"), nullable=False),
+        *log_columns(),
+    )
+    op.execute("INSERT INTO execution_logs_plain SELECT * FROM execution_logs")
+    op.execute("ALTER SEQUENCE execution_logs_id_seq OWNED BY execution_logs_plain.id")
+    op.drop_table('execution_logs')
+    op.rename_table('execution_logs_plain', 'execution_logs')
+    op.create_primary_key('execution_logs_pkey', 'execution_logs', ['id'])
+    op.execute("DELETE FROM execution_logs WHERE job_id NOT IN (SELECT id FROM jobs)")
+    op.create_foreign_key('execution_logs_job_id_fkey', 'execution_logs', 'jobs', ['job_id'], ['id'])
+    op.create_index('ix_execution_logs_log_timestamp', 'execution_logs', ['log_timestamp'], unique=False)
+    op.create_index('ix_execution_logs_job_id_log_timestamp', 'execution_logs', ['job_id', 'log_timestamp'], unique=False)
@@ -0,0 +1,47 @@
+"""add unmet dependency counter
+
+Revision ID: e95bdda76f9b
+Revises: 6894a5457b04
+Create Date: 2026-10-17 23:56:28.978525
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e95bdda76f9b'
+down_revision: Union[str, Sequence[str], None] = '6894a5457b04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('jobs', sa.Column('unmet_dependencies', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the counter for jobs that already have dependencies.
+    op.execute("""
+        UPDATE jobs SET unmet_dependencies = pending.cnt
+        FROM (
+            SELECT d.dependant_id, count(*) AS cnt
+            FROM job_dependencies d
+            JOIN jobs parent ON parent.id = d.depends_on_id
+            WHERE parent.status != 'completed'
+            GROUP BY d.dependant_id
+        ) AS pending
+        WHERE jobs.id = pending.dependant_id
+    """)
+
+    op.create_index(
+        'ix_jobs_ready_run_at', 'jobs', ['run_at'], unique=False,
+        postgresql_where=sa.text("unmet_dependencies = 0 AND status IN ('waiting', 'ready', 'retrying')"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_jobs_ready_run_at', table_name='jobs')
+    op.drop_column('jobs', 'unmet_dependencies')
@@ -0,0 +1,47 @@
+"""add job critical path
+
+Revision ID: fee9bf7ee781
+Revises: e467efb87478
+Create Date: 2026-10-18 09:12:41.204517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fee9bf7ee781'
+down_revision: Union[str, Sequence[str], None] = 'e467efb87478'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+READY = "unmet_dependencies = 0 AND status IN ('waiting', 'ready', 'retrying')"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # filled in by the scheduler when it loads the dependency graph
+    op.add_column('jobs', sa.Column('critical_path', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('jobs_archive', sa.Column('critical_path', sa.Integer(), nullable=True))
+    with op.get_context().autocommit_block():
+        # scheduler: ready jobs in (priority, critical_path desc, run_at) order
+        op.create_index(
+            'ix_jobs_ready_priority_path_run_at', 'jobs', ['priority', sa.text('critical_path DESC'), 'run_at'],
+            unique=False, postgresql_where=sa.text(READY), postgresql_concurrently=True,
+        )
+        op.drop_index('ix_jobs_ready_priority_run_at', table_name='jobs', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_jobs_ready_priority_run_at', 'jobs', ['priority', 'run_at'], unique=False,
+            postgresql_where=sa.text(READY), postgresql_concurrently=True,
+        )
+        op.drop_index('ix_jobs_ready_priority_path_run_at', table_name='jobs', postgresql_concurrently=True)
+    op.drop_column('jobs_archive', 'critical_path')
+    op.drop_column('jobs', 'critical_path')
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, JSON, DECIMAL, Index
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, JSON, DECIMAL, Index, Table, DDL, event, text, func
 from sqlalchemy.dialects.postgresql import UUID, ENUM
 from sqlalchemy.ext.declarative import declarative_base # Note: declarative_base is deprecated in SQLAlchemy 2.0, use `MappedAsDataclass` or `DeclarativeBase`
 from sqlalchemy.schema import UniqueConstraint, CheckConstraint # Need to import this for JobDependency
@@ -10,6 +10,38 @@ Base = declarative_base()
 
 class Job(Base):
     __tablename__ = 'jobs'
+    __table_args__ = (
+        Index(
+            'ix_jobs_ready_run_at',
+            'run_at',
+            postgresql_where=text("unmet_dependencies = 0 AND status IN ('waiting', 'ready', 'retrying')"),
+        ),
+        # the scheduler's claim, ix_jobs_ready_priority_path_run_at, is defined below the class
+        Index('uq_jobs_job_id', 'job_id', unique=True),
+        # retention: terminal jobs, oldest first
+        Index(
+            'ix_jobs_terminal_modified_time',
+            'modified_time',
+            postgresql_where=text("status IN ('completed', 'cancelled', 'failed')"),
+        ),
+        Index(
+            'ix_jobs_claim_lease',
+            'lease_expires_at',
+            postgresql_where=text("status = 'claimed'"),
+        ),
+        # GET /jobs pages in (created_time, id) order, one index per filter combination
+        Index('ix_jobs_created_id', 'created_time', 'id'),
+        Index('ix_jobs_status_created_id', 'status', 'created_time', 'id'),
+        Index('ix_jobs_priority_created_id', 'priority', 'created_time', 'id'),
+        Index('ix_jobs_status_priority_created_id', 'status', 'priority', 'created_time', 'id'),
+        # a client key can be used by one job only, jobs without a key are not indexed
+        Index(
+            'uq_jobs_idempotency_key',
+            'idempotency_key',
+            unique=True,
+            postgresql_where=text("idempotency_key IS NOT NULL"),
+        ),
+    )
     # __table_args__ = (
     #     Index(
     #         'uq_job_id_active_true', 
@@ -20,12 +52,12 @@ class Job(Base):
     # )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    job_id = Column(UUID(as_uuid=True), default=uuid.uuid4, index=True)
+    job_id = Column(UUID(as_uuid=True), default=uuid.uuid4) # unique, see uq_jobs_job_id
     job_name = Column(String, nullable=False)
     type = Column(String, nullable=False)
     # active = Column(Boolean, default=True, nullable=False) # no versioning for now 
     payload = Column(JSON) 
-    status = Column(String, index=True)
+    status = Column(String)
     cpu_units = Column(Integer)
     memory_mb = Column(Integer)
 
@@ -34,21 +66,39 @@ class Job(Base):
     initial_delay = Column(DECIMAL, default=0.0)
     timeout = Column(Integer)
 
-    created_time = Column(DateTime(timezone=True), default=datetime.now(timezone.utc))
-    modified_time = Column(DateTime(timezone=True), default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_time = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), server_default=func.now(), nullable=False)
+    modified_time = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     # created_by = Column(String)
     # modified_by = Column(String)
 
     priority_enum = ENUM('Critical', 'High', 'Normal', 'Low', name='job_priority_enum', create_type=False)
-    priority = Column(priority_enum, index=True)
+    priority = Column(priority_enum)
     
     times_attempted = Column(Integer, default=0) 
 
-    run_at = Column(DateTime(timezone=True), index=True) # When this job can next be considered for running.
+    # Number of parent jobs that are not completed yet. Set on submission and
+    # decremented when a parent completes, so a job is ready once it reaches 0.
+    unmet_dependencies = Column(Integer, default=0, server_default='0', nullable=False)
+
+    # Longest chain of jobs depending on this one, directly or not. Kept up to
+    # date by the scheduler's dependency graph (services/dag.py); among jobs of
+    # the same priority the one with the longest chain is started first.
+    critical_path = Column(Integer, default=0, server_default='0', nullable=False)
+
+    # Scheduler replica currently dispatching this job, or worker running it, and until when it holds it.
+    # A claim whose lease has expired goes back to the pool (see scheduler.release_expired_claims),
+    # a running job whose lease has expired is retried (scheduler.release_expired_runs).
+    claimed_by = Column(String)
+    lease_expires_at = Column(DateTime(timezone=True))
+
+    # Client supplied, submitting the same key again returns the existing job
+    idempotency_key = Column(String)
+
+    run_at = Column(DateTime(timezone=True)) # When this job can next be considered for running.
     results = Column(JSON)
 
-    logs = relationship("ExecutionLog", back_populates="job", cascade="all, delete-orphan", order_by="ExecutionLog.log_timestamp")
+    logs = relationship("ExecutionLog", primaryjoin="Job.id == foreign(ExecutionLog.job_id)", back_populates="job", cascade="all, delete-orphan", order_by="ExecutionLog.log_timestamp")
  
     # does this make sense as we are accessing job dependancy
     parent_jobdependancy = relationship("JobDependency", foreign_keys="JobDependency.dependant_id", back_populates="dependent_job", cascade="all, delete-orphan")
@@ -69,6 +119,13 @@ class Job(Base):
                 data[column.name] = value
         return data
 
+# the scheduler's claim: ready jobs in (priority, critical_path desc, run_at) order
+Index(
+    'ix_jobs_ready_priority_path_run_at',
+    Job.priority, Job.critical_path.desc(), Job.run_at,
+    postgresql_where=text("unmet_dependencies = 0 AND status IN ('waiting', 'ready', 'retrying')"),
+)
+
 class JobDependency(Base):
     __tablename__ = 'job_dependencies'
 
@@ -86,6 +143,8 @@ class JobDependency(Base):
     
     __table_args__ = (
         UniqueConstraint('dependant_id', 'depends_on_id', name='uq_job_dependency_pair'),
+        # a job's children (the pair constraint above serves its parents)
+        Index('ix_job_dependencies_depends_on_id', 'depends_on_id', postgresql_include=['dependant_id']),
         CheckConstraint('dependant_id != depends_on_id', name='chk_no_self_dependency') # Requires `from sqlalchemy import CheckConstraint`
     )
     
@@ -94,14 +153,22 @@ class JobDependency(Base):
 
 class ExecutionLog(Base):
     __tablename__ = 'execution_logs'
+    __table_args__ = (
+        Index('ix_execution_logs_job_id_log_timestamp', 'job_id', 'log_timestamp'),
+        # One partition per day, created ahead and detached once past retention
+        # (services/retention.py). The partition key has to be part of the primary key.
+        {'postgresql_partition_by': 'RANGE (log_timestamp)'},
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    job_id = Column(Integer, ForeignKey('jobs.id'), nullable=False) 
+    # No foreign key: logs outlive their job, which is moved to jobs_archive
+    # independently of the partition its logs are in.
+    job_id = Column(Integer, nullable=False)
     
     # worker_id = Column(integer)Need worker id to know which worker did the task
     job_uuid = Column(UUID(as_uuid=True), default=uuid.uuid4) # should be auto populated
 
-    log_timestamp = Column(DateTime(timezone=True), default=datetime.now(timezone.utc), nullable=False, index=True)
+    log_timestamp = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), primary_key=True, nullable=False, index=True)
 
     message = Column(String, nullable=False)
 
@@ -118,4 +185,23 @@ class ExecutionLog(Base):
 
     attempt_number = Column(Integer, nullable=False, default=1) 
     
-    job = relationship("Job", back_populates="logs")
\ No newline at end of file
+    job = relationship("Job", primaryjoin="foreign(ExecutionLog.job_id) == Job.id", back_populates="logs")
+
+# rows outside the daily partitions (clock skew...) instead of failing the insert
+event.listen(
+    ExecutionLog.__table__, "after_create",
+    DDL("CREATE TABLE execution_logs_default PARTITION OF execution_logs DEFAULT"),
+)
+
+
+def archive_table(table, name):
+    # Same columns, no foreign keys nor defaults: history only, written by
+    # services/retention.py and never by the scheduler or the API.
+    return Table(name, Base.metadata, *[
+        Column(column.name, column.type, primary_key=column.primary_key, autoincrement=False)
+        for column in table.columns
+    ])
+
+jobs_archive = archive_table(Job.__table__, 'jobs_archive')
+Index('ix_jobs_archive_job_id', jobs_archive.c.job_id)
+job_dependencies_archive = archive_table(JobDependency.__table__, 'job_dependencies_archive')
\ No newline at end of file
@@ -5,7 +5,7 @@ from uuid import UUID
 from pytz import all_timezones
 # from app. import schemas, crud, models
 from database import get_db
-from schemas.job_schemas import JobCreate, JobOut, JobLogOut
+from schemas.job_schemas import JobCreate, JobBatchItem, JobBatchOut, JobOut, JobPage, JobLogOut
 from services import api as job_api
 
 router = APIRouter()
@@ -85,8 +85,18 @@ router = APIRouter()
     summary="Submit a new job",
     description="Create and queue a new job."
 )
-def create_job(job: JobCreate, db=Depends(get_db)):
-    return job_api.create_job(job, db)
+async def create_job(job: JobCreate, db: AsyncSession = Depends(get_db)):
+    return await job_api.create_job(job, db)
+
+@router.post(
+    "/jobs/batch",
+    response_model=JobBatchOut,
+    status_code=status.HTTP_201_CREATED,
+    summary="Submit many jobs at once",
+    description="Create a batch of jobs in one transaction. Items can depend on each other through their ref."
+)
+async def create_jobs_batch(jobs: List[JobBatchItem], db: AsyncSession = Depends(get_db)):
+    return await job_api.create_jobs_batch(jobs, db)
 
 @router.get(
     "/jobs/{job_id}",
@@ -94,23 +104,23 @@ def create_job(job: JobCreate, db=Depends(get_db)):
     summary="Get job status and details",
     description="Retrieve the status and details of a job by its job_id."
 )
-def get_job(job_id: UUID, db=Depends(get_db)):
-    return job_api.get_job(job_id, db)
+async def get_job(job_id: UUID, db: AsyncSession = Depends(get_db)):
+    return await job_api.get_job(job_id, db)
 
 @router.get(
     "/jobs",
-    response_model=List[JobOut],
+    response_model=JobPage,
     summary="List jobs with filtering",
-    description="List all jobs, optionally filtered by status or priority."
+    description="List jobs oldest first, optionally filtered by status or priority. Pass next_cursor back as cursor for the next page."
 )
-def list_jobs(
+async def list_jobs(
     status: Optional[str] = Query(None, description="Filter by job status"),
     priority: Optional[str] = Query(None, description="Filter by job priority"),
-    skip: int = 0,
-    limit: int = 100,
-    db=Depends(get_db)
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
 ):
-    return job_api.list_jobs(status, priority, skip, limit, db)
+    return await job_api.list_jobs(status, priority, cursor, limit, db)
 
 @router.patch(
     "/jobs/{job_id}/cancel",
@@ -118,8 +128,8 @@ def list_jobs(
     summary="Cancel a job",
     description="Cancel a job if it is not already completed or cancelled."
 )
-def cancel_job(job_id: UUID, db=Depends(get_db)):
-    return job_api.cancel_job(job_id, db)
+async def cancel_job(job_id: UUID, db: AsyncSession = Depends(get_db)):
+    return await job_api.cancel_job(job_id, db)
 
 @router.get(
     "/jobs/{job_id}/logs",
@@ -127,8 +137,8 @@ def cancel_job(job_id: UUID, db=Depends(get_db)):
     summary="Get job execution logs",
     description="Retrieve execution logs for a specific job."
 )
-def get_job_logs(job_id: UUID, db=Depends(get_db)):
-    return job_api.get_job_logs(job_id, db)
+async def get_job_logs(job_id: UUID, db: AsyncSession = Depends(get_db)):
+    return await job_api.get_job_logs(job_id, db)
 
 @router.websocket("/jobs/stream")
 async def job_stream(websocket: WebSocket):
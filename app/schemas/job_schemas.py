@@ -27,7 +27,16 @@ class JobCreate(BaseModel):
     retry_config: Optional[RetryConfig] = None
     priority: PriorityEnum = PriorityEnum.Normal
     run_at: Optional[datetime] = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timeout: Optional[int] = None # seconds, the worker cancels the job after this
     depends_on: Optional[List[UUID]] = []
+    idempotency_key: Optional[str] = Field(None, max_length=255) # resubmitting the same key returns the existing job
+
+class JobBatchItem(JobCreate):
+    ref: Optional[str] = None # client-assigned, lets other items of the same batch depend on this one
+    depends_on_refs: Optional[List[str]] = [] # refs of items in the same batch
+
+class JobBatchOut(BaseModel):
+    job_ids: List[UUID] # in the order the jobs were submitted
 
 class JobOut(BaseModel):
     job_id: UUID
@@ -38,6 +47,8 @@ class JobOut(BaseModel):
     priority: PriorityEnum
     times_attempted: Optional[int]
     run_at: Optional[datetime]
+    timeout: Optional[int] = None
+    idempotency_key: Optional[str] = None
     results: Optional[Any]
     resource_requirements: Optional[ResourceRequirements] = None
     retry_config: Optional[RetryConfig] = None
@@ -46,6 +57,10 @@ class JobOut(BaseModel):
     class Config:
         orm_mode = True
 
+class JobPage(BaseModel):
+    items: List[JobOut]
+    next_cursor: Optional[str] = None # pass as ?cursor= for the next page, None on the last page
+
 class JobLogOut(BaseModel):
     id: int
     job_id: UUID
@@ -1,19 +1,43 @@
-from fastapi import HTTPException, status, WebSocket, WebSocketDisconnect, Query, Depends
-from sqlalchemy.orm import Session
+from fastapi import HTTPException, status, WebSocket, WebSocketDisconnect, Query, Depends, Response
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from uuid import UUID
 import uuid
 import asyncio
+import base64
+import json
+import os
+from datetime import datetime, timezone
 from models.models import Job, ExecutionLog, JobDependency
-from schemas.job_schemas import JobCreate, JobOut, JobLogOut, ExecutionLogOut, ResourceRequirements, RetryConfig, PriorityEnum
+from schemas.job_schemas import JobCreate, JobBatchItem, JobBatchOut, JobOut, JobPage, JobLogOut, ExecutionLogOut, ResourceRequirements, RetryConfig, PriorityEnum
 from database import get_db
+from services.job_events import notify_job_event_async, notify_job_dependencies_async
+from services.dag import CycleError, DependencyGraph
+from services.bulk import copy_rows, reserve_ids
+from services.cache import LRUCache
+from services.job_cache import job_cache
+from services.stream import stream_hub
 
-# POST /jobs - Submit a new job
-def create_job(job: JobCreate, db: Session = Depends(get_db)):
+# Largest POST /jobs/batch accepted, the whole batch is one transaction
+MAX_BATCH_JOBS = int(os.getenv("API_MAX_BATCH_JOBS", 10000))
+
+# idempotency_key -> JobOut of the job created for it. Answers client retries
+# (the same response as the first submission) without a database round trip.
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("API_IDEMPOTENCY_CACHE_SIZE", 10000))
+recent_submissions = LRUCache(IDEMPOTENCY_CACHE_SIZE)
+
+def job_row(job: JobCreate) -> dict:
     # Flatten resource_requirements and retry_config for DB model
-    job_data = job.model_dump(exclude={"depends_on", "resource_requirements", "retry_config"})
+    job_data = job.model_dump(exclude={"depends_on", "resource_requirements", "retry_config", "ref", "depends_on_refs"})
     job_data["job_id"] = uuid.uuid4() # Generate job_id in the backend
     job_data["priority"] = job.priority.name
+    if job_data["run_at"] is None:
+        # an explicit null means as soon as possible, like leaving it out
+        # (the scheduler never picks up a job without a run_at)
+        job_data["run_at"] = datetime.now(timezone.utc)
     if job.resource_requirements:
         job_data["cpu_units"] = job.resource_requirements.cpu_units
         job_data["memory_mb"] = job.resource_requirements.memory_mb
@@ -21,62 +45,225 @@ def create_job(job: JobCreate, db: Session = Depends(get_db)):
         job_data["max_attempts"] = job.retry_config.max_attempts
         job_data["backoff_multiplier"] = job.retry_config.backoff_multiplier
         job_data["initial_delay"] = job.retry_config.initial_delay_seconds
-    db_job = Job(**job_data)
-    db_job.status = "waiting"
-    db.add(db_job)
-    db.commit()
-    db.refresh(db_job)
-
-    # Handle dependencies if any
-    if job.depends_on:
-        for dep_uuid in job.depends_on:
-            dep_job = db.query(Job).filter(Job.job_id == dep_uuid).first()
-            if not dep_job:
+    return job_data
+
+# POST /jobs - Submit a new job
+async def create_job(job: JobCreate, db: AsyncSession = Depends(get_db)):
+    key = job.idempotency_key
+    if key is not None:
+        cached = recent_submissions.get(key)
+        if cached is not None:
+            return cached
+    job_data = job_row(job)
+
+    # Resolve all dependencies up front so the job, its edges and its
+    # unmet dependency counter are written in one transaction.
+    # Parent rows are locked so none of them can complete between counting and commit.
+    # FOR SHARE is enough to hold a completion back, and submissions that
+    # share parents (a fan-in) don't wait on each other.
+    depends_on = list(dict.fromkeys(job.depends_on or []))
+    parent_jobs = []
+    if depends_on:
+        result = await db.execute(select(Job).where(Job.job_id.in_(depends_on)).with_for_update(read=True))
+        parent_jobs = result.scalars().all()
+        found = {parent.job_id for parent in parent_jobs}
+        for dep_uuid in depends_on:
+            if dep_uuid not in found:
+                await db.rollback()
                 raise HTTPException(status_code=400, detail=f"Dependency job {dep_uuid} not found")
-            dependency = JobDependency(dependant_id=db_job.id, depends_on_id=dep_job.id)
-            db.add(dependency)
-        db.commit()
-    return job_out_from_db(db_job, db)
+
+    job_data["status"] = "waiting"
+    job_data["unmet_dependencies"] = sum(1 for parent in parent_jobs if parent.status != "completed")
+    # A key already taken (by an earlier submission, or a concurrent one that
+    # commits first) inserts nothing and returns no row instead of raising
+    db_job = (await db.execute(
+        pg_insert(Job).values(**job_data)
+        .on_conflict_do_nothing(index_elements=[Job.idempotency_key], index_where=Job.idempotency_key.isnot(None))
+        .returning(Job)
+    )).scalars().first()
+    if db_job is None:
+        await db.rollback()
+        existing = (await db.execute(select(Job).where(Job.idempotency_key == key))).scalars().one()
+        job_out_data = await job_out_from_db(existing, db)
+        recent_submissions.set(key, job_out_data)
+        return job_out_data
+
+    # A new job only ever depends on jobs that exist already, so its edges
+    # cannot close a cycle: nothing can depend on it yet.
+    for parent in parent_jobs:
+        db.add(JobDependency(dependant_id=db_job.id, depends_on_id=parent.id))
+    if parent_jobs:
+        await notify_job_dependencies_async(db, [db_job.id])
+    await notify_job_event_async(db, db_job.job_id, db_job.status, db_job.run_at)
+    await db.commit()
+    # every parent was found above, no need to query the edges back
+    job_out_data = job_out(db_job, depends_on)
+    if key is not None:
+        recent_submissions.set(key, job_out_data)
+    return job_out_data
+
+# POST /jobs/batch - Submit many jobs in one transaction
+async def create_jobs_batch(jobs: List[JobBatchItem], db: AsyncSession = Depends(get_db)):
+    if not jobs:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(jobs) > MAX_BATCH_JOBS:
+        raise HTTPException(status_code=400, detail=f"Batch has {len(jobs)} jobs, the limit is {MAX_BATCH_JOBS}")
+
+    # Resolve local references to item indexes and reject cycles before touching the database
+    refs = {}
+    for index, item in enumerate(jobs):
+        if item.ref is not None:
+            if item.ref in refs:
+                raise HTTPException(status_code=400, detail=f"Duplicate ref '{item.ref}'")
+            refs[item.ref] = index
+    local_parents = []
+    for item in jobs:
+        item_parents = []
+        for ref in dict.fromkeys(item.depends_on_refs or []):
+            if ref not in refs:
+                raise HTTPException(status_code=400, detail=f"Unknown ref '{ref}'")
+            item_parents.append(refs[ref])
+        local_parents.append(item_parents)
+    keys = [item.idempotency_key for item in jobs if item.idempotency_key is not None]
+    if len(keys) != len(set(keys)):
+        raise HTTPException(status_code=400, detail="Duplicate idempotency_key in batch")
+    # Items go into the graph in order: a reference to an earlier item costs
+    # nothing, only forward references search for a cycle.
+    graph = DependencyGraph()
+    for index in range(len(jobs)):
+        graph.add_node(index)
+    try:
+        graph.add_edges((parent, index) for index, item_parents in enumerate(local_parents) for parent in item_parents)
+    except CycleError as e:
+        refs_cycle = " -> ".join(jobs[index].ref for index in e.cycle)
+        raise HTTPException(status_code=400, detail=f"Dependency cycle between refs: {refs_cycle}")
+
+    # Batches are all or nothing: a key that is already used rejects the whole batch
+    if keys:
+        taken = (await db.execute(select(Job.idempotency_key).where(Job.idempotency_key.in_(keys)))).scalars().all()
+        if taken:
+            raise HTTPException(status_code=409, detail=f"idempotency_key already used: {taken[:10]}")
+
+    # Existing parents, locked for the same reason as in create_job
+    external = list(dict.fromkeys(dep_uuid for item in jobs for dep_uuid in item.depends_on or []))
+    parent_jobs = {}
+    for start in range(0, len(external), 10000): # bind parameter limit
+        result = await db.execute(
+            select(Job.id, Job.job_id, Job.status)
+            .where(Job.job_id.in_(external[start:start + 10000]))
+            .with_for_update(read=True)
+        )
+        parent_jobs.update({parent.job_id: parent for parent in result})
+    for dep_uuid in external:
+        if dep_uuid not in parent_jobs:
+            await db.rollback()
+            raise HTTPException(status_code=400, detail=f"Dependency job {dep_uuid} not found")
+
+    ids = await reserve_ids(db, Job.__tablename__, len(jobs))
+    rows = []
+    for job_pk, item, item_parents in zip(ids, jobs, local_parents):
+        row = job_row(item)
+        row["id"] = job_pk
+        row["status"] = "waiting"
+        item_external = [parent_jobs[dep_uuid] for dep_uuid in dict.fromkeys(item.depends_on or [])]
+        row["unmet_dependencies"] = len(item_parents) + sum(1 for parent in item_external if parent.status != "completed")
+        rows.append(row)
+
+    try:
+        await copy_rows(db, Job, rows)
+    except IntegrityError:
+        # a key taken by a concurrent submission since the check above
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="idempotency_key already used")
+
+    edges = []
+    for index, (item, item_parents) in enumerate(zip(jobs, local_parents)):
+        for parent in item_parents:
+            edges.append({"dependant_id": ids[index], "depends_on_id": ids[parent],
+                          "dependant_uuid": rows[index]["job_id"], "depends_on_uuid": rows[parent]["job_id"]})
+        for dep_uuid in dict.fromkeys(item.depends_on or []):
+            edges.append({"dependant_id": ids[index], "depends_on_id": parent_jobs[dep_uuid].id,
+                          "dependant_uuid": rows[index]["job_id"], "depends_on_uuid": dep_uuid})
+    await copy_rows(db, JobDependency, edges)
+    await notify_job_dependencies_async(db, [ids[index] for index, item in enumerate(jobs)
+                                             if local_parents[index] or item.depends_on])
+
+    # one event wakes the scheduler up for the whole batch
+    await notify_job_event_async(db, rows[0]["job_id"], "waiting", min(row["run_at"] for row in rows))
+    await db.commit()
+    return JobBatchOut(job_ids=[row["job_id"] for row in rows])
 
 # GET /jobs/{job_id} - Get job status and details
-def get_job(job_id: UUID, db: Session = Depends(get_db)):
-    job = db.query(Job).filter(Job.job_id == job_id,  True).first()
-    if not job:
+async def get_job(job_id: UUID, db: AsyncSession = Depends(get_db)):
+    async def load():
+        job = (await db.execute(select(Job).where(Job.job_id == job_id))).scalars().first()
+        return job and await job_out_from_db(job, db)
+
+    # a hit does not touch the database (the session never checks out a connection)
+    body = await job_cache.get(job_id, load)
+    if body is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    return job_out_from_db(job, db)
+    return Response(content=body, media_type="application/json")
+
+# Cursors are opaque to clients: the (created_time, id) of the last job of a
+# page, base64 encoded. Each page starts right after it through an index on
+# (filters..., created_time, id), so page 10,000 costs the same as page 1.
+def encode_cursor(job):
+    key = json.dumps([job.created_time.isoformat(), job.id])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_time, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_time), int(job_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 # GET /jobs - List jobs with filtering
-def list_jobs(status: Optional[str], priority: Optional[str], skip: int, limit: int, db: Session = Depends(get_db)):
-    query = db.query(Job)
+async def list_jobs(status: Optional[str], priority: Optional[str], cursor: Optional[str], limit: int, db: AsyncSession = Depends(get_db)):
+    query = select(Job)
     if status:
-        query = query.filter(Job.status == status)
+        query = query.where(Job.status == status)
     if priority:
-        query = query.filter(Job.priority == priority)
-    jobs = query.offset(skip).limit(limit).all()
-    return [job_out_from_db(job, db) for job in jobs]
+        query = query.where(Job.priority == priority)
+    if cursor:
+        query = query.where(tuple_(Job.created_time, Job.id) > decode_cursor(cursor))
+    # one extra row tells whether there is a next page
+    jobs = (await db.execute(query.order_by(Job.created_time, Job.id).limit(limit + 1))).scalars().all()
+    next_cursor = encode_cursor(jobs[limit - 1]) if len(jobs) > limit else None
+    return JobPage(items=await jobs_out_from_db(jobs[:limit], db), next_cursor=next_cursor)
+
+def dependants_query(job_pk: int):
+    # one child is enough, answered from ix_job_dependencies_depends_on_id alone
+    return select(JobDependency.dependant_id).where(JobDependency.depends_on_id == job_pk).limit(1)
+
+def job_logs_query(job_pk: int):
+    # ix_execution_logs_job_id_log_timestamp returns them in order
+    return select(ExecutionLog).where(ExecutionLog.job_id == job_pk).order_by(ExecutionLog.log_timestamp)
 
 # PATCH /jobs/{job_id}/cancel - Cancel a job if possible
-def cancel_job(job_id: UUID, db: Session = Depends(get_db)):
-    job = db.query(Job).filter(Job.job_id == job_id).first()
+async def cancel_job(job_id: UUID, db: AsyncSession = Depends(get_db)):
+    job = (await db.execute(select(Job).where(Job.job_id == job_id))).scalars().first()
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     # Check if any jobs depend on this job
-    dependants = db.query(JobDependency).filter(JobDependency.depends_on_id == job.id).all()
-    if dependants:
+    dependant = await db.execute(dependants_query(job.id))
+    if dependant.first():
         raise HTTPException(status_code=400, detail="Cannot cancel: other jobs depend on this job.")
     if job.status in ("completed", "cancelled"):
         raise HTTPException(status_code=400, detail="Job cannot be cancelled")
     job.status = "cancelled"
-    db.commit()
-    db.refresh(job)
-    return job_out_from_db(job, db)
+    await notify_job_event_async(db, job.job_id, job.status)
+    await db.commit()
+    job_cache.invalidate(job.job_id) # don't wait for our own notification
+    return await job_out_from_db(job, db)
 
 # GET /jobs/{job_id}/logs - Get job execution logs
-def get_job_logs(job_id: UUID, db: Session = Depends(get_db)):
-    job = db.query(Job).filter(Job.job_id == job_id).first()
+async def get_job_logs(job_id: UUID, db: AsyncSession = Depends(get_db)):
+    job = (await db.execute(select(Job).where(Job.job_id == job_id))).scalars().first()
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
-    logs = db.query(ExecutionLog).filter(ExecutionLog.job_id == job.id).all()
+    logs = (await db.execute(job_logs_query(job.id))).scalars().all()
     job_resource_requirements = {"cpu_units": job.cpu_units, "memory_mb": job.memory_mb}
     job_logs = []
     for log in logs:
@@ -87,38 +274,93 @@ def get_job_logs(job_id: UUID, db: Session = Depends(get_db)):
     return job_logs
 
 # WS /jobs/stream - WebSocket for real-time updates (basic example)
-async def job_stream(websocket: WebSocket, db: Session = Depends(get_db)):
-    await websocket.accept()
-    _db = next(get_db())
-    last_log_id = None
+def stream_filter(websocket: WebSocket, name: str):
+    # ?job_id=a&job_id=b or ?job_id=a,b, None when the parameter is absent
+    values = [value for param in websocket.query_params.getlist(name) for value in param.split(",") if value]
+    return values or None
+
+async def job_stream(websocket: WebSocket):
+    # Events come from the process wide hub, the database is not polled.
+    # Optional filters: job_id, status, type (several values each), and
+    # since=<seq> to resume after the last event received.
+    job_ids = stream_filter(websocket, "job_id")
+    since = websocket.query_params.get("since")
     try:
-        while True:
-            # Fetch the latest execution logs
-            query = _db.query(ExecutionLog)
-            if last_log_id is not None:
-                query = query.filter(ExecutionLog.id > last_log_id)
-            logs = query.order_by(ExecutionLog.id).all()
-            if logs:
-                for log in logs:
-                    await websocket.send_json(ExecutionLogOut.model_validate(log).model_dump())
-                last_log_id = logs[-1].id
-            await asyncio.sleep(2)  # Poll every 2 seconds
-    except WebSocketDisconnect:
-        pass
-
-def job_out_from_db(job, db):
-    dependencies = db.query(JobDependency).filter(JobDependency.dependant_id == job.id).all()
-    depends_on_uuids = []
-    for dep in dependencies:
-        dep_job = db.query(Job).filter(Job.id == dep.depends_on_id).first()
-        if dep_job:
-            depends_on_uuids.append(dep_job.job_id)
-    resource_requirements = ResourceRequirements(cpu_units=job.cpu_units, memory_mb=job.memory_mb)
-    retry_config = RetryConfig(max_attempts=job.max_attempts, backoff_multiplier=job.backoff_multiplier, initial_delay_seconds=job.initial_delay)
-    job_data = job.__dict__.copy()
-    job_data["resource_requirements"] = resource_requirements
-    job_data["retry_config"] = retry_config
-    job_data["priority"] = PriorityEnum[job.priority]
-    job_out = JobOut.model_validate(job_data)
-    job_out.depends_on = depends_on_uuids
-    return job_out
+        job_ids = None if job_ids is None else [str(UUID(job_id)) for job_id in job_ids]
+        since = None if since is None else int(since)
+    except ValueError:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid job_id or since")
+        return
+    # subscribed before the replay, so nothing published meanwhile is missed
+    subscription = stream_hub.subscribe(job_ids, stream_filter(websocket, "status"), stream_filter(websocket, "type"))
+    try:
+        await websocket.accept()
+
+        async def forward():
+            last_seq = -1
+            if since is not None:
+                async for event in stream_hub.replay(subscription, since):
+                    await websocket.send_json(event)
+                    last_seq = event["seq"]
+            while True:
+                event = await subscription.queue.get()
+                if event["seq"] > last_seq: # not replayed already
+                    await websocket.send_json(event)
+
+        async def until_disconnect():
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+
+        # a client that goes away while no event is coming is noticed by the receive side
+        tasks = [asyncio.ensure_future(forward()), asyncio.ensure_future(until_disconnect())]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            if not task.cancelled() and isinstance(task.exception(), Exception) \
+                    and not isinstance(task.exception(), (WebSocketDisconnect, RuntimeError)):
+                print(f"Job stream error: {task.exception()}")
+    finally:
+        stream_hub.unsubscribe(subscription)
+        if subscription.dropped:
+            print(f"Job stream client dropped {subscription.dropped} events (too slow)")
+
+async def dependency_uuids(db, job_ids):
+    # UUIDs of the parents of every job in job_ids, in one query: {job.id: [parent uuid, ...]}
+    depends_on = {job_id: [] for job_id in job_ids}
+    if not job_ids:
+        return depends_on
+    rows = await db.execute(
+        select(JobDependency.dependant_id, Job.job_id)
+        .join(Job, Job.id == JobDependency.depends_on_id)
+        .where(JobDependency.dependant_id.in_(job_ids))
+        .order_by(JobDependency.dependant_id, JobDependency.id)
+    )
+    for dependant_id, parent_uuid in rows:
+        depends_on[dependant_id].append(parent_uuid)
+    return depends_on
+
+def job_out(job, depends_on_uuids):
+    return JobOut(
+        job_id=job.job_id,
+        job_name=job.job_name,
+        type=job.type,
+        payload=job.payload,
+        status=job.status,
+        priority=PriorityEnum[job.priority],
+        times_attempted=job.times_attempted,
+        run_at=job.run_at,
+        timeout=job.timeout,
+        idempotency_key=job.idempotency_key,
+        results=job.results,
+        resource_requirements=ResourceRequirements(cpu_units=job.cpu_units, memory_mb=job.memory_mb),
+        retry_config=RetryConfig(max_attempts=job.max_attempts, backoff_multiplier=job.backoff_multiplier, initial_delay_seconds=job.initial_delay),
+        depends_on=depends_on_uuids,
+    )
+
+async def jobs_out_from_db(jobs, db):
+    depends_on = await dependency_uuids(db, [job.id for job in jobs])
+    return [job_out(job, depends_on[job.id]) for job in jobs]
+
+async def job_out_from_db(job, db):
+    return (await jobs_out_from_db([job], db))[0]
@@ -0,0 +1,113 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# In-process caches for the API.
+#
+# Each API process has its own, the database stays the source of truth: a
+# miss (or another process) falls back to it. The API runs on one event loop,
+# so there is no locking.
+
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key not in self.entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False) # least recently used
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class TTLCache(LRUCache):
+    # LRU cache whose entries also expire, each one after its own ttl (seconds)
+    def __init__(self, maxsize: int, clock=time.monotonic):
+        super().__init__(maxsize)
+        self.clock = clock
+        self.expired = 0
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is not None and entry[1] <= self.clock():
+            del self.entries[key]
+            self.expired += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, value, ttl: float):
+        if ttl > 0:
+            super().set(key, (value, self.clock() + ttl))
+
+    def stats(self) -> dict:
+        return dict(super().stats(), expired=self.expired)
+
+
+# Shared backends: one cache for every API process, behind the local one.
+# Values are bytes. MemorySharedCache is the stand-in used when no shared
+# store is configured (and in tests), RedisSharedCache needs the redis package.
+
+class MemorySharedCache:
+    def __init__(self, maxsize: int = 100000):
+        self.cache = TTLCache(maxsize)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self.cache.set(key, value, ttl)
+
+    async def delete(self, key: str):
+        self.cache.delete(key)
+
+
+class RedisSharedCache:
+    def __init__(self, url: str, prefix: str = "smart_queue:"):
+        import redis.asyncio # optional dependency, only needed with a Redis URL
+        self.redis = redis.asyncio.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.redis.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.redis.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str):
+        await self.redis.delete(self.prefix + key)
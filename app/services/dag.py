@@ -0,0 +1,211 @@
+import heapq
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+# In-memory job dependency graph: cycle detection and critical paths.
+#
+# Nodes are job primary keys, an edge (parent, child) means child depends on
+# parent. The graph keeps a topological order of its nodes (ord: parents
+# before children) and maintains it edge by edge with the Pearce-Kelly
+# algorithm: an edge that already agrees with the order costs O(1), which is
+# every edge of a job submitted after the jobs it depends on. Otherwise only
+# the nodes between the two ends of the edge in the order are searched, and a
+# child that reaches its new parent is a cycle.
+#
+# critical_path(job) is the length of the longest chain of jobs that depend on
+# it, directly or not (0 for a job nothing depends on). A job with a long
+# chain behind it holds up more of its workflow, the scheduler starts it first
+# among jobs of the same priority. Adding edges can only lengthen the chains
+# of the parents and their ancestors; the increase is pushed up, children
+# before parents, until it stops. That is the part that costs more than O(1):
+# a job added at the end of a chain lengthens the whole chain, add_edges()
+# pushes the increases of a whole batch of edges up in one pass.
+# Removing a node leaves its ancestors' values as they were: an upper bound.
+
+
+class CycleError(ValueError):
+    def __init__(self, cycle: List[int]):
+        # cycle: parent, child, ..., parent
+        super().__init__(f"Dependency cycle: {' -> '.join(str(node) for node in cycle)}")
+        self.cycle = cycle
+
+
+class DependencyGraph:
+    def __init__(self):
+        self.parents = defaultdict(set)
+        self.children = defaultdict(set)
+        self.ord: Dict[int, int] = {}
+        self.next_ord = 0
+        self.path: Dict[int, int] = {}   # critical path length of every node
+        self.changed = set()             # nodes whose critical path grew since take_changed()
+
+    def __len__(self):
+        return len(self.ord)
+
+    def __contains__(self, node):
+        return node in self.ord
+
+    @classmethod
+    def load(cls, edges: Iterable[Tuple[int, int]]) -> "DependencyGraph":
+        # Whole graph at once, in O(nodes + edges): Kahn's topological sort,
+        # then critical paths from the last node back. Raises CycleError.
+        graph = cls()
+        for parent, child in edges:
+            graph.parents[child].add(parent)
+            graph.children[parent].add(child)
+        nodes = set(graph.parents) | set(graph.children)
+        unmet = {node: len(graph.parents.get(node, ())) for node in nodes}
+        ready = [node for node, count in unmet.items() if count == 0]
+        order = []
+        while ready:
+            node = ready.pop()
+            order.append(node)
+            for child in graph.children.get(node, ()):
+                unmet[child] -= 1
+                if unmet[child] == 0:
+                    ready.append(child)
+        if len(order) < len(nodes):
+            blocked = {node for node, count in unmet.items() if count > 0}
+            raise CycleError(graph.find_cycle(blocked))
+        graph.ord = {node: index for index, node in enumerate(order)}
+        graph.next_ord = len(order)
+        for node in reversed(order):
+            graph.path[node] = max((graph.path[child] + 1 for child in graph.children.get(node, ())), default=0)
+        graph.changed = {node for node, length in graph.path.items() if length}
+        return graph
+
+    def find_cycle(self, nodes) -> List[int]:
+        # a cycle among nodes that Kahn's sort could not order: every one of
+        # them has a parent among them, walk parents until a node repeats
+        node = next(iter(nodes))
+        seen = {}
+        walk = []
+        while node not in seen:
+            seen[node] = len(walk)
+            walk.append(node)
+            node = next(parent for parent in self.parents[node] if parent in nodes)
+        cycle = walk[seen[node]:] + [node]
+        return cycle[::-1]
+
+    def add_node(self, node: int):
+        if node not in self.ord:
+            self.ord[node] = self.next_ord
+            self.next_ord += 1
+            self.path[node] = 0
+
+    def add_edge(self, parent: int, child: int):
+        # Raises CycleError, the graph is then left as it was.
+        self.add_edges([(parent, child)])
+
+    def add_edges(self, edges: Iterable[Tuple[int, int]], skip_cycles: bool = False) -> List[CycleError]:
+        # Raises CycleError on the first edge that closes a cycle (the edges
+        # before it are kept), or with skip_cycles leaves those edges out and
+        # returns their errors.
+        lengths = {}
+        skipped = []
+        try:
+            for parent, child in edges:
+                try:
+                    self.insert(parent, child)
+                except CycleError as e:
+                    if not skip_cycles:
+                        raise
+                    skipped.append(e)
+                    continue
+                lengths[parent] = max(lengths.get(parent, 0), self.path[child] + 1)
+        finally:
+            self.lengthen(lengths)
+        return skipped
+
+    def insert(self, parent: int, child: int):
+        if parent == child:
+            raise CycleError([parent, parent])
+        self.add_node(parent)
+        self.add_node(child)
+        if child in self.children[parent]:
+            return
+        lower, upper = self.ord[child], self.ord[parent]
+        if lower < upper:
+            # the child comes first in the order: move what it leads to after
+            # what leads to the parent, within the [lower, upper] window
+            forward = self.reachable(child, upper, parent)
+            backward = self.reaching(parent, lower)
+            self.reorder(backward, forward)
+        self.children[parent].add(child)
+        self.parents[child].add(parent)
+
+    def reachable(self, child: int, upper: int, parent: int) -> List[int]:
+        # nodes reachable from child with an ord up to upper, CycleError if parent is one of them
+        found = {child: None}
+        stack = [child]
+        while stack:
+            node = stack.pop()
+            for next_node in self.children.get(node, ()):
+                if next_node == parent:
+                    cycle = [parent, child]
+                    trail = []
+                    while node != child:
+                        trail.append(node)
+                        node = found[node]
+                    raise CycleError(cycle + trail[::-1] + [parent])
+                if next_node not in found and self.ord[next_node] < upper:
+                    found[next_node] = node
+                    stack.append(next_node)
+        return list(found)
+
+    def reaching(self, parent: int, lower: int) -> List[int]:
+        # nodes that reach parent with an ord from lower up
+        found = {parent}
+        stack = [parent]
+        while stack:
+            node = stack.pop()
+            for previous in self.parents.get(node, ()):
+                if previous not in found and self.ord[previous] > lower:
+                    found.add(previous)
+                    stack.append(previous)
+        return list(found)
+
+    def reorder(self, backward: List[int], forward: List[int]):
+        # the same ord values, handed out to backward first then forward
+        backward.sort(key=self.ord.__getitem__)
+        forward.sort(key=self.ord.__getitem__)
+        nodes = backward + forward
+        for node, position in zip(nodes, sorted(self.ord[node] for node in nodes)):
+            self.ord[node] = position
+
+    def lengthen(self, lengths: Dict[int, int]):
+        # lengths: node -> a chain length it has now. Nodes are settled last in
+        # the order first, so each one is updated once with its final length.
+        pending = {node: length for node, length in lengths.items() if length > self.path[node]}
+        heap = [(-self.ord[node], node) for node in pending]
+        heapq.heapify(heap)
+        while heap:
+            _, node = heapq.heappop(heap)
+            length = pending.pop(node)
+            self.path[node] = length
+            self.changed.add(node)
+            for parent in self.parents.get(node, ()):
+                if length + 1 > pending.get(parent, self.path[parent]):
+                    if parent not in pending:
+                        heapq.heappush(heap, (-self.ord[parent], parent))
+                    pending[parent] = length + 1
+
+    def remove_node(self, node: int):
+        if node not in self.ord:
+            return
+        for child in self.children.pop(node, ()):
+            self.parents[child].discard(node)
+        for parent in self.parents.pop(node, ()):
+            self.children[parent].discard(node)
+        del self.ord[node]
+        del self.path[node]
+        self.changed.discard(node)
+
+    def critical_path(self, node: int) -> int:
+        return self.path.get(node, 0)
+
+    def take_changed(self) -> Dict[int, int]:
+        # critical paths that grew since the last call, to be written back to the jobs
+        changed = {node: self.path[node] for node in self.changed}
+        self.changed = set()
+        return changed
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Optional
+
+import asyncpg
+
+from database import DATABASE_URL
+from schemas.job_schemas import JobOut
+from services.cache import LRUCache, MemorySharedCache, RedisSharedCache, TTLCache
+from services.job_events import JOB_CHANGES_CHANNEL, JOB_EVENTS_CHANNEL
+
+# Read-through cache of GET /jobs/{job_id} responses.
+#
+# Entries are the serialized JobOut, sent as is. A job still in flight is kept
+# for JOB_CACHE_TTL_SECONDS, a completed, cancelled or failed one (which almost
+# never changes again) for JOB_CACHE_TERMINAL_TTL_SECONDS.
+#
+# Every status, results or times_attempted change is followed by a NOTIFY on
+# job_events or job_changes (services/job_events.py). Each API process LISTENs
+# on both and drops the jobs named there, so the TTLs only bound how stale an
+# entry can get when a notification is lost. Nothing is cached while the
+# listener is down, and the local cache is cleared when it reconnects.
+#
+# JOB_CACHE_SHARED_URL adds a second level shared by the API processes:
+# redis://... for Redis, memory:// for the in-process stand-in (one process,
+# for development and tests).
+
+JOB_CACHE_SIZE = int(os.getenv("JOB_CACHE_SIZE", 10000))                            # 0 disables the cache
+JOB_CACHE_TTL_SECONDS = float(os.getenv("JOB_CACHE_TTL_SECONDS", 5))
+JOB_CACHE_TERMINAL_TTL_SECONDS = float(os.getenv("JOB_CACHE_TERMINAL_TTL_SECONDS", 300))
+JOB_CACHE_SHARED_URL = os.getenv("JOB_CACHE_SHARED_URL")
+LISTEN_RECONNECT_SECONDS = float(os.getenv("JOB_CACHE_RECONNECT_SECONDS", 5))
+
+TERMINAL_STATUSES = ("completed", "cancelled", "failed")
+
+
+class JobCache:
+    def __init__(self, maxsize: int = JOB_CACHE_SIZE, ttl: float = JOB_CACHE_TTL_SECONDS,
+                 terminal_ttl: float = JOB_CACHE_TERMINAL_TTL_SECONDS, shared=None, dsn: str = DATABASE_URL):
+        self.local = TTLCache(maxsize)
+        self.shared = shared
+        self.ttl = ttl
+        self.terminal_ttl = terminal_ttl
+        self.dsn = dsn
+        # Invalidations are numbered. A response loaded from the database is
+        # only stored if its job was not invalidated while it was being read.
+        self.version = 0
+        self.changed = LRUCache(max(maxsize, 10000)) # job_id -> version of its last invalidation
+        self.cleared = 0                            # version of the last clear
+        self.invalidations = 0
+        self.deleting = set()
+        self.shared_hits = 0
+        self.loads = 0
+        self.listening = False
+        self.listener = None
+
+    async def get(self, job_id, load: Callable[[], Awaitable[Optional[JobOut]]]) -> Optional[bytes]:
+        # the serialized job, from the cache or from load(). None: no such job
+        if self.local.maxsize <= 0:
+            job = await load()
+            return None if job is None else job.model_dump_json().encode()
+        self.start()
+        key = str(job_id)
+        body = self.local.get(key)
+        if body is not None:
+            return body
+        if self.shared is not None and key not in self.deleting:
+            body = await self.shared.get(key)
+            if body is not None:
+                self.shared_hits += 1
+                self.local.set(key, body, self.ttl)
+                return body
+
+        started = self.version
+        self.loads += 1
+        job = await load()
+        if job is None:
+            return None # not cached, the job may be created any moment
+        body = job.model_dump_json().encode()
+        if self.listening and self.cleared <= started and self.changed.entries.get(key, 0) <= started:
+            ttl = self.terminal_ttl if job.status in TERMINAL_STATUSES else self.ttl
+            self.local.set(key, body, ttl)
+            if self.shared is not None:
+                await self.shared.set(key, body, ttl)
+        return body
+
+    def invalidate(self, job_id):
+        key = str(job_id)
+        self.version += 1
+        self.invalidations += 1
+        self.changed.set(key, self.version)
+        self.local.delete(key)
+        if self.shared is not None:
+            # the shared entry is not read again until it is gone
+            self.deleting.add(key)
+            asyncio.ensure_future(self.delete_shared(key))
+
+    async def delete_shared(self, key: str):
+        try:
+            await self.shared.delete(key)
+        except Exception as e:
+            print(f"Job cache cannot delete {key} from the shared cache: {e}")
+        finally:
+            self.deleting.discard(key)
+
+    def clear(self):
+        self.version += 1
+        self.cleared = self.version
+        self.local.clear()
+
+    def on_notify(self, connection, pid, channel, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        for job_id in event.get("job_ids") or [event.get("job_id")]:
+            if job_id:
+                self.invalidate(job_id)
+
+    async def listen(self):
+        while True:
+            try:
+                connection = await asyncpg.connect(self.dsn.replace("postgresql+asyncpg://", "postgresql://"))
+            except Exception as e:
+                print(f"Job cache listener cannot connect: {e}")
+                await asyncio.sleep(LISTEN_RECONNECT_SECONDS)
+                continue
+            closed = asyncio.Event()
+            try:
+                connection.add_termination_listener(lambda connection: closed.set())
+                await connection.add_listener(JOB_EVENTS_CHANNEL, self.on_notify)
+                await connection.add_listener(JOB_CHANGES_CHANNEL, self.on_notify)
+                self.clear() # whatever changed while nobody was listening
+                self.listening = True
+                await closed.wait()
+                print("Job cache listener disconnected")
+            except Exception as e:
+                print(f"Job cache listener error: {e}")
+            finally:
+                self.listening = False
+                if not connection.is_closed():
+                    connection.terminate()
+            await asyncio.sleep(LISTEN_RECONNECT_SECONDS)
+
+    def start(self):
+        # the listener is started with the first request
+        if self.listener is None:
+            self.listener = asyncio.ensure_future(self.listen())
+
+    async def stop(self):
+        if self.listener is not None:
+            self.listener.cancel()
+            try:
+                await self.listener
+            except asyncio.CancelledError:
+                pass
+            self.listener = None
+        self.listening = False
+
+    def stats(self) -> dict:
+        return dict(self.local.stats(), shared_hits=self.shared_hits, loads=self.loads,
+                    invalidations=self.invalidations, listening=self.listening)
+
+
+def shared_cache(url: Optional[str]):
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemorySharedCache()
+    return RedisSharedCache(url)
+
+
+# the process wide cache
+job_cache = JobCache(shared=shared_cache(JOB_CACHE_SHARED_URL))
@@ -0,0 +1,61 @@
+from sqlalchemy import text
+import json
+
+# Postgres channel used to wake the scheduler up.
+# Every write that can make a job runnable (or stop it from running) sends a
+# NOTIFY on this channel; the scheduler LISTENs on it instead of sleeping.
+JOB_EVENTS_CHANNEL = "job_events"
+
+def job_event_statement(job_id, status, run_at=None):
+    payload = {"job_id": str(job_id), "status": status}
+    if run_at is not None:
+        payload["run_at"] = run_at.isoformat()
+    return text("SELECT pg_notify(:channel, :payload)").bindparams(
+        channel=JOB_EVENTS_CHANNEL, payload=json.dumps(payload)
+    )
+
+# pg_notify is transactional: the event is only delivered when the
+# surrounding transaction commits, and dropped if it rolls back.
+
+def notify_job_event(db, job_id, status, run_at=None):
+    db.execute(job_event_statement(job_id, status, run_at))
+
+async def notify_job_event_async(db, job_id, status, run_at=None):
+    await db.execute(job_event_statement(job_id, status, run_at))
+
+# Second channel for changes that cannot make anything runnable (a job claimed,
+# queued, made ready by the scheduler itself, archived). The scheduler does not
+# LISTEN on it; the API's job cache listens on both to drop stale entries.
+JOB_CHANGES_CHANNEL = "job_changes"
+# NOTIFY payloads are limited to 8000 bytes, a UUID takes 39 of them in the list
+JOB_CHANGES_PER_NOTIFY = 150
+
+def job_changes_statements(job_ids):
+    job_ids = [str(job_id) for job_id in job_ids]
+    for start in range(0, len(job_ids), JOB_CHANGES_PER_NOTIFY):
+        payload = {"job_ids": job_ids[start:start + JOB_CHANGES_PER_NOTIFY]}
+        yield text("SELECT pg_notify(:channel, :payload)").bindparams(
+            channel=JOB_CHANGES_CHANNEL, payload=json.dumps(payload)
+        )
+
+def notify_job_changes(db, job_ids):
+    for statement in job_changes_statements(job_ids):
+        db.execute(statement)
+
+# Third channel, for new dependency edges: the primary keys of the jobs that
+# were submitted with dependencies. The scheduler LISTENs on it to add their
+# edges to its dependency graph (services/dag.py).
+JOB_DEPENDENCIES_CHANNEL = "job_dependencies"
+JOB_DEPENDANTS_PER_NOTIFY = 500
+
+def job_dependencies_statements(job_pks):
+    job_pks = list(job_pks)
+    for start in range(0, len(job_pks), JOB_DEPENDANTS_PER_NOTIFY):
+        payload = {"job_ids": job_pks[start:start + JOB_DEPENDANTS_PER_NOTIFY]}
+        yield text("SELECT pg_notify(:channel, :payload)").bindparams(
+            channel=JOB_DEPENDENCIES_CHANNEL, payload=json.dumps(payload)
+        )
+
+async def notify_job_dependencies_async(db, job_pks):
+    for statement in job_dependencies_statements(job_pks):
+        await db.execute(statement)
@@ -0,0 +1,136 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, update, case, and_, func
+from typing import Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import os
+import random
+
+from app.models.models import Job, JobDependency
+from app.services.job_events import notify_job_event, notify_job_changes
+
+# Job state transitions shared by the scheduler and the workers.
+
+# A running job is leased to its worker (claimed_by / lease_expires_at, as the
+# scheduler's claims are) and the worker renews the leases of the jobs it is
+# running every RUN_LEASE_SECONDS / 3. A job whose worker died, or gave up on
+# it after a database error, stops being renewed and the scheduler hands it
+# back as a failed attempt (scheduler.release_expired_runs): redelivering its
+# message could not run it again, start_job only takes it once.
+RUN_LEASE_SECONDS = float(os.getenv("RUN_LEASE_SECONDS", 60))
+
+# claim a queued job for execution
+def start_job(db: Session, job_id, with_payload: bool = True, worker_id: Optional[str] = None):
+    # Only one delivery of a job can move it from queued to running, so a
+    # message delivered twice (redelivery, duplicate publish) runs once.
+    # A job still "claimed" is started too: the scheduler publishes before it
+    # marks the batch queued, and a worker can receive the message before that
+    # commits. The scheduler's finish_claim then leaves the running row alone.
+    # Returns the columns a worker needs (a Row, None for a duplicate): not
+    # the previous attempt's results, nor the payload unless asked for
+    # (with_payload=False: the caller has it already).
+    columns = [Job.id, Job.job_id, Job.type, Job.status, Job.timeout, Job.times_attempted, Job.cpu_units,
+               Job.memory_mb]
+    if with_payload:
+        columns.append(Job.payload)
+    job = db.execute(
+        update(Job)
+        .where(Job.job_id == job_id, Job.status.in_(("queued", "claimed")))
+        .values(status="running", times_attempted=func.coalesce(Job.times_attempted, 0) + 1,
+                claimed_by=worker_id, lease_expires_at=func.now() + timedelta(seconds=RUN_LEASE_SECONDS))
+        .returning(*columns)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if job is not None:
+        notify_job_event(db, job.job_id, job.status)
+    db.commit()
+    return job
+
+# extend the leases of the jobs a worker is running
+def renew_run_leases(db: Session, job_pks, worker_id: Optional[str]) -> int:
+    renewed = db.execute(
+        update(Job)
+        .where(Job.id.in_(job_pks), Job.status == "running", Job.claimed_by == worker_id)
+        .values(lease_expires_at=func.now() + timedelta(seconds=RUN_LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return renewed
+
+# mark a job completed and release its children
+def complete_job(db: Session, job: Job, results=None) -> bool:
+    # Only the completion of a running job counts, as for fail_job: a
+    # redelivered job cannot decrement its children twice, and a late result
+    # does not overwrite a job that was cancelled or failed meanwhile.
+    completed = db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == "running")
+        .values(status="completed", results=results, claimed_by=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    if completed:
+        # Decrement the unmet dependency counter on every child.
+        # A waiting child whose counter drops to zero becomes ready in the same transaction.
+        # Postgres evaluates the SET expressions against the old row, hence `== 1`.
+        children = select(JobDependency.dependant_id).where(JobDependency.depends_on_id == job.id)
+        children_status = db.execute(
+            update(Job)
+            .where(Job.id.in_(children))
+            .values(
+                unmet_dependencies=Job.unmet_dependencies - 1,
+                status=case(
+                    (and_(Job.unmet_dependencies == 1, Job.status == "waiting"), "ready"),
+                    else_=Job.status,
+                ),
+            )
+            .returning(Job.job_id, Job.status)
+            .execution_options(synchronize_session=False)
+        ).all()
+        # wake the scheduler, children may have become ready
+        notify_job_event(db, job.job_id, "completed")
+        notify_job_changes(db, [child_id for child_id, status in children_status if status == "ready"])
+
+    db.commit()
+    db.refresh(job)
+    return bool(completed)
+
+# Retry backoff: the n-th failed attempt waits initial_delay * backoff_multiplier^n
+# seconds, spread by +/- RETRY_JITTER so a failure storm doesn't come back as
+# one synchronized wave, and never less than RETRY_MIN_DELAY_SECONDS.
+RETRY_JITTER = float(os.getenv("RETRY_JITTER", 0.1))
+RETRY_MIN_DELAY_SECONDS = float(os.getenv("RETRY_MIN_DELAY_SECONDS", 1))
+
+def retry_delay_seconds(job: Job) -> float:
+    attempt = job.times_attempted or 1
+    delay = float(job.initial_delay or 0) * float(job.backoff_multiplier or 1) ** attempt
+    if RETRY_JITTER:
+        delay *= random.uniform(1 - RETRY_JITTER, 1 + RETRY_JITTER)
+    return max(delay, RETRY_MIN_DELAY_SECONDS)
+
+def after_failed_attempt(job) -> Tuple[str, Optional[datetime]]:
+    # (status, run_at) of a job whose attempt failed: retrying after the
+    # backoff while it has attempts left, failed (run_at unchanged) after that.
+    # job: a Job, or a row with the retry columns
+    if (job.times_attempted or 0) < (job.max_attempts or 1):
+        return "retrying", datetime.now(timezone.utc) + timedelta(seconds=retry_delay_seconds(job))
+    return "failed", job.run_at
+
+# record a failed attempt of a running job
+def fail_job(db: Session, job: Job, results=None) -> Optional[str]:
+    # Retries are not re-queued on the broker: the job goes back to the table as
+    # "retrying" with a future run_at. ix_jobs_ready_run_at keeps those rows in
+    # run_at order, so the scheduler neither sees them before they are due nor
+    # rescans them, and it wakes up for the nearest one (seconds_until_next_run).
+    status, run_at = after_failed_attempt(job)
+
+    updated = db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == "running")
+        .values(status=status, results=results, run_at=run_at, claimed_by=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if updated:
+        notify_job_event(db, job.job_id, status, run_at if status == "retrying" else None)
+    db.commit()
+    db.refresh(job)
+    return status if updated else None
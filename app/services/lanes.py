@@ -0,0 +1,115 @@
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+# Priority lanes: one dispatch queue per job priority instead of a single
+# x-max-priority queue, and a weighted fair choice between them in the worker.
+#
+# With one priority queue RabbitMQ always delivers the highest priority first,
+# so a steady stream of Critical jobs starves Low ones forever. With lanes,
+# each worker buffers what it received from every lane and, whenever a slot is
+# free, starts the head of the lane picked by LaneScheduler:
+#
+#   - every lane gets a share of the starts proportional to its weight while it
+#     has work (weighted fair queueing on virtual finish times), an idle lane
+#     gives its share to the others and gets no credit for the time it was idle
+#   - aging: the weight of a lane grows with the wait of its oldest job,
+#     doubled after AGING_SECONDS, tripled after twice that... so an old Low
+#     job overtakes fresh Critical ones instead of waiting for a lull.
+#
+# "priority": one job_dispatch_queue with AMQP priorities (the default)
+# "lanes": job_dispatch_queue.lane.<priority>, scheduler and workers must agree
+DISPATCH_QUEUES = os.getenv("DISPATCH_QUEUES", "priority")
+
+LANES = ("Critical", "High", "Normal", "Low")
+DEFAULT_LANE = "Normal"
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    # "Critical=8,High=4,Normal=2,Low=1"
+    weights = {}
+    for item in value.split(","):
+        lane, _, weight = item.partition("=")
+        lane = lane.strip()
+        if lane not in LANES or float(weight) <= 0:
+            raise ValueError(f"Invalid lane weight {item!r}")
+        weights[lane] = float(weight)
+    return {lane: weights.get(lane, 1.0) for lane in LANES}
+
+
+LANE_WEIGHTS = parse_weights(os.getenv("DISPATCH_LANE_WEIGHTS", "Critical=8,High=4,Normal=2,Low=1"))
+AGING_SECONDS = float(os.getenv("DISPATCH_LANE_AGING_SECONDS", 30)) # 0 disables aging
+# recent waits kept per lane for the percentiles in the worker heartbeat
+WAIT_WINDOW = 1000
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class LaneScheduler:
+    def __init__(self, weights: Dict[str, float] = None, aging_seconds: float = AGING_SECONDS,
+                 clock=time.time, window: int = WAIT_WINDOW):
+        self.weights = dict(weights or LANE_WEIGHTS)
+        self.aging_seconds = aging_seconds
+        self.clock = clock
+        self.queues = {lane: deque() for lane in self.weights}  # (queued_at, item)
+        self.finish = {lane: 0.0 for lane in self.weights}      # virtual finish time of the lane's last start
+        self.virtual_time = 0.0
+        self.waits = {lane: deque(maxlen=window) for lane in self.weights}
+        self.started = {lane: 0 for lane in self.weights}
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def push(self, lane: Optional[str], item, queued_at: Optional[float] = None):
+        # queued_at: when the job entered the lane (the scheduler's publish time), now if unknown
+        if lane not in self.queues:
+            lane = DEFAULT_LANE
+        queue = self.queues[lane]
+        if not queue:
+            self.finish[lane] = max(self.finish[lane], self.virtual_time)
+        queue.append((self.clock() if queued_at is None else queued_at, item))
+
+    def effective_weight(self, lane: str, now: float) -> float:
+        weight = self.weights[lane]
+        if self.aging_seconds > 0:
+            weight *= 1 + max(0.0, now - self.queues[lane][0][0]) / self.aging_seconds
+        return weight
+
+    def pop(self):
+        # (lane, item) of the job to start next, None when every lane is empty
+        now = self.clock()
+        best, best_finish = None, None
+        for lane, queue in self.queues.items():
+            if not queue:
+                continue
+            finish = self.finish[lane] + 1 / self.effective_weight(lane, now)
+            if best is None or finish < best_finish:
+                best, best_finish = lane, finish
+        if best is None:
+            return None
+        queued_at, item = self.queues[best].popleft()
+        self.finish[best] = self.virtual_time = best_finish
+        self.waits[best].append(max(0.0, now - queued_at))
+        self.started[best] += 1
+        return best, item
+
+    def stats(self) -> dict:
+        # per lane: jobs waiting here, jobs started, queue wait (publish -> start) of the recent ones
+        now = self.clock()
+        return {
+            lane: {
+                "waiting": len(self.queues[lane]),
+                "oldest_seconds": now - self.queues[lane][0][0] if self.queues[lane] else 0.0,
+                "started": self.started[lane],
+                "wait_p50_seconds": percentile(self.waits[lane], 50),
+                "wait_p99_seconds": percentile(self.waits[lane], 99),
+                "wait_max_seconds": max(self.waits[lane], default=0.0),
+            }
+            for lane in self.queues
+        }
@@ -0,0 +1,208 @@
+import os
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import pika
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.database import SessionLocal
+from app.models.models import ExecutionLog
+from app.services.rabbitmq_client import RabbitMQClient, decode_message
+
+# Log writer service: drains job_logs_db_queue and stores ExecutionLog rows.
+#
+# Workers publish one message per job attempt instead of writing to Postgres.
+# Messages are grouped into batches (LOG_WRITER_BATCH_SIZE rows or
+# LOG_WRITER_FLUSH_SECONDS, whichever comes first), each batch is written with
+# one multi-row INSERT, and the messages are acked only after the commit.
+# Committed rows are then republished, with their id, on
+# job_logs_stream_exchange for the API's live stream (GET /jobs/stream).
+
+BATCH_SIZE = int(os.getenv("LOG_WRITER_BATCH_SIZE", 500))
+FLUSH_SECONDS = float(os.getenv("LOG_WRITER_FLUSH_SECONDS", 1))
+
+# The stream's sequence numbers are execution_logs ids, which are taken at
+# INSERT, not at commit: two log writers could commit and publish their
+# batches out of id order, and a client resuming after id N would never be
+# sent a smaller id committed later. A writer holds this advisory lock from
+# its INSERT until its events are published, so ids are committed and
+# streamed in order. Flushes are a few ms each, several writers still overlap
+# everything else (consuming, decoding, acking).
+STREAM_ORDER_LOCK = 4213901
+
+LOG_COLUMNS = {column.name for column in ExecutionLog.__table__.columns} - {"id"}
+DATETIME_COLUMNS = ("log_timestamp", "execution_start_time", "execution_end_time")
+
+
+def log_row(message: dict) -> dict:
+    # keep only the ExecutionLog columns, extra keys are for other consumers
+    row = {key: value for key, value in message.items() if key in LOG_COLUMNS}
+    for column in DATETIME_COLUMNS:
+        if row.get(column):
+            row[column] = datetime.fromisoformat(row[column])
+    return row
+
+
+class LogBatchWriter:
+    def __init__(self, session_factory=SessionLocal, batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS,
+                 event_sink=None):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        # callable given the messages of the committed rows, each with its "id"
+        self.event_sink = event_sink
+        self.rows: List[dict] = []
+        self.messages: List[dict] = []
+        self.last_tag = None
+        self.oldest_at = None
+
+    def add(self, delivery_tag, message: dict) -> bool:
+        # buffer one message, returns True when the batch should be flushed
+        if not self.rows:
+            self.oldest_at = time.monotonic()
+        self.rows.append(log_row(message))
+        self.messages.append(message)
+        self.last_tag = delivery_tag
+        return len(self.rows) >= self.batch_size
+
+    def due(self) -> bool:
+        return bool(self.rows) and time.monotonic() - self.oldest_at >= self.flush_seconds
+
+    def flush(self) -> Optional[int]:
+        # Write the buffered rows in one transaction. Returns the delivery tag
+        # to ack (covering the whole batch), or raises and keeps the buffer.
+        if not self.rows:
+            return None
+        db = self.session_factory()
+        # held on a connection of its own: it has to outlive the commit
+        lock = db.get_bind().connect()
+        try:
+            lock.execute(select(func.pg_advisory_lock(STREAM_ORDER_LOCK)))
+            lock.commit()
+            try:
+                written = self.write(db)
+            finally:
+                db.close()
+            last_tag = self.discard()
+            if self.event_sink and written:
+                self.event_sink(written)
+            return last_tag
+        finally:
+            lock.execute(select(func.pg_advisory_unlock(STREAM_ORDER_LOCK)))
+            lock.commit()
+            lock.close()
+
+    def write(self, db) -> List[dict]:
+        try:
+            # executemany of a single INSERT is sent as multi-row VALUES batches,
+            # RETURNING gives the ids back in the order of the rows
+            ids = db.execute(
+                insert(ExecutionLog).returning(ExecutionLog.id, sort_by_parameter_order=True), self.rows
+            ).scalars().all()
+            db.commit()
+            return [dict(message, id=id) for message, id in zip(self.messages, ids)]
+        except (IntegrityError, DataError) as e:
+            # a bad row (job deleted meanwhile, malformed value...) must not
+            # block the whole batch forever: write row by row, drop the bad ones
+            db.rollback()
+            print(f"Log batch rejected ({e.__class__.__name__}), writing rows one by one")
+            return self.write_rows_individually(db)
+        except Exception:
+            db.rollback()
+            raise
+
+    def write_rows_individually(self, db) -> List[dict]:
+        written = []
+        for row, message in zip(self.rows, self.messages):
+            try:
+                with db.begin_nested():
+                    id = db.execute(insert(ExecutionLog).returning(ExecutionLog.id), [row]).scalar_one()
+                written.append(dict(message, id=id))
+            except (IntegrityError, DataError):
+                pass
+        db.commit()
+        if len(written) < len(self.rows):
+            print(f"Dropped {len(self.rows) - len(written)} invalid log rows")
+        return written
+
+    def discard(self) -> Optional[int]:
+        last_tag = self.last_tag
+        self.rows, self.messages, self.last_tag, self.oldest_at = [], [], None, None
+        return last_tag
+
+
+class LogWriterService:
+    def __init__(self, writer: LogBatchWriter):
+        self.writer = writer
+        self.writer.event_sink = self.publish_events
+        self.client = RabbitMQClient()
+
+    def run(self):
+        self.client.connect()
+        if not self.client.channel:
+            return
+        self.client.declare_exchange(RabbitMQClient.JOB_LOGS_DB_EXCHANGE)
+        self.client.declare_queue(RabbitMQClient.JOB_LOGS_DB_QUEUE)
+        self.client.bind_queue(RabbitMQClient.JOB_LOGS_DB_QUEUE, RabbitMQClient.JOB_LOGS_DB_EXCHANGE, "job.logs.db.#")
+        self.client.declare_exchange(RabbitMQClient.JOB_LOGS_STREAM_EXCHANGE)
+
+        channel = self.client.channel
+        # enough unacked messages in flight to fill a batch while the previous one is written
+        channel.basic_qos(prefetch_count=self.writer.batch_size * 2)
+        channel.basic_consume(queue=RabbitMQClient.JOB_LOGS_DB_QUEUE, on_message_callback=self.on_message)
+        self.client.connection.call_later(self.writer.flush_seconds, self.on_timer)
+        print(f"Log writer consuming '{RabbitMQClient.JOB_LOGS_DB_QUEUE}', batch size {self.writer.batch_size}")
+        try:
+            channel.start_consuming()
+        finally:
+            self.client.close()
+
+    def on_message(self, ch, method, properties, body):
+        try:
+            message = decode_message(properties, body)
+        except ValueError:
+            print(f"Dropping undecodable log message {method.delivery_tag}")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+        if self.writer.add(method.delivery_tag, message):
+            self.flush()
+
+    def on_timer(self):
+        if self.writer.due():
+            self.flush()
+        self.client.connection.call_later(self.writer.flush_seconds, self.on_timer)
+
+    def flush(self):
+        channel = self.client.channel
+        try:
+            last_tag = self.writer.flush()
+        except Exception as e:
+            # nothing was written: hand the whole batch back to the queue
+            print(f"Failed to write log batch: {e}")
+            channel.basic_nack(delivery_tag=self.writer.discard(), multiple=True, requeue=True)
+            time.sleep(1)
+            return
+        if last_tag is not None:
+            # one ack covers every message of the batch
+            channel.basic_ack(delivery_tag=last_tag, multiple=True)
+
+    def publish_events(self, messages: List[dict]):
+        # Live stream only: transient messages, no confirms. A lost event is
+        # still in execution_logs.
+        properties = pika.BasicProperties(delivery_mode=1, content_type=self.client.codec.content_type)
+        try:
+            for message in messages:
+                self.client.channel.basic_publish(
+                    exchange=RabbitMQClient.JOB_LOGS_STREAM_EXCHANGE,
+                    routing_key=f"job.logs.stream.{message['job_uuid']}",
+                    body=self.client.codec.encode(message),
+                    properties=properties,
+                )
+        except Exception as e:
+            print(f"Failed to publish {len(messages)} log events to the stream: {e}")
+
+
+if __name__ == "__main__":
+    LogWriterService(LogBatchWriter()).run()
@@ -0,0 +1,222 @@
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+import pika
+from pika.exceptions import AMQPError
+
+from app.services.rabbitmq_client import CODECS, MESSAGE_CODEC, RabbitMQClient
+
+# Thread-safe publishing to RabbitMQ.
+#
+# A pika BlockingConnection, and every channel on it, may only be used by one
+# thread at a time. The pool holds PUBLISHER_POOL_SIZE connections, each with
+# its channels, and lends one to a thread for the duration of a publish:
+#
+#   with publisher.channel() as channel:
+#       channel.publish(exchange, routing_key, body, properties)
+#
+# or simply publisher.publish_message(...) / publisher.publish_batch(...).
+#
+# Single messages go through a channel in confirm mode: publish returns once
+# the broker has taken responsibility for the message, and a nack raises.
+# Batches go through a transactional channel: one commit, one round trip.
+#
+# A connection that is found closed (or fails mid-publish) is reopened, with an
+# exponential backoff shared by the whole pool so a broker outage is not
+# hammered by every thread at once, and the publish is retried. A message may
+# then reach the broker twice (sent, connection lost before the confirm);
+# consumers already take duplicates (start_job only runs a queued job once).
+
+POOL_SIZE = int(os.getenv("RABBITMQ_PUBLISHER_POOL_SIZE", 8))
+CHECKOUT_TIMEOUT = float(os.getenv("RABBITMQ_PUBLISHER_CHECKOUT_TIMEOUT", 10)) # seconds to wait for a free connection
+PUBLISH_ATTEMPTS = int(os.getenv("RABBITMQ_PUBLISH_ATTEMPTS", 3))
+RECONNECT_INITIAL_DELAY = float(os.getenv("RABBITMQ_RECONNECT_INITIAL_DELAY", 0.5))
+RECONNECT_MAX_DELAY = float(os.getenv("RABBITMQ_RECONNECT_MAX_DELAY", 30))
+
+
+class PublishError(Exception):
+    pass
+
+
+def default_connect():
+    return pika.BlockingConnection(RabbitMQClient().connection_parameters())
+
+
+class PooledChannel:
+    # one connection of the pool with its two channels
+    def __init__(self):
+        self.connection = None
+        self.channel = None     # confirm mode
+        self.tx_channel = None  # transactional, opened with the first batch
+
+    def is_open(self) -> bool:
+        if self.connection is None or not self.connection.is_open:
+            return False
+        try:
+            # services heartbeats and notices a connection the broker closed while idle
+            self.connection.process_data_events(time_limit=0)
+        except AMQPError:
+            return False
+        return self.channel.is_open
+
+    def open(self, connect: Callable):
+        self.close()
+        self.connection = connect()
+        self.channel = self.connection.channel()
+        self.channel.confirm_delivery()
+
+    def close(self):
+        connection, self.connection, self.channel, self.tx_channel = self.connection, None, None, None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def publish(self, exchange_name: str, routing_key: str, body: bytes, properties: pika.BasicProperties):
+        # returns once confirmed, raises NackError when the broker refuses the message
+        self.channel.basic_publish(exchange=exchange_name, routing_key=routing_key, body=body, properties=properties)
+
+    def publish_batch(self, exchange_name: str, messages: List[tuple]):
+        # (routing_key, body, properties) tuples, all or nothing
+        if self.tx_channel is None or not self.tx_channel.is_open:
+            self.tx_channel = self.connection.channel()
+            self.tx_channel.tx_select()
+        try:
+            for routing_key, body, properties in messages:
+                self.tx_channel.basic_publish(exchange=exchange_name, routing_key=routing_key, body=body,
+                                              properties=properties)
+            self.tx_channel.tx_commit()
+        except Exception:
+            try:
+                if self.tx_channel.is_open:
+                    self.tx_channel.tx_rollback()
+            except Exception:
+                pass # the connection is gone, so is the transaction
+            raise
+
+
+class PublisherPool:
+    def __init__(self, size: int = POOL_SIZE, connect: Callable = default_connect,
+                 checkout_timeout: float = CHECKOUT_TIMEOUT, attempts: int = PUBLISH_ATTEMPTS,
+                 initial_delay: float = RECONNECT_INITIAL_DELAY, max_delay: float = RECONNECT_MAX_DELAY, codec=None):
+        self.size = size
+        self.codec = codec or CODECS[MESSAGE_CODEC]
+        self.connect = connect
+        self.checkout_timeout = checkout_timeout
+        self.attempts = attempts
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        # connections are opened on first use; the most recently used one is
+        # lent first, so a lightly loaded pool keeps few connections busy
+        self.idle = queue.LifoQueue()
+        for _ in range(size):
+            self.idle.put(PooledChannel())
+        self.lock = threading.Lock()
+        self.delay = 0.0        # current backoff, 0 while the broker is reachable
+        self.retry_at = 0.0     # no connection attempt before this (monotonic time)
+        self.published = 0
+        self.failed = 0
+        self.opened = 0          # connections opened, the first ones included
+
+    def wait_for_retry(self):
+        with self.lock:
+            wait = self.retry_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def connected(self):
+        with self.lock:
+            self.delay = 0.0
+            self.opened += 1
+
+    def connect_failed(self):
+        with self.lock:
+            self.delay = min(self.max_delay, max(self.initial_delay, self.delay * 2))
+            # +/- 20% so the publishers of several processes don't retry in step
+            self.retry_at = time.monotonic() + self.delay * random.uniform(0.8, 1.2)
+
+    @contextmanager
+    def channel(self):
+        try:
+            pooled = self.idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise PublishError(f"No publisher connection free after {self.checkout_timeout}s")
+        try:
+            if not pooled.is_open():
+                self.wait_for_retry()
+                try:
+                    pooled.open(self.connect)
+                except Exception as e:
+                    pooled.close()
+                    self.connect_failed()
+                    raise PublishError(f"Cannot connect to RabbitMQ: {e}")
+                self.connected()
+            yield pooled
+        except AMQPError:
+            pooled.close() # in an unknown state, reopened by the next user
+            raise
+        finally:
+            self.idle.put(pooled)
+
+    def run(self, publish: Callable, description: str) -> bool:
+        # publish(pooled) with retries on a fresh connection; False once every attempt failed
+        for attempt in range(1, self.attempts + 1):
+            try:
+                with self.channel() as pooled:
+                    publish(pooled)
+                return True
+            except (AMQPError, PublishError) as e:
+                print(f"Publishing {description} failed (attempt {attempt}/{self.attempts}): {e!r}")
+        with self.lock:
+            self.failed += 1
+        return False
+
+    def count(self, published: int):
+        with self.lock:
+            self.published += published
+
+    def publish_message(self, exchange_name: str, routing_key: str, message, priority: Optional[int] = None) -> bool:
+        # True once the broker has confirmed the message
+        body = self.codec.encode(message)
+        properties = pika.BasicProperties(delivery_mode=2, priority=priority, content_type=self.codec.content_type)
+        if not self.run(lambda pooled: pooled.publish(exchange_name, routing_key, body, properties),
+                        f"message to '{exchange_name}' with routing key '{routing_key}'"):
+            return False
+        self.count(1)
+        return True
+
+    def publish_batch(self, exchange_name: str, messages: List[tuple]) -> bool:
+        # (routing_key, message, priority) tuples in one transaction.
+        # True once the broker has accepted the whole batch.
+        frames = [
+            (routing_key, self.codec.encode(message),
+             pika.BasicProperties(delivery_mode=2, priority=priority, content_type=self.codec.content_type))
+            for routing_key, message, priority in messages
+        ]
+        if not self.run(lambda pooled: pooled.publish_batch(exchange_name, frames),
+                        f"batch of {len(frames)} messages to '{exchange_name}'"):
+            return False
+        self.count(len(frames))
+        return True
+
+    def close(self):
+        # closes the idle connections, the pool stays usable (they reopen on demand)
+        pooled = []
+        while True:
+            try:
+                pooled.append(self.idle.get_nowait())
+            except queue.Empty:
+                break
+        for connection in pooled:
+            connection.close()
+            self.idle.put(connection)
+
+    def stats(self) -> dict:
+        return {"size": self.size, "idle": self.idle.qsize(), "published": self.published,
+                "failed": self.failed, "opened": self.opened, "backoff_seconds": self.delay}
@@ -1,8 +1,65 @@
+import asyncio
 import pika
 import os
 import json
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+import msgpack
+from pika import spec
+from pika.adapters.asyncio_connection import AsyncioConnection
+from pika.exceptions import AMQPConnectionError, AMQPError, ConsumerCancelled, NackError
+
+# Message codecs. Every message is published with its codec's content type
+# and consumers decode by it, so publishers can switch codec (RABBITMQ_CODEC)
+# while the queues still hold messages in the other one. A message without a
+# content type is JSON, as everything was before.
+
+def plain(value):
+    # the few non-JSON types found in messages
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+class JsonCodec:
+    name = "json"
+    content_type = "application/json"
+
+    def encode(self, message) -> bytes:
+        return json.dumps(message, separators=(",", ":"), default=plain).encode()
+
+    def decode(self, body: bytes):
+        return json.loads(body)
+
+class MsgpackCodec:
+    # binary: 10-20% smaller than compact JSON for our messages, 2-3x faster
+    # to encode and decode (benchmarks/message_codecs.py)
+    name = "msgpack"
+    content_type = "application/msgpack"
+
+    def encode(self, message) -> bytes:
+        return msgpack.packb(message, default=plain)
+
+    def decode(self, body: bytes):
+        return msgpack.unpackb(body)
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), MsgpackCodec())}
+CODECS_BY_CONTENT_TYPE = {codec.content_type: codec for codec in CODECS.values()}
+MESSAGE_CODEC = os.getenv("RABBITMQ_CODEC", "json")
+
+def decode_message(properties, body: bytes):
+    # raises ValueError for a body that is not valid in its codec
+    content_type = getattr(properties, "content_type", None)
+    return CODECS_BY_CONTENT_TYPE.get(content_type, CODECS["json"]).decode(body)
+
+class RabbitMQConfig:
+    # names and connection settings shared by the blocking and the asyncio client
 
-class RabbitMQClient:
     # Exchange Names
     JOB_DISPATCH_EXCHANGE = 'job_dispatch_exchange'
     JOB_LOGS_STREAM_EXCHANGE = 'job_logs_stream_exchange'
@@ -14,24 +71,49 @@ class RabbitMQClient:
     JOB_LOGS_DB_QUEUE = 'job_logs_db_queue'
     JOB_MONITORING_QUEUE = 'job_monitoring_queue'
 
-    def __init__(self):
-        self.connection = None
-        self.channel = None
+    # Routing keys
+    # Jobs placed on a specific worker by the scheduler go to that worker's own queue.
+    WORKER_DISPATCH_ROUTING_KEY = 'job.worker.{worker_id}'
+    # With priority lanes (services/lanes.py) each priority has its own queue.
+    LANE_DISPATCH_ROUTING_KEY = 'job.lane.{lane}.{job_id}'
+    WORKER_HEARTBEAT_ROUTING_KEY = 'job.monitoring.heartbeat.{worker_id}'
+
+    @staticmethod
+    def worker_dispatch_queue(worker_id):
+        return f"{RabbitMQConfig.JOB_DISPATCH_QUEUE}.{worker_id}"
+
+    @staticmethod
+    def lane_dispatch_queue(lane):
+        return f"{RabbitMQConfig.JOB_DISPATCH_QUEUE}.lane.{lane.lower()}"
+
+    def __init__(self, codec=None):
+        self.codec = codec or CODECS[MESSAGE_CODEC]
         self.RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
         self.RABBITMQ_PORT = int(os.getenv("RABBITMQ_PORT", 5672))
         self.RABBITMQ_USER = os.getenv("RABBITMQ_USER", "guest")
         self.RABBITMQ_PASS = os.getenv("RABBITMQ_PASS", "guest")
 
+    def connection_parameters(self):
+        credentials = pika.PlainCredentials(self.RABBITMQ_USER, self.RABBITMQ_PASS)
+        return pika.ConnectionParameters(
+            host=self.RABBITMQ_HOST,
+            port=self.RABBITMQ_PORT,
+            credentials=credentials
+        )
+
+    def properties(self, priority=None, delivery_mode=2):
+        return pika.BasicProperties(delivery_mode=delivery_mode, priority=priority,
+                                    content_type=self.codec.content_type)
+
+class RabbitMQClient(RabbitMQConfig):
+    def __init__(self, codec=None):
+        super().__init__(codec)
+        self.connection = None
+        self.channel = None
+
     def connect(self):
         try:
-            credentials = pika.PlainCredentials(self.RABBITMQ_USER, self.RABBITMQ_PASS)
-            self.connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=self.RABBITMQ_HOST,
-                    port=self.RABBITMQ_PORT,
-                    credentials=credentials
-                )
-            )
+            self.connection = pika.BlockingConnection(self.connection_parameters())
             self.channel = self.connection.channel()
             print("Connected to RabbitMQ successfully!")
         except pika.exceptions.AMQPConnectionError as e:
@@ -54,6 +136,13 @@ class RabbitMQClient:
             self.channel.queue_declare(queue=queue_name, durable=durable, arguments=arguments)
             print(f"Queue '{queue_name}' declared.")
 
+    def declare_exclusive_queue(self):
+        # Server-named queue that lives as long as this connection.
+        if self.channel:
+            result = self.channel.queue_declare(queue='', exclusive=True, auto_delete=True)
+            print(f"Exclusive queue '{result.method.queue}' declared.")
+            return result.method.queue
+
     def bind_queue(self, queue_name, exchange_name, routing_key):
         if self.channel:
             self.channel.queue_bind(exchange=exchange_name, queue=queue_name, routing_key=routing_key)
@@ -66,19 +155,32 @@ class RabbitMQClient:
 
         properties = pika.BasicProperties(
             delivery_mode=2,  # Make message persistent
-            priority=priority # Set message priority
+            priority=priority, # Set message priority
+            content_type=self.codec.content_type
         )
         try:
             self.channel.basic_publish(
                 exchange=exchange_name,
                 routing_key=routing_key,
-                body=json.dumps(message),
+                body=self.codec.encode(message),
                 properties=properties
             )
             print(f"Message published to exchange '{exchange_name}' with routing key '{routing_key}' and priority {priority}: {message}")
         except Exception as e:
             print(f"Error publishing message: {e}")
 
+    def get_messages(self, queue_name, limit=1000):
+        # Drain up to `limit` messages without blocking (basic_get, auto ack).
+        if not self.channel:
+            return []
+        messages = []
+        while len(messages) < limit:
+            method, properties, body = self.channel.basic_get(queue=queue_name, auto_ack=True)
+            if method is None:
+                break
+            messages.append(decode_message(properties, body))
+        return messages
+
     def consume_messages(self, queue_name, callback):
         if not self.channel:
             print("Not connected to RabbitMQ. Cannot consume messages.")
@@ -98,6 +200,239 @@ class RabbitMQClient:
     def nack_message(self, ch, method):
         ch.basic_nack(delivery_tag=method.delivery_tag)
 
+class Delivery:
+    # one message received by AsyncRabbitMQClient.consume
+    __slots__ = ("channel", "delivery_tag", "routing_key", "redelivered", "properties", "body")
+
+    def __init__(self, channel, method, properties, body):
+        self.channel = channel
+        self.delivery_tag = method.delivery_tag
+        self.routing_key = method.routing_key
+        self.redelivered = method.redelivered
+        self.properties = properties
+        self.body = body
+
+    def decode(self):
+        # raises ValueError for a body that is not valid in its codec
+        return decode_message(self.properties, self.body)
+
+    # On a closed channel there is nothing to settle: the broker has already
+    # put the unacked deliveries back in their queue.
+    def ack(self):
+        if self.channel.is_open:
+            self.channel.basic_ack(delivery_tag=self.delivery_tag)
+
+    def nack(self, requeue=True):
+        if self.channel.is_open:
+            self.channel.basic_nack(delivery_tag=self.delivery_tag, requeue=requeue)
+
+def resolver(future):
+    # a pika completion callback resolving `future` with the frame it receives
+    return lambda frame=None: future.done() or future.set_result(frame)
+
+class AsyncRabbitMQClient(RabbitMQConfig):
+    """
+    asyncio counterpart of RabbitMQClient, on pika's AsyncioConnection: the
+    connection is driven by the running event loop, no thread of its own.
+    Every broker round trip is awaited instead of blocking, publishes are
+    confirmed and any number of them can wait for their confirm at once, and
+    consume() is an async iterator holding at most `prefetch` unacked deliveries.
+
+        client = AsyncRabbitMQClient()
+        await client.connect()
+        await client.publish_message(exchange, routing_key, message) # confirmed
+        async for delivery in client.consume(queue, prefetch=100):
+            message = delivery.decode()
+            ...
+            delivery.ack()
+
+    The client has a single channel. If it closes (a refused declare, the
+    connection lost), pending calls, confirms and consumers fail with the
+    reason and the client has to connect again.
+    """
+
+    def __init__(self, codec=None, connection_class=AsyncioConnection):
+        super().__init__(codec)
+        self.connection_class = connection_class
+        self.connection = None
+        self.channel = None
+        self.closed = None       # future, resolved once the connection is closed
+        self.pending = set()     # futures waiting for a reply of the broker
+        self.confirms = {}       # delivery tag -> future of a publish waiting for its confirm
+        self.delivery_tag = 0
+        self.consumers = {}      # consumer tag -> asyncio.Queue of its deliveries
+
+    @property
+    def is_open(self):
+        return self.channel is not None and self.channel.is_open
+
+    def reply(self):
+        # a future for a reply of the broker, failed if the channel closes first
+        future = asyncio.get_running_loop().create_future()
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    async def connect(self):
+        # raises AMQPConnectionError when the broker can't be reached
+        loop = asyncio.get_running_loop()
+        opened = self.reply()
+        self.closed = loop.create_future()
+
+        def on_open(connection):
+            if connection is not self.connection:
+                connection.close() # close() was called while it was opening
+            elif not opened.done():
+                opened.set_result(connection)
+
+        def on_open_error(connection, error):
+            if not opened.done():
+                opened.set_exception(error if isinstance(error, AMQPError) else AMQPConnectionError(error))
+
+        self.connection = self.connection_class(
+            self.connection_parameters(),
+            on_open_callback=on_open,
+            on_open_error_callback=on_open_error,
+            on_close_callback=self.on_connection_closed,
+            custom_ioloop=loop,
+        )
+        await opened
+        channel_opened = self.reply()
+        self.connection.channel(on_open_callback=resolver(channel_opened))
+        self.channel = await channel_opened
+        self.channel.add_on_close_callback(self.on_channel_closed)
+        self.channel.add_on_cancel_callback(self.on_consumer_cancelled)
+        self.delivery_tag = 0
+        await self.call(self.channel.confirm_delivery, ack_nack_callback=self.on_confirm)
+        print("Connected to RabbitMQ successfully!")
+
+    async def close(self):
+        connection, self.connection = self.connection, None
+        if connection is None or not connection.is_open:
+            return # closing already, or still opening: on_open closes it
+        connection.close()
+        await self.closed
+        print("RabbitMQ connection closed.")
+
+    def on_connection_closed(self, connection, reason):
+        self.fail(reason)
+        if self.closed is not None and not self.closed.done():
+            self.closed.set_result(reason)
+
+    def on_channel_closed(self, channel, reason):
+        self.fail(reason)
+
+    def fail(self, reason):
+        error = reason if isinstance(reason, Exception) else AMQPError(reason)
+        for future in list(self.pending) + list(self.confirms.values()):
+            if not future.done():
+                future.set_exception(error)
+        self.confirms.clear()
+        for deliveries in self.consumers.values():
+            deliveries.put_nowait(error)
+
+    def call(self, method, **kwargs):
+        # an AMQP method with a reply (declare, bind, qos...), awaitable
+        reply = self.reply()
+        try:
+            method(callback=resolver(reply), **kwargs)
+        except Exception:
+            reply.cancel()
+            raise
+        return reply
+
+    async def declare_exchange(self, exchange_name, exchange_type='topic', durable=True):
+        await self.call(self.channel.exchange_declare, exchange=exchange_name, exchange_type=exchange_type,
+                        durable=durable)
+        print(f"Exchange '{exchange_name}' declared.")
+
+    async def declare_queue(self, queue_name, durable=True, arguments=None):
+        await self.call(self.channel.queue_declare, queue=queue_name, durable=durable, arguments=arguments)
+        print(f"Queue '{queue_name}' declared.")
+
+    async def declare_exclusive_queue(self):
+        # Server-named queue that lives as long as this connection.
+        frame = await self.call(self.channel.queue_declare, queue='', exclusive=True, auto_delete=True)
+        print(f"Exclusive queue '{frame.method.queue}' declared.")
+        return frame.method.queue
+
+    async def bind_queue(self, queue_name, exchange_name, routing_key):
+        await self.call(self.channel.queue_bind, queue=queue_name, exchange=exchange_name, routing_key=routing_key)
+        print(f"Queue '{queue_name}' bound to exchange '{exchange_name}' with routing key '{routing_key}'.")
+
+    async def set_prefetch(self, prefetch):
+        # applies to the consumers started afterwards, each on its own
+        await self.call(self.channel.basic_qos, prefetch_count=prefetch)
+
+    def publish(self, exchange_name, routing_key, message, priority=None, delivery_mode=2) -> asyncio.Future:
+        # Sends the message right away. The future resolves once the broker
+        # has confirmed it, with NackError if the broker refused it.
+        self.channel.basic_publish(exchange=exchange_name, routing_key=routing_key, body=self.codec.encode(message),
+                                   properties=self.properties(priority, delivery_mode))
+        self.delivery_tag += 1
+        confirmed = asyncio.get_running_loop().create_future()
+        self.confirms[self.delivery_tag] = confirmed
+        return confirmed
+
+    async def publish_message(self, exchange_name, routing_key, message, priority=None):
+        # returns once the broker has confirmed the message
+        await self.publish(exchange_name, routing_key, message, priority)
+
+    def on_confirm(self, frame):
+        method = frame.method
+        error = None if isinstance(method, spec.Basic.Ack) else NackError([])
+        if method.multiple:
+            # tags are in publish order: everything up to delivery_tag
+            tags = []
+            for tag in self.confirms:
+                if tag > method.delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [method.delivery_tag]
+        for tag in tags:
+            future = self.confirms.pop(tag, None)
+            if future is None or future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    async def consume(self, queue_name, prefetch=None, auto_ack=False):
+        # Async iterator of Delivery. The broker sends at most `prefetch`
+        # unacked deliveries ahead, which bounds what waits here. Leaving the
+        # loop cancels the consumer; its unacked deliveries can still be settled.
+        if prefetch is not None:
+            await self.set_prefetch(prefetch)
+        deliveries = asyncio.Queue()
+        consumed = self.reply()
+        consumer_tag = self.channel.basic_consume(
+            queue=queue_name,
+            on_message_callback=lambda channel, method, properties, body:
+                deliveries.put_nowait(Delivery(channel, method, properties, body)),
+            auto_ack=auto_ack,
+            callback=resolver(consumed),
+        )
+        self.consumers[consumer_tag] = deliveries
+        try:
+            await consumed
+            while True:
+                delivery = await deliveries.get()
+                if isinstance(delivery, Exception):
+                    raise delivery
+                yield delivery
+        finally:
+            del self.consumers[consumer_tag]
+            if self.is_open:
+                self.channel.basic_cancel(consumer_tag)
+
+    def on_consumer_cancelled(self, frame):
+        # the broker cancelled a consumer (its queue was deleted...)
+        deliveries = self.consumers.get(frame.method.consumer_tag)
+        if deliveries is not None:
+            deliveries.put_nowait(ConsumerCancelled(frame.method.consumer_tag))
+
 # Example Usage (for testing purposes, can be removed later)
 if __name__ == "__main__":
     client = RabbitMQClient()
@@ -0,0 +1,118 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Worker capacity tracking and resource-aware placement for the scheduler.
+#
+# Workers publish a heartbeat on JOB_MONITORING_EXCHANGE with their free
+# capacity; the scheduler keeps the latest view per worker and only places a
+# job on a worker that has room for its cpu_units / memory_mb.
+
+# A worker that has not sent a heartbeat for this long is considered gone.
+HEARTBEAT_TTL_SECONDS = 15
+# Capacity handed out by the scheduler is kept off a worker's free capacity
+# until a heartbeat sent after it arrives (minus IN_FLIGHT_MARGIN_SECONDS for
+# messages still in transit), and never longer than RESERVATION_GRACE_SECONDS.
+RESERVATION_GRACE_SECONDS = 2
+IN_FLIGHT_MARGIN_SECONDS = 0.25
+
+PLACEMENT_STRATEGIES = ("first_fit", "best_fit")
+
+
+class WorkerCapacity:
+    def __init__(self, worker_id: str, cpu_units: int, memory_mb: int, seen_at: float):
+        self.worker_id = worker_id
+        self.cpu_units = cpu_units      # free cpu as last reported
+        self.memory_mb = memory_mb      # free memory as last reported
+        self.cpu_units_total = cpu_units
+        self.memory_mb_total = memory_mb
+        self.seen_at = seen_at
+        self.reservations: List[Tuple[float, int, int]] = []
+
+    def free(self, now: float) -> Tuple[int, int]:
+        self.reservations = [r for r in self.reservations if now - r[0] < RESERVATION_GRACE_SECONDS]
+        cpu = self.cpu_units - sum(r[1] for r in self.reservations)
+        memory = self.memory_mb - sum(r[2] for r in self.reservations)
+        return cpu, memory
+
+
+def job_requirements(job) -> Tuple[int, int]:
+    # Jobs without declared requirements don't take any capacity.
+    return job.cpu_units or 0, job.memory_mb or 0
+
+
+class CapacityTracker:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.workers: Dict[str, WorkerCapacity] = {}
+
+    def update(self, heartbeat: dict):
+        # heartbeat: {"worker_id", "cpu_units_free", "memory_mb_free",
+        #             "cpu_units_total", "memory_mb_total", "sent_at"}
+        now = self.clock()
+        worker = self.workers.get(heartbeat["worker_id"])
+        if worker is None:
+            worker = WorkerCapacity(heartbeat["worker_id"], 0, 0, now)
+            self.workers[worker.worker_id] = worker
+        worker.cpu_units = heartbeat["cpu_units_free"]
+        worker.memory_mb = heartbeat["memory_mb_free"]
+        worker.cpu_units_total = heartbeat.get("cpu_units_total", worker.cpu_units)
+        worker.memory_mb_total = heartbeat.get("memory_mb_total", worker.memory_mb)
+        worker.seen_at = now
+        if "sent_at" in heartbeat:
+            # the reported free capacity already accounts for older reservations
+            cutoff = heartbeat["sent_at"] - IN_FLIGHT_MARGIN_SECONDS
+            worker.reservations = [r for r in worker.reservations if r[0] > cutoff]
+
+    def expire(self):
+        now = self.clock()
+        for worker_id in [w.worker_id for w in self.workers.values() if now - w.seen_at > HEARTBEAT_TTL_SECONDS]:
+            print(f"Worker {worker_id} missed its heartbeats, dropping it from placement")
+            del self.workers[worker_id]
+
+    def has_capacity(self) -> bool:
+        now = self.clock()
+        return any(cpu > 0 and memory > 0 for cpu, memory in (w.free(now) for w in self.workers.values()))
+
+    def reserve(self, worker_id: str, cpu_units: int, memory_mb: int):
+        self.workers[worker_id].reservations.append((self.clock(), cpu_units, memory_mb))
+
+    def place(self, jobs, strategy: str = "best_fit") -> Tuple[list, list]:
+        """
+        Place jobs (already in priority order) on workers with enough free cpu and memory.
+        Returns ([(job, worker_id), ...], [jobs that fit nowhere right now]).
+        """
+        now = self.clock()
+        free = {worker_id: list(worker.free(now)) for worker_id, worker in sorted(self.workers.items())}
+        placed, unplaced = [], []
+        for job in jobs:
+            cpu, memory = job_requirements(job)
+            worker_id = self._pick(free, cpu, memory, strategy)
+            if worker_id is None:
+                unplaced.append(job)
+                continue
+            free[worker_id][0] -= cpu
+            free[worker_id][1] -= memory
+            self.reserve(worker_id, cpu, memory)
+            placed.append((job, worker_id))
+        return placed, unplaced
+
+    def _pick(self, free, cpu: int, memory: int, strategy: str) -> Optional[str]:
+        candidates = [
+            worker_id for worker_id, (free_cpu, free_memory) in free.items()
+            if free_cpu >= cpu and free_memory >= memory
+        ]
+        if not candidates:
+            return None
+        if strategy == "first_fit":
+            return candidates[0]
+
+        # best fit: the worker left with the least slack, cpu and memory
+        # weighted by the share of the worker's total they represent
+        def slack(worker_id):
+            worker = self.workers[worker_id]
+            free_cpu, free_memory = free[worker_id]
+            return (
+                (free_cpu - cpu) / max(worker.cpu_units_total, 1)
+                + (free_memory - memory) / max(worker.memory_mb_total, 1)
+            )
+        return min(candidates, key=slack)
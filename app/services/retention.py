@@ -0,0 +1,190 @@
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import delete, insert, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.models import Job, JobDependency, jobs_archive, job_dependencies_archive
+from app.services.job_events import notify_job_changes
+
+# Retention service: keeps the live tables about the size of the working set,
+# however much history piles up.
+#
+# execution_logs has one partition per day (UTC). Partitions are created
+# RETENTION_PARTITIONS_AHEAD days in advance and detached once entirely older
+# than RETENTION_LOG_DAYS, a catalog change instead of deleting rows.
+# Jobs completed, cancelled or failed more than RETENTION_JOB_DAYS ago are
+# moved to jobs_archive (their dependency edges to job_dependencies_archive).
+
+LOG_RETENTION_DAYS = int(os.getenv("RETENTION_LOG_DAYS", 30))
+JOB_RETENTION_DAYS = int(os.getenv("RETENTION_JOB_DAYS", 30))
+PARTITIONS_AHEAD = int(os.getenv("RETENTION_PARTITIONS_AHEAD", 7))
+# "detach": old partitions are kept as standalone tables (to dump, then drop)
+# "drop": they are dropped
+LOG_MODE = os.getenv("RETENTION_LOG_MODE", "detach")
+BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 5000))
+INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", 3600))
+
+TERMINAL_STATUSES = ("completed", "cancelled", "failed")
+
+PARTITION_BOUND = re.compile(r"FROM \((.+)\) TO \((.+)\)")
+
+
+def parse_bound(value: str) -> Optional[datetime]:
+    # MINVALUE / MAXVALUE are open ends
+    if not value.startswith("'"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def log_partitions(db: Session) -> List[tuple]:
+    # (name, lower, upper) of every range partition of execution_logs, in order
+    rows = db.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'execution_logs'::regclass"
+    ))
+    partitions = []
+    for name, bound in rows:
+        match = PARTITION_BOUND.search(bound)
+        if match: # not the default partition
+            partitions.append((name, parse_bound(match[1]), parse_bound(match[2])))
+    return sorted(partitions, key=lambda partition: partition[2] or datetime.max.replace(tzinfo=timezone.utc))
+
+
+def ensure_log_partitions(db: Session, now: datetime, days_ahead: int = PARTITIONS_AHEAD) -> List[str]:
+    # Daily partitions from the end of the last one (today if there is none)
+    # up to `days_ahead` days from now, so inserts never land in the default partition.
+    uppers = [upper for _, _, upper in log_partitions(db) if upper is not None]
+    day = max(uppers).astimezone(timezone.utc).date() if uppers else now.astimezone(timezone.utc).date()
+    last_day = now.astimezone(timezone.utc).date() + timedelta(days=days_ahead)
+    created = []
+    while day <= last_day:
+        name = f"execution_logs_p{day:%Y%m%d}"
+        try:
+            create_log_partition(db, name, day)
+            created.append(name)
+        except Exception as e:
+            # the days after this one are still created, and old ones detached
+            db.rollback()
+            print(f"Could not create log partition {name}: {e}")
+        day += timedelta(days=1)
+    return created
+
+
+def create_log_partition(db: Session, name: str, day):
+    # One transaction per day. Rows already in the default partition for that
+    # day (the loop fell behind, or the first run on live data) would make
+    # CREATE ... PARTITION OF fail: they are moved to the new table, which is
+    # then attached, all at once.
+    bounds = f"FROM ('{day.isoformat()} 00:00:00+00') TO ('{day + timedelta(days=1)} 00:00:00+00')"
+    in_day = f"log_timestamp >= '{day.isoformat()} 00:00:00+00' AND log_timestamp < '{day + timedelta(days=1)} 00:00:00+00'"
+    if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        db.commit()
+        return
+    if db.execute(text(f"SELECT 1 FROM execution_logs_default WHERE {in_day} LIMIT 1")).first() is None:
+        db.execute(text(f"CREATE TABLE {name} PARTITION OF execution_logs FOR VALUES {bounds}"))
+    else:
+        db.execute(text(f"CREATE TABLE {name} (LIKE execution_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        moved = db.execute(text(
+            f"WITH moved AS (DELETE FROM execution_logs_default WHERE {in_day} RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        )).rowcount
+        # the partitioned table's indexes are built on the new partition here
+        db.execute(text(f"ALTER TABLE execution_logs ATTACH PARTITION {name} FOR VALUES {bounds}"))
+        print(f"Moved {moved} rows from execution_logs_default to {name}")
+    db.commit()
+
+
+def detach_old_log_partitions(db: Session, now: datetime, retention_days: int = LOG_RETENTION_DAYS,
+                              mode: str = LOG_MODE) -> List[str]:
+    cutoff = now - timedelta(days=retention_days)
+    detached = []
+    for name, _, upper in log_partitions(db):
+        if upper is None or upper > cutoff:
+            break
+        db.execute(text(f"ALTER TABLE execution_logs DETACH PARTITION {name}"))
+        if mode == "drop":
+            db.execute(text(f"DROP TABLE {name}"))
+        db.commit() # one partition at a time, the parent is locked only briefly
+        detached.append(name)
+    return detached
+
+
+def archive_batch(db: Session, cutoff: datetime, after, batch_size: int):
+    # Move one batch of old terminal jobs, the oldest first from `after`
+    # (modified_time, id). Returns (number archived, key of the last job looked at).
+    candidates = db.execute(
+        select(Job.id, Job.modified_time)
+        .where(Job.status.in_(TERMINAL_STATUSES), Job.modified_time < cutoff,
+               tuple_(Job.modified_time, Job.id) > after)
+        .order_by(Job.modified_time, Job.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not candidates:
+        db.commit()
+        return 0, None
+    batch = {id for id, _ in candidates}
+    # A job only goes together with all of its children: the edge of a child
+    # left behind would point at nothing. Jobs held back are retried next run.
+    edges = db.execute(
+        select(JobDependency.depends_on_id, JobDependency.dependant_id)
+        .where(JobDependency.depends_on_id.in_(batch))
+    ).all()
+    while blocked := {parent for parent, child in edges if parent in batch and child not in batch}:
+        batch -= blocked
+
+    if batch:
+        ids = list(batch)
+        job_columns = [column.name for column in jobs_archive.columns]
+        db.execute(insert(jobs_archive).from_select(
+            job_columns, select(*[Job.__table__.c[name] for name in job_columns]).where(Job.id.in_(ids))
+        ))
+        edge_columns = [column.name for column in job_dependencies_archive.columns]
+        db.execute(insert(job_dependencies_archive).from_select(
+            edge_columns,
+            select(*[JobDependency.__table__.c[name] for name in edge_columns]).where(JobDependency.dependant_id.in_(ids)),
+        ))
+        db.execute(delete(JobDependency).where(JobDependency.dependant_id.in_(ids)))
+        archived = db.execute(delete(Job).where(Job.id.in_(ids)).returning(Job.job_id)).scalars().all()
+        notify_job_changes(db, archived) # gone from GET /jobs/{job_id}
+    db.commit()
+    last_id, last_modified_time = candidates[-1]
+    return len(batch), (last_modified_time, last_id)
+
+
+def archive_jobs(db: Session, now: datetime, retention_days: int = JOB_RETENTION_DAYS,
+                 batch_size: int = BATCH_SIZE) -> int:
+    cutoff = now - timedelta(days=retention_days)
+    archived = 0
+    after = (datetime.min.replace(tzinfo=timezone.utc), 0)
+    while after is not None:
+        count, after = archive_batch(db, cutoff, after, batch_size)
+        archived += count
+    return archived
+
+
+def run_retention(db: Session, now: Optional[datetime] = None):
+    now = now or datetime.now(timezone.utc)
+    created = ensure_log_partitions(db, now)
+    detached = detach_old_log_partitions(db, now)
+    archived = archive_jobs(db, now)
+    print(f"Retention: {len(created)} log partitions ensured, {len(detached)} detached {detached}, "
+          f"{archived} jobs archived")
+
+
+if __name__ == "__main__":
+    while True:
+        db = SessionLocal()
+        try:
+            run_retention(db)
+        except Exception as e:
+            db.rollback()
+            print(f"Retention run failed: {e}")
+        finally:
+            db.close()
+        time.sleep(INTERVAL_SECONDS)
@@ -1,13 +1,27 @@
 from sqlalchemy.orm import Session
-from datetime import datetime, timezone
+from sqlalchemy.exc import OperationalError
+from sqlalchemy import Integer, Text, case, cast, column, func, select, update, values
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from datetime import datetime, timedelta, timezone
 from typing import List
 
-from app.models.models import Job, JobDependency
-from app.database import get_db
+from app.models.models import ExecutionLog, Job, JobDependency
+from app.database import get_db, engine, SessionLocal
 from fastapi import Depends
 
+import json
+import os
+import psycopg2
+import socket
 import time
+import select as select_fd
 from app.services.rabbitmq_client import RabbitMQClient
+from app.services.publisher import PublisherPool
+from app.services.job_events import JOB_EVENTS_CHANNEL, JOB_DEPENDENCIES_CHANNEL, notify_job_changes, notify_job_event
+from app.services.dag import CycleError, DependencyGraph
+from app.services.job_state import after_failed_attempt
+from app.services.resources import CapacityTracker, PLACEMENT_STRATEGIES
+from app.services.lanes import DISPATCH_QUEUES, LANES
 
 # Initialize RabbitMQ client
 rabbitmq_client = RabbitMQClient()
@@ -18,6 +32,33 @@ if rabbitmq_client.connection and rabbitmq_client.channel:
     rabbitmq_client.declare_exchange(RabbitMQClient.JOB_DISPATCH_EXCHANGE)
     rabbitmq_client.declare_queue(RabbitMQClient.JOB_DISPATCH_QUEUE, arguments={'x-max-priority': 10})
     rabbitmq_client.bind_queue(RabbitMQClient.JOB_DISPATCH_QUEUE, RabbitMQClient.JOB_DISPATCH_EXCHANGE, "job.dispatch.*")
+    if DISPATCH_QUEUES == "lanes":
+        # no x-max-priority, the workers choose between the lanes
+        for lane in LANES:
+            rabbitmq_client.declare_queue(RabbitMQClient.lane_dispatch_queue(lane))
+            rabbitmq_client.bind_queue(RabbitMQClient.lane_dispatch_queue(lane), RabbitMQClient.JOB_DISPATCH_EXCHANGE,
+                                       RabbitMQClient.LANE_DISPATCH_ROUTING_KEY.format(lane=lane.lower(), job_id="*"))
+
+# Jobs are published through their own pooled connections, confirmed by the
+# broker and reconnected after a failure (rabbitmq_client only sets up the
+# topology and reads heartbeats).
+publisher = PublisherPool()
+
+# Resource-aware placement: "first_fit" / "best_fit" place each job on a worker
+# with enough free cpu_units / memory_mb, as reported by the worker heartbeats.
+# "none" publishes every ready job to the shared dispatch queue.
+PLACEMENT = os.getenv("SCHEDULER_PLACEMENT", "none")
+# How often to re-check capacity while jobs are waiting for room.
+CAPACITY_RECHECK_SECONDS = float(os.getenv("SCHEDULER_CAPACITY_RECHECK_SECONDS", 2))
+
+capacity_tracker = CapacityTracker()
+heartbeat_queue = None
+if rabbitmq_client.connection and rabbitmq_client.channel and PLACEMENT in PLACEMENT_STRATEGIES:
+    # every replica keeps its own view of worker capacity
+    rabbitmq_client.declare_exchange(RabbitMQClient.JOB_MONITORING_EXCHANGE)
+    heartbeat_queue = rabbitmq_client.declare_exclusive_queue()
+    rabbitmq_client.bind_queue(heartbeat_queue, RabbitMQClient.JOB_MONITORING_EXCHANGE,
+                               RabbitMQClient.WORKER_HEARTBEAT_ROUTING_KEY.format(worker_id="*"))
 
 # in this file we will rread db and get all uncompleted jobs 
 # whose run time is less than equal to current time.
@@ -26,55 +67,445 @@ if rabbitmq_client.connection and rabbitmq_client.channel:
 
 # so there are 2 modules here. one will add in queue other will dispatch
 
+# Jobs in these states are the only ones the scheduler has to look at.
+# queued / running / failed / cancelled / completed rows are never rescanned.
+SCHEDULABLE_STATUSES = ("waiting", "ready", "retrying")
+
 # 1. read the db and get all uncompleted jobs
 def get_uncompleted_jobs(db: Session = Depends(get_db)) -> List[Job]:
     current_time = datetime.now(timezone.utc)
-    jobs = db.query(Job).filter(
-        Job.status != "completed",
-        Job.run_at <= current_time
+
+    # Every job keeps a counter of parents that are not completed yet
+    # (see services/job_state.py:complete_job), so readiness is an indexed
+    # lookup on ix_jobs_ready_run_at instead of a walk over job_dependencies.
+    return db.query(Job).filter(
+        Job.status.in_(SCHEDULABLE_STATUSES),
+        Job.unmet_dependencies == 0,
+        Job.run_at <= current_time,
+    ).all()
+
+# 2. wait until there may be something to run
+# Upper bound on how long the scheduler sleeps without any event; a safety net
+# for notifications lost while the listener connection was down.
+MAX_IDLE_SECONDS = float(os.getenv("SCHEDULER_MAX_IDLE_SECONDS", 10))
+
+def open_job_events_listener():
+    # Dedicated autocommit connection: notifications are only delivered
+    # to a connection that is not inside a transaction.
+    listen_conn = engine.raw_connection()
+    listen_conn.dbapi_connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    cursor = listen_conn.cursor()
+    cursor.execute(f"LISTEN {JOB_EVENTS_CHANNEL}")
+    cursor.execute(f"LISTEN {JOB_DEPENDENCIES_CHANNEL}")
+    cursor.close()
+    return listen_conn
+
+def seconds_until_next_run(db: Session) -> float:
+    # Nearest future run_at among jobs that are otherwise ready, or the nearest
+    # claim lease to expire. Both are served by partial indexes
+    # (ix_jobs_ready_run_at, ix_jobs_claim_lease), so this stays cheap with a large backlog.
+    current_time = datetime.now(timezone.utc)
+    next_run_at = db.query(func.min(Job.run_at)).filter(
+        Job.status.in_(SCHEDULABLE_STATUSES),
+        Job.unmet_dependencies == 0,
+        Job.run_at > current_time,
+    ).scalar()
+    next_lease_expiry = db.query(func.min(Job.lease_expires_at)).filter(
+        Job.status == "claimed",
+    ).scalar()
+    db.commit() # don't keep a transaction open while we sleep
+
+    wake_ups = [at for at in (next_run_at, next_lease_expiry) if at is not None]
+    if not wake_ups:
+        return MAX_IDLE_SECONDS
+    return min(max((min(wake_ups) - current_time).total_seconds(), 0), MAX_IDLE_SECONDS)
+
+def wait_for_job_events(listen_conn, timeout: float) -> list:
+    # Block until a job event arrives or the timeout elapses.
+    # Returns the notifications drained; any number of them is one wake up.
+    dbapi_conn = listen_conn.dbapi_connection
+    if not dbapi_conn.notifies:
+        ready, _, _ = select_fd.select([dbapi_conn], [], [], timeout)
+        if not ready:
+            return []
+    dbapi_conn.poll()
+    received = list(dbapi_conn.notifies)
+    dbapi_conn.notifies.clear()
+    return received
+
+# Critical paths: every replica keeps the dependency graph of the jobs still
+# waiting for a parent (services/dag.py), loaded from job_dependencies and
+# extended with the edges of each job submitted since (job_dependencies
+# notifications). Lengths that grow are written to jobs.critical_path, which
+# the claim orders by within a priority. They are never lowered: a job's chain
+# of dependants cannot shrink before it has run. Reloading the graph every
+# GRAPH_RELOAD_SECONDS drops the jobs that have run.
+GRAPH_RELOAD_SECONDS = float(os.getenv("SCHEDULER_GRAPH_RELOAD_SECONDS", 300))
+CRITICAL_PATH_WRITE_BATCH = 10000
+
+dependency_graph = DependencyGraph()
+
+def blocked_edges():
+    return (
+        select(JobDependency.depends_on_id, JobDependency.dependant_id)
+        .join(Job, Job.id == JobDependency.dependant_id)
+        .where(Job.status == "waiting", Job.unmet_dependencies > 0)
+    )
+
+def save_critical_paths(db: Session, lengths: dict):
+    items = list(lengths.items())
+    for start in range(0, len(items), CRITICAL_PATH_WRITE_BATCH):
+        chunk = values(column("id", Integer), column("length", Integer), name="lengths").data(
+            items[start:start + CRITICAL_PATH_WRITE_BATCH]
+        )
+        db.execute(
+            update(Job)
+            .where(Job.id == chunk.c.id, Job.critical_path < chunk.c.length)
+            .values(critical_path=chunk.c.length)
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+
+def add_edges(graph: DependencyGraph, edges):
+    for error in graph.add_edges(edges, skip_cycles=True):
+        # only edges written around the API can do this, the jobs on it never run
+        print(f"Ignoring dependency of job {error.cycle[1]} on job {error.cycle[0]}: {error}")
+
+def load_dependency_graph(db: Session):
+    global dependency_graph
+    edges = db.execute(blocked_edges()).all()
+    try:
+        graph = DependencyGraph.load(edges)
+    except CycleError:
+        graph = DependencyGraph()
+        add_edges(graph, edges)
+    dependency_graph = graph
+    save_critical_paths(db, graph.take_changed())
+
+def add_dependants(db: Session, job_pks: List[int]):
+    # edges of jobs submitted since the graph was loaded
+    edges = db.execute(
+        select(JobDependency.depends_on_id, JobDependency.dependant_id)
+        .where(JobDependency.dependant_id.in_(job_pks))
     ).all()
-    
-    # Filter jobs that have all dependencies fulfilled
-    uncompleted_jobs = []
+    add_edges(dependency_graph, edges)
+    save_critical_paths(db, dependency_graph.take_changed())
+
+def new_dependants(notifications) -> List[int]:
+    return [
+        job_pk
+        for notification in notifications if notification.channel == JOB_DEPENDENCIES_CHANNEL
+        for job_pk in json.loads(notification.payload)["job_ids"]
+    ]
+
+# 3. publish ready jobs to the dispatch exchange
+# "batch": claim a batch with one UPDATE ... RETURNING, publish it in one broker
+#          transaction, then mark the whole batch queued.
+# "single": publish and commit job by job (the original behaviour).
+DISPATCH_MODE = os.getenv("SCHEDULER_DISPATCH_MODE", "batch")
+BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", 500))
+
+# Several scheduler replicas can run side by side, each one claims disjoint
+# batches under its own id. A claim is only valid for LEASE_SECONDS, after
+# that any replica may hand it back to the pool.
+SCHEDULER_ID = os.getenv("SCHEDULER_ID", f"{socket.gethostname()}-{os.getpid()}")
+LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", 30))
+
+# Largest share of a batch that retries may take.
+RETRY_SHARE = float(os.getenv("SCHEDULER_RETRY_SHARE", 0.25))
+
+# Map job priority to RabbitMQ message priority (1-10, 10 being highest)
+PRIORITY_MAP = {
+    "Critical": 10,
+    "High": 7,
+    "Normal": 4,
+    "Low": 1
+}
+
+# Dispatch messages are a slim envelope: what a worker needs to accept the job
+# (resources) and to run it. A payload up to INLINE_PAYLOAD_BYTES (as JSON)
+# travels in the message, a larger one is read by the worker from the job row
+# when it starts the job, so it never goes through the scheduler or the broker.
+INLINE_PAYLOAD_BYTES = int(os.getenv("SCHEDULER_INLINE_PAYLOAD_BYTES", 2048))
+
+def dispatch_message(job, inline: bool = False, payload=None) -> dict:
+    # job: a Job, or a row returned by claim_ready_jobs
+    message = {
+        "job_id": str(job.job_id),
+        "type": job.type,
+        "attempt": (job.times_attempted or 0) + 1,
+        "timeout": job.timeout,
+        "cpu_units": job.cpu_units,
+        "memory_mb": job.memory_mb,
+        # the worker's lane and queue wait metrics
+        "priority": job.priority,
+        "queued_at": time.time(),
+    }
+    if inline:
+        message["payload"] = payload
+    return message
+
+def dispatch_routing_key(job, queues: str = DISPATCH_QUEUES) -> str:
+    # shared dispatch: the single priority queue, or the queue of the job's lane
+    if queues == "lanes":
+        lane = job.priority if job.priority in LANES else "Normal"
+        return RabbitMQClient.LANE_DISPATCH_ROUTING_KEY.format(lane=lane.lower(), job_id=job.job_id)
+    return f"job.dispatch.{job.job_id}"
+
+def dispatch_jobs(db: Session, jobs: List[Job]):
     for job in jobs:
-        dependencies = db.query(JobDependency).filter(JobDependency.dependant_id == job.id).all()
-        if not dependencies or all(dep.depends_on.status == "completed" for dep in dependencies):
-            uncompleted_jobs.append(job)
-    
-    return uncompleted_jobs
+        print(f"Scheduling job: {job.job_name} with ID: {job.job_id}")
+
+        message_priority = PRIORITY_MAP.get(job.priority, 4) # Default to Normal (4)
+
+        # Publish job to RabbitMQ, a job the broker did not confirm stays ready
+        if not publisher.publish_message(
+            exchange_name=RabbitMQClient.JOB_DISPATCH_EXCHANGE,
+            routing_key=dispatch_routing_key(job),
+            message=dispatch_message(job), # payload by reference
+            priority=message_priority
+        ):
+            continue
+
+        # Update job status to "queued"
+        job.status = "queued"
+        db.add(job)
+        notify_job_changes(db, [job.job_id])
+        db.commit()
+        db.refresh(job)
+
+def ready_job_ids(statuses, limit: int, current_time: datetime):
+    return (
+        select(Job.id)
+        .where(
+            Job.status.in_(statuses),
+            Job.unmet_dependencies == 0,
+            Job.run_at <= current_time,
+        )
+        .order_by(Job.priority, Job.critical_path.desc(), Job.run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+
+def claim_order(job):
+    # ready_job_ids' ORDER BY for claimed rows (no priority sorts last, as NULLs do there)
+    return -PRIORITY_MAP.get(job.priority, 0), -(job.critical_path or 0), job.run_at
+
+def claim_ready_jobs(db: Session, batch_size: int = BATCH_SIZE, scheduler_id: str = SCHEDULER_ID) -> list:
+    # Claim a batch of ready jobs for this replica.
+    # FOR UPDATE SKIP LOCKED makes concurrent replicas take disjoint batches
+    # instead of waiting on (or double-reading) each other's rows.
+    # Retries take at most RETRY_SHARE of a batch, the rest is left to new
+    # work, so a failure storm can't crowd everything else out.
+    # Returns rows of what dispatching needs: the payload only when it is
+    # small enough to go inline (inline_payload), never the results. They are
+    # in claim order, retries and new work together: RETURNING gives rows back
+    # in whatever order the UPDATE visited them, not the subquery's.
+    current_time = datetime.now(timezone.utc)
+    inline = func.coalesce(func.octet_length(cast(Job.payload, Text)) <= INLINE_PAYLOAD_BYTES, True)
+    claim = lambda ids: db.execute(
+        update(Job)
+        .where(Job.id.in_(ids))
+        .values(
+            status="claimed",
+            claimed_by=scheduler_id,
+            lease_expires_at=current_time + timedelta(seconds=LEASE_SECONDS),
+            modified_time=current_time,
+        )
+        .returning(Job.id, Job.job_id, Job.type, Job.priority, Job.critical_path, Job.run_at, Job.times_attempted,
+                   Job.timeout, Job.cpu_units, Job.memory_mb, inline.label("inline_payload"),
+                   case((inline, Job.payload)).label("payload"))
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    retry_limit = max(1, int(batch_size * RETRY_SHARE))
+    jobs = claim(ready_job_ids(("retrying",), retry_limit, current_time))
+    if len(jobs) < batch_size:
+        jobs += claim(ready_job_ids(("waiting", "ready"), batch_size - len(jobs), current_time))
+    jobs.sort(key=claim_order)
+    notify_job_changes(db, [job.job_id for job in jobs])
+    db.commit()
+    return jobs
+
+def finish_claim(db: Session, job_ids: List[int], scheduler_id: str, status: str):
+    # Settle our own claims. Rows whose lease expired and were taken over by
+    # another replica no longer match claimed_by and are left alone.
+    settled = db.execute(
+        update(Job)
+        .where(Job.id.in_(job_ids), Job.status == "claimed", Job.claimed_by == scheduler_id)
+        .values(status=status, claimed_by=None, lease_expires_at=None, modified_time=datetime.now(timezone.utc))
+        .returning(Job.job_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    notify_job_changes(db, settled)
+    db.commit()
+
+def release_expired_claims(db: Session) -> int:
+    # Jobs claimed by a replica that died (or stopped heartbeating) go back to the pool.
+    # A released job has no unmet dependencies by construction, so it is "ready".
+    released = db.execute(
+        update(Job)
+        .where(Job.status == "claimed", Job.lease_expires_at < datetime.now(timezone.utc))
+        .values(status="ready", claimed_by=None, lease_expires_at=None)
+        .returning(Job.job_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    notify_job_changes(db, released)
+    db.commit()
+    if released:
+        print(f"Released {len(released)} jobs with an expired scheduler lease")
+    return len(released)
+
+def release_expired_runs(db: Session) -> int:
+    # Running jobs whose worker stopped renewing their lease (see
+    # job_state.RUN_LEASE_SECONDS): the attempt counts as failed, as fail_job
+    # records one, backoff included. A job that takes its worker down (out of
+    # memory, a crash) then waits before it is handed to the next one.
+    # The lost attempt gets an execution log of its own, written here since
+    # no worker will send it.
+    current_time = datetime.now(timezone.utc)
+    expired = db.execute(
+        select(Job.id, Job.job_id, Job.run_at, Job.times_attempted, Job.max_attempts, Job.initial_delay,
+               Job.backoff_multiplier, Job.cpu_units, Job.memory_mb)
+        .where(Job.status == "running", Job.lease_expires_at < func.now())
+        .with_for_update(skip_locked=True)
+    ).all()
+    results = {"error": "Worker stopped renewing the job's lease"}
+    for job in expired:
+        status, run_at = after_failed_attempt(job)
+        db.execute(
+            update(Job)
+            .where(Job.id == job.id)
+            .values(status=status, results=results, run_at=run_at, claimed_by=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.add(ExecutionLog(
+            job_id=job.id,
+            job_uuid=job.job_id,
+            log_timestamp=current_time,
+            message=f"Job failed: {results['error']}",
+            is_successful=False,
+            results=results,
+            cpu_units=job.cpu_units,
+            memory_mb=job.memory_mb,
+            execution_end_time=current_time,
+            attempt_number=job.times_attempted or 1,
+        ))
+        notify_job_event(db, job.job_id, status, run_at if status == "retrying" else None)
+    db.commit()
+    if expired:
+        print(f"Released {len(expired)} running jobs with an expired worker lease")
+    return len(expired)
+
+def refresh_capacity():
+    if heartbeat_queue:
+        for heartbeat in rabbitmq_client.get_messages(heartbeat_queue):
+            capacity_tracker.update(heartbeat)
+    capacity_tracker.expire()
+
+def dispatch_batch(db: Session, batch_size: int = BATCH_SIZE, scheduler_id: str = SCHEDULER_ID,
+                   placement: str = PLACEMENT, queues: str = DISPATCH_QUEUES) -> int:
+    # Claim a batch, publish it, then mark it queued.
+    # Rows are only marked queued after the broker has accepted the batch;
+    # if publishing fails the claims are handed back straight away. A worker
+    # may start a job before then (start_job takes claimed jobs too), those
+    # rows are running and finish_claim skips them.
+    if placement in PLACEMENT_STRATEGIES:
+        refresh_capacity()
+        if not capacity_tracker.has_capacity():
+            return 0
+
+    jobs = claim_ready_jobs(db, batch_size, scheduler_id)
+    if not jobs:
+        return 0
+
+    if placement in PLACEMENT_STRATEGIES:
+        # Jobs come back in claim order, so packing is priority-ordered too.
+        # Whatever does not fit anywhere goes straight back to the pool.
+        placed, unplaced = capacity_tracker.place(jobs, placement)
+        if unplaced:
+            finish_claim(db, [job.id for job in unplaced], scheduler_id, "ready")
+        routes = [
+            (job, RabbitMQClient.WORKER_DISPATCH_ROUTING_KEY.format(worker_id=worker_id))
+            for job, worker_id in placed
+        ]
+    else:
+        routes = [(job, dispatch_routing_key(job, queues)) for job in jobs]
+    if not routes:
+        return 0
+
+    job_ids = [job.id for job, _ in routes]
+    messages = [
+        (routing_key, dispatch_message(job, job.inline_payload, job.payload), PRIORITY_MAP.get(job.priority, 4))
+        for job, routing_key in routes
+    ]
+    if not publisher.publish_batch(RabbitMQClient.JOB_DISPATCH_EXCHANGE, messages):
+        finish_claim(db, job_ids, scheduler_id, "ready")
+        return 0
+
+    finish_claim(db, job_ids, scheduler_id, "queued")
+    print(f"Dispatched batch of {len(job_ids)} jobs")
+    return len(job_ids)
+
+def dispatch_ready_jobs(db: Session):
+    if DISPATCH_MODE == "single":
+        dispatch_jobs(db, get_uncompleted_jobs(db))
+        return
+    # keep going until nothing more can be dispatched; a batch may come back
+    # short because of the retry share, not only because the backlog is drained
+    while dispatch_batch(db):
+        pass
+
+def close_quietly(listen_conn):
+    try:
+        listen_conn.close()
+    except Exception:
+        pass # the connection is broken already
+
+# How long to wait before reconnecting after the database went away.
+RECONNECT_SECONDS = float(os.getenv("SCHEDULER_RECONNECT_SECONDS", 5))
 
 # now main function which will continue to run and check for uncompleted jobs
 def schedule_jobs(db: Session = Depends(get_db)):
-    while True:
-        uncompleted_jobs = get_uncompleted_jobs(db)
-        for job in uncompleted_jobs:
-            # Here you would add the job to the queue for processing
-            # For example, using a message broker or a task queue
-            print(f"Scheduling job: {job.job_name} with ID: {job.job_id}")
-            
-            # Map job priority to RabbitMQ message priority (1-10, 10 being highest)
-            priority_map = {
-                "Critical": 10,
-                "High": 7,
-                "Normal": 4,
-                "Low": 1
-            }
-            message_priority = priority_map.get(job.priority, 4) # Default to Normal (4)
-            
-            # Publish job to RabbitMQ
-            rabbitmq_client.publish_message(
-                exchange_name=RabbitMQClient.JOB_DISPATCH_EXCHANGE,
-                routing_key=f"job.dispatch.{job.job_id}",
-                message=job.to_dict(), # Assuming job object can be converted to a dictionary
-                priority=message_priority
-            )
-            
-            # Update job status to "queued"
-            job.status = "queued"
-            db.add(job)
-            db.commit()
-            db.refresh(job)
-            
-            
-        # Sleep for a while before checking again
-        time.sleep(10)  # Adjust the sleep time as needed
+    listen_conn = None
+    graph_loaded_at = None
+    dependants = []
+    try:
+        while True:
+            try:
+                if listen_conn is None:
+                    # LISTEN before the first scan, so a job submitted while we are
+                    # dispatching still wakes us up on the next wait.
+                    listen_conn = open_job_events_listener()
+                if graph_loaded_at is None or time.monotonic() - graph_loaded_at >= GRAPH_RELOAD_SECONDS:
+                    load_dependency_graph(db)
+                    graph_loaded_at = time.monotonic()
+                elif dependants:
+                    add_dependants(db, dependants)
+                release_expired_claims(db)
+                release_expired_runs(db)
+                dispatch_ready_jobs(db)
+                # Sleep until a job is submitted / changes status, or until the
+                # nearest future run_at, whichever comes first.
+                timeout = seconds_until_next_run(db)
+                if PLACEMENT in PLACEMENT_STRATEGIES:
+                    timeout = min(timeout, CAPACITY_RECHECK_SECONDS)
+                dependants = new_dependants(wait_for_job_events(listen_conn, timeout))
+            except (OperationalError, psycopg2.Error) as e:
+                # Postgres restarted or failed over. Notifications sent meanwhile
+                # are lost: once reconnected the graph is reloaded and the next
+                # pass dispatches everything that is ready, as at startup.
+                print(f"Database connection lost, reconnecting in {RECONNECT_SECONDS}s: {e!r}")
+                db.rollback()
+                if listen_conn is not None:
+                    close_quietly(listen_conn)
+                    listen_conn = None
+                graph_loaded_at = None
+                dependants = []
+                time.sleep(RECONNECT_SECONDS)
+    finally:
+        if listen_conn is not None:
+            listen_conn.close()
+
+if __name__ == "__main__":
+    schedule_jobs(SessionLocal())
@@ -0,0 +1,313 @@
+import asyncio
+import os
+import uuid
+from collections import defaultdict, deque
+from typing import Iterable, List, Optional
+
+from sqlalchemy import case, func, select
+
+from database import AsyncSessionLocal
+from models.models import ExecutionLog, Job
+from services.rabbitmq_client import AsyncRabbitMQClient, RabbitMQClient
+
+# Live execution log stream for GET /jobs/stream.
+#
+# One subscriber per API process consumes job_logs_stream_exchange (fed by the
+# log writer once rows are committed) and fans every event out to the
+# connected sockets. Each socket has a bounded queue: a client that reads
+# slower than events arrive loses its oldest events, it never holds back the
+# hub or the other clients.
+#
+# The subscriber (AsyncRabbitMQClient) runs on the API's event loop and hands
+# every event to the hub directly.
+#
+# Every event carries a sequence number, `seq` (its execution_logs.id), and the
+# hub keeps the most recent ones in a ring buffer. A client reconnecting with
+# ?since=<seq> is replayed what it missed from memory. Only a gap older than
+# the buffer is read from execution_logs, by primary key range, a page at a
+# time with a few such queries at once. After a restart the buffer is loaded
+# once (one query shared by every client reconnecting at that moment).
+
+CLIENT_QUEUE_SIZE = int(os.getenv("STREAM_CLIENT_QUEUE_SIZE", 256))
+RECONNECT_SECONDS = float(os.getenv("STREAM_RECONNECT_SECONDS", 5))
+REPLAY_BUFFER_SIZE = int(os.getenv("STREAM_REPLAY_BUFFER_SIZE", 10000))
+REPLAY_MAX_ROWS = int(os.getenv("STREAM_REPLAY_MAX_ROWS", 1000))          # per database replay page
+REPLAY_CONCURRENCY = int(os.getenv("STREAM_REPLAY_CONCURRENCY", 2))       # database replays at once
+
+
+def log_event(log: ExecutionLog, job_type: str, status: str) -> dict:
+    # a stored row as the event the log writer published for it. The job's
+    # status after that attempt is derived the way fail_job decides it.
+    return {
+        "id": log.id,
+        "job_id": log.job_id,
+        "job_uuid": str(log.job_uuid),
+        "log_timestamp": log.log_timestamp.isoformat(),
+        "message": log.message,
+        "duration_seconds": None if log.duration_seconds is None else float(log.duration_seconds),
+        "is_successful": log.is_successful,
+        "results": log.results,
+        "cpu_units": log.cpu_units,
+        "memory_mb": log.memory_mb,
+        "execution_start_time": log.execution_start_time and log.execution_start_time.isoformat(),
+        "execution_end_time": log.execution_end_time and log.execution_end_time.isoformat(),
+        "attempt_number": log.attempt_number,
+        "type": job_type,
+        "status": status,
+    }
+
+
+async def fetch_events(after: Optional[int] = None, before: Optional[int] = None, job_ids=None,
+                       limit: int = REPLAY_MAX_ROWS, newest: bool = False) -> List[dict]:
+    # events with after < seq < before, oldest first (the newest `limit` ones with newest=True)
+    status = case(
+        (ExecutionLog.is_successful, "completed"),
+        (ExecutionLog.attempt_number < func.coalesce(Job.max_attempts, 1), "retrying"),
+        else_="failed",
+    )
+    query = select(ExecutionLog, Job.type, status).join(Job, Job.id == ExecutionLog.job_id)
+    if after is not None:
+        query = query.where(ExecutionLog.id > after)
+    if before is not None:
+        query = query.where(ExecutionLog.id < before)
+    if job_ids is not None:
+        query = query.where(ExecutionLog.job_uuid.in_([uuid.UUID(job_id) for job_id in job_ids]))
+    query = query.order_by(ExecutionLog.id.desc() if newest else ExecutionLog.id).limit(limit)
+    async with AsyncSessionLocal() as db:
+        events = [log_event(*row) for row in await db.execute(query)]
+    return events[::-1] if newest else events
+
+
+class Subscription:
+    def __init__(self, job_ids=None, statuses=None, types=None, queue_size=CLIENT_QUEUE_SIZE):
+        # None accepts any value
+        self.job_ids = job_ids
+        self.statuses = statuses
+        self.types = types
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = 0
+
+    def matches(self, event: dict) -> bool:
+        return (
+            (self.job_ids is None or event.get("job_uuid") in self.job_ids)
+            and (self.statuses is None or event.get("status") in self.statuses)
+            and (self.types is None or event.get("type") in self.types)
+        )
+
+    def offer(self, event: dict):
+        # never waits: a full queue loses its oldest event
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class StreamHub:
+    def __init__(self, queue_size=CLIENT_QUEUE_SIZE, buffer_size=REPLAY_BUFFER_SIZE, fetch=fetch_events):
+        self.queue_size = queue_size
+        # recent events in seq order, with every event after `complete_after`
+        # (None: not known yet, the buffer has not been loaded)
+        self.buffer = deque()
+        self.buffer_size = buffer_size
+        self.complete_after = None
+        self.loading = None
+        self.fetch = fetch
+        self.replay_slots = asyncio.Semaphore(REPLAY_CONCURRENCY)
+        self.replayed_from_memory = 0
+        self.replayed_from_database = 0
+        # Subscriptions are indexed by their most selective filter, so an event
+        # only visits the ones that can want it: job_id, then type, then status.
+        self.by_job = defaultdict(set)
+        self.by_type = defaultdict(set)
+        self.by_status = defaultdict(set)
+        self.unfiltered = set()
+        self.subscriptions = 0
+        self.events = 0
+        self.loop = None
+        self.consumer = None
+
+    def index(self, subscription: Subscription):
+        if subscription.job_ids is not None:
+            return self.by_job, subscription.job_ids
+        if subscription.types is not None:
+            return self.by_type, subscription.types
+        if subscription.statuses is not None:
+            return self.by_status, subscription.statuses
+        return None, None
+
+    def subscribe(self, job_ids: Optional[Iterable[str]] = None, statuses: Optional[Iterable[str]] = None,
+                  types: Optional[Iterable[str]] = None) -> Subscription:
+        subscription = Subscription(
+            None if job_ids is None else frozenset(job_ids),
+            None if statuses is None else frozenset(statuses),
+            None if types is None else frozenset(types),
+            self.queue_size,
+        )
+        index, keys = self.index(subscription)
+        if index is None:
+            self.unfiltered.add(subscription)
+        else:
+            for key in keys:
+                index[key].add(subscription)
+        self.subscriptions += 1
+        self.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        index, keys = self.index(subscription)
+        if index is None:
+            self.unfiltered.discard(subscription)
+        else:
+            for key in keys:
+                index[key].discard(subscription)
+                if not index[key]:
+                    del index[key]
+        self.subscriptions -= 1
+
+    def remember(self, event: dict):
+        # Events arrive in seq order (the log writers commit and publish in id
+        # order), except the ones also loaded from the database, and rarely
+        # two writers' events crossing on the broker: those are put in place.
+        position = len(self.buffer)
+        while position and self.buffer[position - 1]["seq"] >= event["seq"]:
+            if self.buffer[position - 1]["seq"] == event["seq"]:
+                return # already loaded from the database
+            position -= 1
+        if self.complete_after is not None and event["seq"] <= self.complete_after:
+            return # older than the buffer, replays read it from the database
+        self.buffer.insert(position, event)
+        if len(self.buffer) > self.buffer_size:
+            evicted = self.buffer.popleft()
+            if self.complete_after is not None:
+                self.complete_after = evicted["seq"]
+
+    def publish(self, event: dict):
+        # on the event loop
+        self.events += 1
+        event["seq"] = event["id"]
+        self.remember(event)
+        for subscription in self.unfiltered:
+            subscription.offer(event)
+        for index, key in ((self.by_job, event.get("job_uuid")), (self.by_type, event.get("type")),
+                           (self.by_status, event.get("status"))):
+            for subscription in index.get(key, ()):
+                if subscription.matches(event):
+                    subscription.offer(event)
+
+    async def load(self):
+        # Fill the buffer with the newest stored events, once. Clients
+        # reconnecting together (after a deploy) all wait for the same query.
+        if self.loading is None:
+            self.loading = asyncio.ensure_future(self.fetch(limit=self.buffer_size, newest=True))
+        try:
+            stored = await asyncio.shield(self.loading)
+        except Exception:
+            self.loading = None # let the next client try again
+            raise
+        if self.complete_after is not None:
+            return
+        first_live = self.buffer[0]["seq"] if self.buffer else None
+        merged = [event for event in stored if first_live is None or event["id"] < first_live]
+        for event in merged:
+            event["seq"] = event["id"]
+        merged += self.buffer
+        # fewer rows than asked for: that is the whole table
+        self.complete_after = merged[0]["seq"] - 1 if len(stored) == self.buffer_size else 0
+        if len(merged) > self.buffer_size:
+            self.complete_after = merged[-self.buffer_size - 1]["seq"]
+            merged = merged[-self.buffer_size:]
+        self.buffer = deque(merged)
+
+    async def replay(self, subscription: Subscription, since: int):
+        # the events after `since` the subscription wants, oldest first
+        if self.complete_after is None:
+            await self.load()
+        after = since
+        if after < self.complete_after:
+            self.replayed_from_database += 1
+        else:
+            self.replayed_from_memory += 1
+        # Older than the buffer: primary key range queries, a few at a time, a
+        # page of REPLAY_MAX_ROWS each until the buffer is reached (it may
+        # move on meanwhile, the loop follows it).
+        while after < self.complete_after:
+            before = self.complete_after + 1
+            async with self.replay_slots:
+                page = await self.fetch(after=after, before=before, job_ids=subscription.job_ids,
+                                        limit=REPLAY_MAX_ROWS)
+            for event in page:
+                event["seq"] = event["id"]
+                if subscription.matches(event):
+                    yield event
+            # a short page: nothing else before `before`
+            after = page[-1]["seq"] if len(page) == REPLAY_MAX_ROWS else before - 1
+        # never send an event twice
+        for event in [event for event in list(self.buffer) if event["seq"] > after]:
+            if subscription.matches(event):
+                yield event
+
+    def publish_threadsafe(self, event: dict):
+        # publish from another thread
+        self.loop.call_soon_threadsafe(self.publish, event)
+
+    def start(self):
+        # the broker subscription is opened with the first client
+        if self.consumer is None:
+            self.loop = asyncio.get_running_loop()
+            self.consumer = StreamConsumer(self)
+            self.consumer.start()
+
+    async def stop(self):
+        if self.consumer is not None:
+            await self.consumer.stop()
+            self.consumer = None
+        # both belong to the event loop that is going away
+        self.loading = None
+        self.replay_slots = asyncio.Semaphore(REPLAY_CONCURRENCY)
+
+
+class StreamConsumer:
+    def __init__(self, hub: StreamHub):
+        self.hub = hub
+        self.client = None
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    async def run(self):
+        while True:
+            self.client = AsyncRabbitMQClient()
+            try:
+                await self.client.connect()
+                await self.consume()
+            except Exception as e:
+                # broker errors, and anything else (a bad event, a bug in the
+                # fan-out): this task is the only feed of every socket, it must
+                # come back whatever went wrong
+                print(f"Stream consumer error: {e!r}")
+            finally:
+                await self.client.close()
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    async def consume(self):
+        await self.client.declare_exchange(RabbitMQClient.JOB_LOGS_STREAM_EXCHANGE)
+        # a queue of our own, gone with the connection: nothing piles up while
+        # the API is down, the database has the history
+        queue = await self.client.declare_exclusive_queue()
+        await self.client.bind_queue(queue, RabbitMQClient.JOB_LOGS_STREAM_EXCHANGE, "job.logs.stream.#")
+        async for delivery in self.client.consume(queue, auto_ack=True):
+            try:
+                event = delivery.decode()
+            except ValueError:
+                continue
+            self.hub.publish(event)
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+
+# the process wide hub
+stream_hub = StreamHub()
@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional
+
+# Task registry: maps Job.type to the function that runs it.
+#
+#   @task("resize_image", backend="process")
+#   def resize_image(payload):
+#       ...
+#
+# Every task picks the backend it runs on:
+#   async    a coroutine awaited on the worker's event loop (I/O bound work)
+#   thread   a blocking function run on the worker's thread pool
+#   process  a blocking function run on a process pool, for CPU bound work
+#            that would otherwise fight over the GIL
+#
+# The decorator returns the function unchanged, so process tasks are pickled
+# by reference (module + name) and only the payload crosses the process
+# boundary.
+
+BACKENDS = ("async", "thread", "process")
+
+PROCESS_WORKERS = int(os.getenv("WORKER_PROCESSES", os.cpu_count() or 1))
+
+
+class TaskError(Exception):
+    pass
+
+
+class Task:
+    def __init__(self, name: str, func: Callable, backend: str, timeout: Optional[float]):
+        self.name = name
+        self.func = func
+        self.backend = backend
+        self.timeout = timeout # default when the job has no timeout of its own
+
+    async def execute(self, payload, thread_pool=None, process_pool=None):
+        started = time.perf_counter()
+        print(f"Task '{self.name}' started on {self.backend} backend")
+        try:
+            if self.backend == "async":
+                result = await self.func(payload)
+            else:
+                pool = thread_pool if self.backend == "thread" else process_pool
+                loop = asyncio.get_running_loop()
+                # a timeout cancels the wait; a thread or process already running
+                # the body runs to completion
+                result = await loop.run_in_executor(pool, self.func, payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Task '{self.name}' failed after {time.perf_counter() - started:.3f}s: {e}")
+            raise
+        print(f"Task '{self.name}' finished in {time.perf_counter() - started:.3f}s")
+        return result
+
+
+class TaskRegistry:
+    def __init__(self):
+        self.tasks: Dict[str, Task] = {}
+
+    def task(self, name: str, backend: str = "async", timeout: Optional[float] = None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown task backend '{backend}', expected one of {BACKENDS}")
+
+        def register(func):
+            if name in self.tasks:
+                raise ValueError(f"Task '{name}' is already registered")
+            if backend == "async" and not asyncio.iscoroutinefunction(func):
+                raise TypeError(f"Task '{name}' uses the async backend but is not a coroutine function")
+            if backend != "async" and asyncio.iscoroutinefunction(func):
+                raise TypeError(f"Task '{name}' is a coroutine function, use the async backend")
+            self.tasks[name] = Task(name, func, backend, timeout)
+            return func
+        return register
+
+    def get(self, name: str) -> Task:
+        if name not in self.tasks:
+            raise TaskError(f"No handler registered for job type '{name}'")
+        return self.tasks[name]
+
+
+registry = TaskRegistry()
+task = registry.task
+
+
+def create_process_pool(max_workers: int = PROCESS_WORKERS) -> ProcessPoolExecutor:
+    # Long lived pool, created once per worker. "spawn" because the worker
+    # process already runs threads, which fork does not copy safely.
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+# Built-in tasks
+
+@task("sleep", backend="async")
+async def sleep_task(payload):
+    # simulated I/O bound work, used for load tests
+    duration = (payload or {}).get("duration_seconds", 1)
+    await asyncio.sleep(duration)
+    return {"slept": duration}
+
+
+@task("checksum", backend="process")
+def checksum_task(payload):
+    # simulated CPU bound work: iterated sha256 over the payload data
+    digest = str((payload or {}).get("data", "")).encode()
+    for _ in range((payload or {}).get("rounds", 100_000)):
+        digest = hashlib.sha256(digest).digest()
+    return {"checksum": digest.hex()}
@@ -0,0 +1,456 @@
+import asyncio
+import importlib
+import os
+import random
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+
+from pika.exceptions import AMQPError
+
+from app.database import SessionLocal
+from app.models.models import ExecutionLog, Job
+from app.services import job_state
+from app.services.lanes import DISPATCH_QUEUES, LANES, LaneScheduler
+from app.services.publisher import RECONNECT_INITIAL_DELAY, RECONNECT_MAX_DELAY
+from app.services.rabbitmq_client import AsyncRabbitMQClient, RabbitMQClient
+from app.services.tasks import registry, create_process_pool
+from app.services.log_writer import log_row
+
+# Worker service: consumes job_dispatch_queue (and its own per-worker queue used
+# by resource-aware placement), runs many jobs at once on an asyncio event loop
+# and acks every message only once its job has finished.
+#
+# With DISPATCH_QUEUES=lanes it consumes one queue per priority instead, and
+# the jobs received wait in a LaneScheduler until a slot is free: the next one
+# to start is a weighted fair choice between the lanes (services/lanes.py).
+#
+# The RabbitMQ connection (AsyncRabbitMQClient) runs on the same event loop as
+# the jobs: deliveries, acks, logs and heartbeats need no thread hand-off.
+
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 32))     # jobs running at once
+PREFETCH = int(os.getenv("WORKER_PREFETCH", CONCURRENCY))  # unacked messages per consumer
+TASK_THREADS = int(os.getenv("WORKER_TASK_THREADS", 8))    # pool for blocking task bodies
+DB_THREADS = int(os.getenv("WORKER_DB_THREADS", 4))        # pool for database calls
+CPU_UNITS = int(os.getenv("WORKER_CPU_UNITS", os.cpu_count() or 1))
+MEMORY_MB = int(os.getenv("WORKER_MEMORY_MB", 4096))
+HEARTBEAT_SECONDS = float(os.getenv("WORKER_HEARTBEAT_SECONDS", 1))
+# "queue": publish execution logs to job_logs_db_queue for the log writer service
+# "direct": insert them together with the job status update
+LOG_MODE = os.getenv("WORKER_LOG_MODE", "queue")
+
+
+# Modules defining @task functions, imported at startup so they register
+# themselves (comma separated, the built-in tasks are always available).
+TASK_MODULES = [name for name in os.getenv("WORKER_TASK_MODULES", "").split(",") if name]
+
+
+class JobStore:
+    """
+    Database side of a job attempt. Every method is blocking and is called
+    from the executor's database thread pool.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    def start(self, job_id, with_payload: bool = True) -> Optional[dict]:
+        # with_payload=False: the dispatch message carried the payload, it is not read again
+        db = self.session_factory()
+        try:
+            job = job_state.start_job(db, job_id, with_payload, WORKER_ID)
+            if job is None:
+                return None
+            return {
+                "id": job.id,
+                "job_id": job.job_id,
+                "type": job.type,
+                "payload": job.payload if with_payload else None,
+                "timeout": job.timeout,
+                "attempt": job.times_attempted,
+                "cpu_units": job.cpu_units,
+                "memory_mb": job.memory_mb,
+            }
+        finally:
+            db.close()
+
+    def renew(self, job_pks) -> int:
+        db = self.session_factory()
+        try:
+            return job_state.renew_run_leases(db, job_pks, WORKER_ID)
+        finally:
+            db.close()
+
+    def finish(self, job: dict, is_successful: bool, results, log: Optional[dict] = None) -> Optional[str]:
+        # `log` is only given when logs are written directly instead of going
+        # through job_logs_db_queue, the row is then part of the same transaction.
+        # Returns the job's new status (None if another attempt got there first).
+        db = self.session_factory()
+        try:
+            if log is not None:
+                db.add(ExecutionLog(**log_row(log)))
+            db_job = db.get(Job, job["id"])
+            if is_successful:
+                return "completed" if job_state.complete_job(db, db_job, results) else None
+            return job_state.fail_job(db, db_job, results)
+        finally:
+            db.close()
+
+
+def execution_log(job: dict, is_successful: bool, message: str, results, started_at, ended_at) -> dict:
+    # one ExecutionLog row, as sent on job_logs_db_queue
+    return {
+        "job_id": job["id"],
+        "job_uuid": str(job["job_id"]),
+        "log_timestamp": ended_at.isoformat(),
+        "message": message,
+        "duration_seconds": (ended_at - started_at).total_seconds(),
+        "is_successful": is_successful,
+        "results": results,
+        "cpu_units": job["cpu_units"],
+        "memory_mb": job["memory_mb"],
+        "execution_start_time": started_at.isoformat(),
+        "execution_end_time": ended_at.isoformat(),
+        "attempt_number": job["attempt"],
+        # not stored, for the live stream's filters
+        "type": job["type"],
+    }
+
+
+class JobExecutor:
+    def __init__(self, store, concurrency=CONCURRENCY, task_threads=TASK_THREADS, db_threads=DB_THREADS,
+                 cpu_units=CPU_UNITS, memory_mb=MEMORY_MB, log_sink=None, lanes: Optional[LaneScheduler] = None):
+        self.store = store
+        # callable publishing a log message, None writes logs with the job update
+        self.log_sink = log_sink
+        self.concurrency = concurrency
+        self.slots = asyncio.Semaphore(concurrency)
+        self.task_pool = ThreadPoolExecutor(max_workers=task_threads, thread_name_prefix="task")
+        self.process_pool = None # created on the first process task
+        self.db_pool = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix="db")
+        self.cpu_units = cpu_units
+        self.memory_mb = memory_mb
+        # resources of every job received and not finished yet, prefetched ones included
+        self.cpu_in_use = 0
+        self.memory_in_use = 0
+        self.in_flight = set()
+        # primary keys of the jobs started here and not finished, their leases are renewed
+        self.running = set()
+        self.lease_renewal = None
+        # priority lanes: received jobs wait here and only start when a slot is free
+        self.lanes = lanes
+
+    def heartbeat(self) -> dict:
+        heartbeat = {
+            "worker_id": WORKER_ID,
+            "cpu_units_free": self.cpu_units - self.cpu_in_use,
+            "memory_mb_free": self.memory_mb - self.memory_in_use,
+            "cpu_units_total": self.cpu_units,
+            "memory_mb_total": self.memory_mb,
+            "running": len(self.in_flight),
+            "sent_at": time.time(),
+        }
+        if self.lanes is not None:
+            heartbeat["lanes"] = self.lanes.stats()
+        return heartbeat
+
+    def submit(self, message: dict, ack):
+        # called on the event loop for every delivery
+        self.cpu_in_use += message.get("cpu_units") or 0
+        self.memory_in_use += message.get("memory_mb") or 0
+        if self.lanes is None:
+            self.start(message, ack)
+            return
+        self.lanes.push(message.get("priority"), (message, ack), message.get("queued_at"))
+        self.start_next()
+
+    def start(self, message: dict, ack):
+        task = asyncio.ensure_future(self.handle(message, ack))
+        self.in_flight.add(task)
+        task.add_done_callback(self.finished)
+
+    def start_next(self):
+        # the choice between the lanes is made as late as possible, when a slot frees up
+        while self.lanes and len(self.in_flight) < self.concurrency:
+            _, (message, ack) = self.lanes.pop()
+            self.start(message, ack)
+
+    def finished(self, task):
+        self.in_flight.discard(task)
+        if self.lanes is not None:
+            self.start_next()
+
+    async def handle(self, message: dict, ack):
+        cpu, memory = message.get("cpu_units") or 0, message.get("memory_mb") or 0
+        requeue = False
+        try:
+            async with self.slots:
+                await self.run(message)
+        except Exception as e:
+            # infrastructure error (database down...), let another delivery try
+            # again. A job that was started is not renewed anymore, the
+            # scheduler retries it once its lease has expired.
+            print(f"Worker error on job {message.get('job_id')}: {e}")
+            requeue = True
+        finally:
+            self.cpu_in_use -= cpu
+            self.memory_in_use -= memory
+            # ack only once the job is done (or was a duplicate), never before
+            ack(requeue)
+
+    async def run(self, message: dict):
+        loop = asyncio.get_running_loop()
+        # small payloads come inline in the dispatch message, large ones are read from the job row
+        inline = "payload" in message
+        job = await loop.run_in_executor(self.db_pool, self.store.start, message["job_id"], not inline)
+        if job is None:
+            print(f"Job {message['job_id']} is not queued anymore, skipping duplicate delivery")
+            return
+        if inline:
+            job["payload"] = message["payload"]
+        self.running.add(job["id"])
+        try:
+            await self.execute(job)
+        finally:
+            self.running.discard(job["id"])
+
+    async def execute(self, job: dict):
+        loop = asyncio.get_running_loop()
+        started_at = datetime.now(timezone.utc)
+        try:
+            task = registry.get(job["type"])
+            timeout = job["timeout"] or task.timeout
+            results = await asyncio.wait_for(self.call_task(task, job), timeout=timeout)
+            is_successful, log_message = True, "Job completed"
+        except asyncio.TimeoutError:
+            results, is_successful = None, False
+            log_message = f"Job timed out after {timeout} seconds"
+        except Exception as e:
+            results, is_successful = {"error": str(e)}, False
+            log_message = f"Job failed: {e}"
+        ended_at = datetime.now(timezone.utc)
+
+        log = execution_log(job, is_successful, log_message, results, started_at, ended_at)
+        log["status"] = await loop.run_in_executor(
+            self.db_pool, self.store.finish, job, is_successful, results, None if self.log_sink else log
+        )
+        if self.log_sink:
+            self.log_sink(log)
+
+    def start_lease_renewal(self, interval: float = job_state.RUN_LEASE_SECONDS / 3):
+        self.lease_renewal = asyncio.ensure_future(self.renew_leases(interval))
+
+    async def renew_leases(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if not self.running:
+                continue
+            try:
+                await loop.run_in_executor(self.db_pool, self.store.renew, list(self.running))
+            except Exception as e:
+                # the next renewal tries again, the lease outlasts a few misses
+                print(f"Renewing job leases failed: {e!r}")
+
+    async def call_task(self, task, job: dict):
+        if task.backend == "process" and self.process_pool is None:
+            self.process_pool = create_process_pool()
+        return await task.execute(job["payload"], self.task_pool, self.process_pool)
+
+    async def drain(self):
+        if self.lanes is not None:
+            # received but not started: back to their queue, another worker takes them
+            while self.lanes:
+                _, (message, ack) = self.lanes.pop()
+                self.cpu_in_use -= message.get("cpu_units") or 0
+                self.memory_in_use -= message.get("memory_mb") or 0
+                ack(True)
+        if self.in_flight:
+            await asyncio.wait(list(self.in_flight))
+        if self.lease_renewal is not None:
+            self.lease_renewal.cancel()
+        self.task_pool.shutdown(wait=False)
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False)
+        self.db_pool.shutdown(wait=True)
+
+
+class DispatchConsumer:
+    """
+    Owns the RabbitMQ connection, on the worker's event loop. Consumes the
+    shared dispatch queue (or every lane queue) and this worker's own queue
+    with prefetch and publishes heartbeats.
+
+    A failed connect or a lost connection is retried with exponential backoff
+    (RABBITMQ_RECONNECT_INITIAL_DELAY up to RABBITMQ_RECONNECT_MAX_DELAY, as
+    the publisher pool does) until stop(). The jobs already running carry on:
+    the deliveries the lost connection had not acked go back to their queue,
+    and a copy of a job that is still running is only acked (start_job runs it once).
+    """
+
+    def __init__(self, executor: JobExecutor, prefetch=PREFETCH, client=None, queues=DISPATCH_QUEUES):
+        self.executor = executor
+        self.prefetch = prefetch
+        self.queues = queues
+        self.client = client or AsyncRabbitMQClient()
+        self.consumers = []
+        self.heartbeats = None
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        # returns once stop() is called
+        own_queue = RabbitMQClient.worker_dispatch_queue(WORKER_ID)
+        delay = 0.0
+        while not self.stopping.is_set():
+            try:
+                await self.client.connect()
+                await self.declare(own_queue)
+                await self.client.set_prefetch(self.prefetch)
+            except Exception as e:
+                print(f"Failed to connect to RabbitMQ: {e!r}")
+            else:
+                delay = 0.0
+                await self.consume_all(own_queue)
+            if self.stopping.is_set():
+                return
+            if self.heartbeats is not None:
+                self.heartbeats.cancel()
+            await self.client.close()
+            delay = min(RECONNECT_MAX_DELAY, max(RECONNECT_INITIAL_DELAY, delay * 2))
+            print(f"Reconnecting to RabbitMQ in {delay:.1f}s")
+            try:
+                await asyncio.wait_for(self.stopping.wait(), delay * random.uniform(0.8, 1.2))
+            except asyncio.TimeoutError:
+                pass
+
+    async def consume_all(self, own_queue):
+        # until stop() or the first consumer to fail (the connection is gone, the broker cancelled it)
+        if self.stopping.is_set():
+            return
+        # prefetch is per consumer: with lanes, each lane keeps up to that many jobs here to choose from
+        self.consumers = [asyncio.ensure_future(self.consume(queue)) for queue in self.shared_queues() + [own_queue]]
+        self.heartbeats = asyncio.ensure_future(self.send_heartbeats())
+        print(f"Worker {WORKER_ID} consuming with prefetch {self.prefetch}, concurrency {self.executor.concurrency}")
+        done, pending = await asyncio.wait(self.consumers, return_when=asyncio.FIRST_COMPLETED)
+        for consumer in pending:
+            consumer.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for consumer in done:
+            if not consumer.cancelled() and consumer.exception() is not None:
+                print(f"Worker stopped consuming: {consumer.exception()!r}")
+
+    def shared_queues(self):
+        if self.queues == "lanes":
+            # the single queue too, what was published there before the switch still runs
+            return [RabbitMQClient.lane_dispatch_queue(lane) for lane in LANES] + [RabbitMQClient.JOB_DISPATCH_QUEUE]
+        return [RabbitMQClient.JOB_DISPATCH_QUEUE]
+
+    async def declare(self, own_queue):
+        await self.client.declare_exchange(RabbitMQClient.JOB_DISPATCH_EXCHANGE)
+        await self.client.declare_exchange(RabbitMQClient.JOB_MONITORING_EXCHANGE)
+        await self.client.declare_exchange(RabbitMQClient.JOB_LOGS_DB_EXCHANGE)
+        await self.client.declare_queue(RabbitMQClient.JOB_DISPATCH_QUEUE, arguments={'x-max-priority': 10})
+        await self.client.bind_queue(RabbitMQClient.JOB_DISPATCH_QUEUE, RabbitMQClient.JOB_DISPATCH_EXCHANGE,
+                                     "job.dispatch.*")
+        if self.queues == "lanes":
+            for lane in LANES:
+                await self.client.declare_queue(RabbitMQClient.lane_dispatch_queue(lane))
+                await self.client.bind_queue(RabbitMQClient.lane_dispatch_queue(lane),
+                                             RabbitMQClient.JOB_DISPATCH_EXCHANGE,
+                                             RabbitMQClient.LANE_DISPATCH_ROUTING_KEY.format(lane=lane.lower(),
+                                                                                             job_id="*"))
+        # durable, so a restarted worker with the same WORKER_ID picks up what was placed on it
+        await self.client.declare_queue(own_queue, arguments={'x-max-priority': 10})
+        await self.client.bind_queue(own_queue, RabbitMQClient.JOB_DISPATCH_EXCHANGE,
+                                     RabbitMQClient.WORKER_DISPATCH_ROUTING_KEY.format(worker_id=WORKER_ID))
+
+    async def consume(self, queue_name):
+        async for delivery in self.client.consume(queue_name):
+            try:
+                message = delivery.decode()
+            except ValueError:
+                print(f"Dropping undecodable message {delivery.delivery_tag}")
+                delivery.nack(requeue=False)
+                continue
+
+            def ack(requeue=False, delivery=delivery):
+                if requeue:
+                    delivery.nack(requeue=True)
+                else:
+                    delivery.ack()
+
+            self.executor.submit(message, ack)
+
+    def publish(self, exchange_name, routing_key, message):
+        # heartbeats and logs are not waited for, a refused one is reported
+        try:
+            confirmed = self.client.publish(exchange_name, routing_key, message)
+        except AMQPError as e:
+            print(f"Publishing to '{exchange_name}' failed: {e!r}")
+            return
+
+        def report(future):
+            if future.exception() is not None:
+                print(f"Publishing to '{exchange_name}' failed: {future.exception()!r}")
+
+        confirmed.add_done_callback(report)
+
+    def publish_log(self, log: dict):
+        self.publish(RabbitMQClient.JOB_LOGS_DB_EXCHANGE, f"job.logs.db.{log['job_uuid']}", log)
+
+    async def send_heartbeats(self):
+        while True:
+            self.publish(
+                RabbitMQClient.JOB_MONITORING_EXCHANGE,
+                RabbitMQClient.WORKER_HEARTBEAT_ROUTING_KEY.format(worker_id=WORKER_ID),
+                self.executor.heartbeat(),
+            )
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+
+    def stop(self):
+        # stop taking new deliveries, the ones received are still acked
+        self.stopping.set()
+        for consumer in self.consumers:
+            consumer.cancel()
+
+    async def close(self):
+        if self.heartbeats is not None:
+            self.heartbeats.cancel()
+        await self.client.close()
+
+
+async def run_worker():
+    for module in TASK_MODULES:
+        importlib.import_module(module)
+    print(f"Registered tasks: {', '.join(sorted(registry.tasks))}")
+
+    loop = asyncio.get_running_loop()
+    executor = JobExecutor(JobStore(), lanes=LaneScheduler() if DISPATCH_QUEUES == "lanes" else None)
+    executor.start_lease_renewal()
+    stopping = asyncio.Event()
+    consumer = DispatchConsumer(executor)
+    if LOG_MODE == "queue":
+        executor.log_sink = consumer.publish_log
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    # consumes, reconnecting whenever the broker goes away, until SIGTERM
+    consuming = asyncio.ensure_future(consumer.run())
+    consuming.add_done_callback(lambda _: stopping.set())
+    await stopping.wait()
+
+    # graceful shutdown: no new deliveries, let the jobs already received
+    # finish and ack, then close the connection
+    print("Worker shutting down, waiting for running jobs")
+    consumer.stop()
+    await executor.drain()
+    await asyncio.gather(consuming, return_exceptions=True)
+    await consumer.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
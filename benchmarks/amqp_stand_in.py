@@ -0,0 +1,325 @@
+"""
+Stand-in AMQP 0-9-1 broker for the publisher benchmarks.
+
+Speaks just enough of the protocol for pika: connection and channel setup,
+exchange / queue declarations and bindings, publisher confirms, transactions,
+basic.publish, and consumers with basic.qos prefetch, acks and nacks.
+Published messages are routed to the queues bound with a matching topic
+pattern (and thrown away if there are none) and delivered to their
+consumers. --confirm-ms delays confirms and commits, the time a real broker
+spends making persistent messages durable; as in a real broker, the messages
+that arrived together share one such write. --drop-after closes a connection
+after that many messages, to exercise reconnects.
+
+Built on pika's own frame codec, so the client side (pika, sockets, the
+publisher pool) is measured for real; only the broker is not.
+
+Usage:
+    python benchmarks/amqp_stand_in.py --port 5673 --confirm-ms 1
+"""
+import argparse
+import collections
+import itertools
+import re
+import select
+import socket
+import socketserver
+import threading
+import time
+
+from pika import frame, spec
+
+PROTOCOL_HEADER = b"AMQP\x00\x00\x09\x01"
+FRAME_MAX = 131072
+POLL_SECONDS = 0.005 # how soon a consumer sees messages published on another connection
+
+
+def topic_pattern(routing_key):
+    # a topic binding key as a regex: * is one word, # zero or more
+    words = [{"*": r"[^.]+", "#": r".*"}.get(word, re.escape(word)) for word in routing_key.split(".")]
+    pattern = r"\.".join(words)
+    # the dot next to a # is optional, "a.#" matches "a" too
+    pattern = pattern.replace(r".*\.", r"(?:.*\.)?").replace(r"\..*", r"(?:\..*)?")
+    return re.compile(pattern + "$")
+
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.connections = 0
+
+    def add(self, messages=0, connections=0):
+        with self.lock:
+            self.messages += messages
+            self.connections += connections
+
+
+class BrokerConnection(socketserver.BaseRequestHandler):
+    # one client connection, on its own thread
+    server: "StandInBroker"
+
+    def setup(self):
+        self.buffer = b""
+        self.confirming = set()     # channels in confirm mode
+        self.delivery_tags = {}     # channel -> last publish delivery tag
+        self.unconfirmed = {}       # channel -> last delivery tag not confirmed yet
+        self.publishing = {}        # channel -> [publish method, properties, body size, fragments]
+        self.prefetch = {}          # channel -> prefetch count, per consumer
+        self.consumers = {}         # consumer tag -> [channel, queue, no_ack, unacked count]
+        self.sent_tags = {}         # channel -> last delivery tag sent to a consumer
+        self.unacked = {}           # (channel, delivery tag) -> (consumer tag, queue, message)
+        self.exclusive = []
+        self.received = 0
+        self.queue_names = itertools.count(1)
+        self.consumer_tags = itertools.count(1)
+        self.open = True
+        self.server.counters.add(connections=1)
+
+    def send(self, channel, method):
+        self.request.sendall(frame.Method(channel, method).marshal())
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while self.open:
+                if self.consumers and not select.select([self.request], [], [], POLL_SECONDS)[0]:
+                    self.deliver()
+                    continue
+                data = self.request.recv(65536)
+                if not data:
+                    return
+                self.buffer += data
+                while self.open:
+                    consumed, received = frame.decode_frame(self.buffer)
+                    if not consumed:
+                        break
+                    self.buffer = self.buffer[consumed:]
+                    self.on_frame(received)
+                if self.open:
+                    self.confirm()
+                    self.deliver()
+        finally:
+            self.requeue(list(self.unacked))
+            self.server.delete_queues(self.exclusive)
+
+    def on_frame(self, received):
+        if isinstance(received, frame.ProtocolHeader):
+            self.send(0, spec.Connection.Start(server_properties={
+                "product": "stand-in", "capabilities": {
+                    "publisher_confirms": True, "basic.nack": True, "consumer_cancel_notify": True,
+                    "exchange_exchange_bindings": True, "connection.blocked": True,
+                    "authentication_failure_close": True,
+                },
+            }))
+        elif isinstance(received, frame.Method):
+            self.on_method(received.channel_number, received.method)
+        elif isinstance(received, frame.Header):
+            message = self.publishing[received.channel_number]
+            message[1], message[2] = received.properties, received.body_size
+            if received.body_size == 0:
+                self.on_message(received.channel_number)
+        elif isinstance(received, frame.Body):
+            message = self.publishing[received.channel_number]
+            message[3].append(received.fragment)
+            if sum(map(len, message[3])) >= message[2]:
+                self.on_message(received.channel_number)
+        # heartbeats need no answer
+
+    def on_method(self, channel, method):
+        replies = {
+            spec.Connection.StartOk: lambda: spec.Connection.Tune(channel_max=2047, frame_max=FRAME_MAX, heartbeat=0),
+            spec.Connection.Open: spec.Connection.OpenOk,
+            spec.Channel.Open: spec.Channel.OpenOk,
+            spec.Exchange.Declare: spec.Exchange.DeclareOk,
+            spec.Tx.Select: spec.Tx.SelectOk,
+            spec.Tx.Rollback: spec.Tx.RollbackOk,
+        }
+        if type(method) in replies:
+            self.send(channel, replies[type(method)]())
+        elif isinstance(method, spec.Queue.Declare):
+            name = method.queue or f"amq.gen-{id(self)}-{next(self.queue_names)}"
+            if method.exclusive:
+                self.exclusive.append(name)
+            count = self.server.declare_queue(name)
+            self.send(channel, spec.Queue.DeclareOk(queue=name, message_count=count, consumer_count=0))
+        elif isinstance(method, spec.Queue.Bind):
+            self.server.bind(method.exchange, method.routing_key, method.queue)
+            self.send(channel, spec.Queue.BindOk())
+        elif isinstance(method, spec.Basic.Publish):
+            self.publishing[channel] = [method, None, 0, []]
+        elif isinstance(method, spec.Basic.Qos):
+            self.prefetch[channel] = method.prefetch_count
+            self.send(channel, spec.Basic.QosOk())
+        elif isinstance(method, spec.Basic.Consume):
+            tag = method.consumer_tag or f"ctag-{next(self.consumer_tags)}"
+            self.consumers[tag] = [channel, method.queue, method.no_ack, 0]
+            if not method.nowait:
+                self.send(channel, spec.Basic.ConsumeOk(consumer_tag=tag))
+        elif isinstance(method, spec.Basic.Cancel):
+            self.consumers.pop(method.consumer_tag, None)
+            if not method.nowait:
+                self.send(channel, spec.Basic.CancelOk(consumer_tag=method.consumer_tag))
+        elif isinstance(method, (spec.Basic.Ack, spec.Basic.Nack, spec.Basic.Reject)):
+            self.settle(channel, method)
+        elif isinstance(method, spec.Confirm.Select):
+            self.confirming.add(channel)
+            self.delivery_tags[channel] = 0
+            if not method.nowait:
+                self.send(channel, spec.Confirm.SelectOk())
+        elif isinstance(method, spec.Tx.Commit):
+            self.durable()
+            self.send(channel, spec.Tx.CommitOk())
+        elif isinstance(method, spec.Channel.Close):
+            self.confirming.discard(channel)
+            self.requeue([key for key in self.unacked if key[0] == channel])
+            self.consumers = {tag: consumer for tag, consumer in self.consumers.items() if consumer[0] != channel}
+            self.send(channel, spec.Channel.CloseOk())
+        elif isinstance(method, spec.Connection.Close):
+            self.send(0, spec.Connection.CloseOk())
+            self.open = False
+        # TuneOk needs no answer
+
+    def on_message(self, channel):
+        method, properties, _, fragments = self.publishing.pop(channel)
+        self.received += 1
+        self.server.counters.add(messages=1)
+        self.server.route(method.exchange, method.routing_key, (method.exchange, method.routing_key, properties,
+                                                                b"".join(fragments)))
+        if channel in self.confirming:
+            self.delivery_tags[channel] += 1
+            self.unconfirmed[channel] = self.delivery_tags[channel]
+        if self.server.drop_after and self.received >= self.server.drop_after:
+            self.open = False # as a broker restart would: no close handshake
+            self.request.shutdown(socket.SHUT_RDWR)
+
+    def confirm(self):
+        # the messages of one read are made durable together, then confirmed at once
+        if not self.unconfirmed:
+            return
+        self.durable()
+        for channel, delivery_tag in self.unconfirmed.items():
+            self.send(channel, spec.Basic.Ack(delivery_tag=delivery_tag, multiple=True))
+        self.unconfirmed = {}
+
+    def deliver(self):
+        frames = []
+        for tag, consumer in list(self.consumers.items()):
+            channel, queue, no_ack, _ = consumer
+            prefetch = self.prefetch.get(channel, 0)
+            while no_ack or not prefetch or consumer[3] < prefetch:
+                message = self.server.take(queue)
+                if message is None:
+                    break
+                exchange, routing_key, properties, body = message
+                delivery_tag = self.sent_tags.get(channel, 0) + 1
+                self.sent_tags[channel] = delivery_tag
+                if not no_ack:
+                    consumer[3] += 1
+                    self.unacked[(channel, delivery_tag)] = (tag, queue, message)
+                frames.append(frame.Method(channel, spec.Basic.Deliver(
+                    consumer_tag=tag, delivery_tag=delivery_tag, exchange=exchange, routing_key=routing_key,
+                )).marshal())
+                frames.append(frame.Header(channel, len(body), properties).marshal())
+                for start in range(0, len(body), FRAME_MAX - 8):
+                    frames.append(frame.Body(channel, body[start:start + FRAME_MAX - 8]).marshal())
+        if frames:
+            self.request.sendall(b"".join(frames))
+
+    def settle(self, channel, method):
+        if getattr(method, "multiple", False):
+            keys = [key for key in self.unacked if key[0] == channel and key[1] <= method.delivery_tag]
+        else:
+            keys = [(channel, method.delivery_tag)]
+        if isinstance(method, spec.Basic.Ack) or not method.requeue:
+            for key in keys:
+                tag, _, _ = self.unacked.pop(key, (None, None, None))
+                if tag in self.consumers:
+                    self.consumers[tag][3] -= 1
+        else:
+            self.requeue(keys)
+
+    def requeue(self, keys):
+        for key in keys:
+            tag, queue, message = self.unacked.pop(key, (None, None, None))
+            if tag is None:
+                continue
+            if tag in self.consumers:
+                self.consumers[tag][3] -= 1
+            self.server.put_back(queue, message)
+
+    def durable(self):
+        if self.server.confirm_seconds:
+            time.sleep(self.server.confirm_seconds)
+
+
+class StandInBroker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, confirm_ms=0.0, drop_after=0):
+        super().__init__(("127.0.0.1", port), BrokerConnection)
+        self.confirm_seconds = confirm_ms / 1000
+        self.drop_after = drop_after
+        self.counters = Counters()
+        self.lock = threading.Lock()
+        self.queues = {}    # name -> deque of (exchange, routing key, properties, body)
+        self.bindings = []  # (exchange, compiled topic pattern, queue)
+
+    def declare_queue(self, name):
+        with self.lock:
+            return len(self.queues.setdefault(name, collections.deque()))
+
+    def delete_queues(self, names):
+        with self.lock:
+            for name in names:
+                self.queues.pop(name, None)
+            self.bindings = [binding for binding in self.bindings if binding[2] not in names]
+
+    def bind(self, exchange, routing_key, queue):
+        with self.lock:
+            self.bindings.append((exchange, topic_pattern(routing_key), queue))
+
+    def route(self, exchange, routing_key, message):
+        if not self.bindings:
+            return
+        with self.lock:
+            for queue in {queue for bound, pattern, queue in self.bindings
+                          if bound == exchange and pattern.match(routing_key)}:
+                self.queues[queue].append(message)
+
+    def take(self, queue):
+        with self.lock:
+            messages = self.queues.get(queue)
+            return messages.popleft() if messages else None
+
+    def put_back(self, queue, message):
+        with self.lock:
+            if queue in self.queues:
+                self.queues[queue].appendleft(message)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def serve(port, confirm_ms, drop_after, ready=None):
+    # entry point for a broker in its own process: sends the port it listens on to `ready`
+    broker = StandInBroker(port, confirm_ms, drop_after)
+    if ready is not None:
+        ready.send(broker.port)
+    broker.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=5673)
+    parser.add_argument("--confirm-ms", type=float, default=0.0)
+    parser.add_argument("--drop-after", type=int, default=0)
+    args = parser.parse_args()
+    print(f"stand-in broker on 127.0.0.1:{args.port}")
+    serve(args.port, args.confirm_ms, args.drop_after)
+
+
+if __name__ == "__main__":
+    main()
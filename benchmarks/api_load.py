@@ -0,0 +1,106 @@
+"""
+API load test: requests/sec and latency of POST /jobs and GET /jobs/{id}.
+
+Drives a running API (uvicorn) with --concurrency clients for --duration
+seconds per endpoint and reports requests/sec, p50 and p99. GET requests
+read back jobs created during the POST phase.
+
+Usage:
+    uvicorn main:app --app-dir app --port 8000 --workers 1
+    python benchmarks/api_load.py --url http://127.0.0.1:8000 --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+from common import percentile
+
+
+class Connection:
+    # Minimal keep-alive HTTP/1.1 client. httpx costs about a millisecond of
+    # CPU per request, which on a small machine is taken from the server under test.
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        data = json.dumps(body).encode() if body is not None else b""
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status_line, *headers = head.decode("latin-1").split("\r\n")
+        length = next(int(h.split(":", 1)[1]) for h in headers if h.lower().startswith("content-length:"))
+        return int(status_line.split()[1]), await self.reader.readexactly(length)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def run_clients(url, concurrency, duration, request):
+    samples, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def client_loop():
+        nonlocal errors
+        connection = Connection(url.hostname, url.port or 80)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = await request(connection)
+            except (OSError, asyncio.IncompleteReadError, StopIteration):
+                connection.close()
+                ok = False
+            samples.append(time.perf_counter() - started)
+            errors += not ok
+        connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return samples, errors, time.perf_counter() - started
+
+
+def report(name, samples, errors, elapsed):
+    print(f"{name:>16} {len(samples):>8} {errors:>7} {len(samples) / elapsed:>9.0f} "
+          f"{percentile(samples, 50) * 1000:>8.1f} {percentile(samples, 99) * 1000:>8.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+    url = urlsplit(args.url)
+    job_ids = []
+
+    async def post_job(connection):
+        status, body = await connection.request("POST", "/jobs", {
+            "job_name": "load", "type": "sleep", "payload": {"duration_seconds": 0}, "priority": 3,
+        })
+        if status == 201:
+            job_ids.append(json.loads(body)["job_id"])
+        return status == 201
+
+    async def get_job(connection):
+        status, _ = await connection.request("GET", f"/jobs/{random.choice(job_ids)}")
+        return status == 200
+
+    print(f"{'endpoint':>16} {'requests':>8} {'errors':>7} {'req/sec':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    report("POST /jobs", *await run_clients(url, args.concurrency, args.duration, post_job))
+    if not job_ids:
+        print("no job was created, skipping GET /jobs/{id}")
+        return
+    report("GET /jobs/{id}", *await run_clients(url, args.concurrency, args.duration, get_job))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
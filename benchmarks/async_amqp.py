@@ -0,0 +1,154 @@
+"""
+Asyncio AMQP benchmark: confirmed publishes and consumed messages per second
+with many messages in flight.
+
+Starts the stand-in broker (benchmarks/amqp_stand_in.py) in its own process.
+
+publish: --messages confirmed publishes with N publishers at once
+  threads: N threads, each with its own BlockingConnection (RabbitMQClient
+           in confirm mode): one message in flight per thread.
+  asyncio: N tasks on one event loop and one AsyncRabbitMQClient connection:
+           up to N messages waiting for their confirm at once.
+
+consume: --messages messages read from a queue by one AsyncRabbitMQClient
+  consumer with prefetch P, each one handled by a task that takes --work-ms
+  (an awaited database call, say) before acking it: up to P handled at once.
+
+Usage:
+    python benchmarks/async_amqp.py --publishers 1 100 1000 --prefetch 1 100 1000 --messages 20000
+"""
+import argparse
+import asyncio
+import multiprocessing
+import threading
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+
+import pika
+
+from amqp_stand_in import serve
+from app.services.rabbitmq_client import AsyncRabbitMQClient
+
+MESSAGE = {"job_id": "0b9a6c1e-8d0f-4a53-9d3e-2f6a1f0c7e21", "type": "sleep", "attempt": 1, "timeout": None,
+           "cpu_units": 1, "memory_mb": 256, "payload": {"duration_seconds": 0.1}}
+
+
+def client(port):
+    client = AsyncRabbitMQClient()
+    client.RABBITMQ_HOST, client.RABBITMQ_PORT = "127.0.0.1", port
+    return client
+
+
+def publish_threads(port, publishers, messages):
+    parameters = pika.ConnectionParameters("127.0.0.1", port)
+    body = client(port).codec.encode(MESSAGE)
+    per_publisher = messages // publishers
+    start = threading.Barrier(publishers + 1)
+
+    def publish():
+        connection = pika.BlockingConnection(parameters)
+        channel = connection.channel()
+        channel.confirm_delivery()
+        start.wait()
+        for _ in range(per_publisher):
+            channel.basic_publish("bench", "bench.publish", body, pika.BasicProperties(delivery_mode=2))
+        connection.close()
+
+    threads = [threading.Thread(target=publish) for _ in range(publishers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return per_publisher * publishers / (time.perf_counter() - started)
+
+
+async def publish_asyncio(port, publishers, messages):
+    publisher = client(port)
+    await publisher.connect()
+    per_publisher = messages // publishers
+
+    async def publish():
+        for _ in range(per_publisher):
+            await publisher.publish_message("bench", "bench.publish", MESSAGE)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(publish() for _ in range(publishers)))
+    elapsed = time.perf_counter() - started
+    await publisher.close()
+    return per_publisher * publishers / elapsed
+
+
+async def consume(port, prefetch, messages, work_seconds):
+    consumer = client(port)
+    await consumer.connect()
+    await consumer.declare_exchange("bench")
+    await consumer.declare_queue("bench.consume")
+    await consumer.bind_queue("bench.consume", "bench", "bench.consume")
+    await asyncio.gather(*(consumer.publish("bench", "bench.consume", MESSAGE) for _ in range(messages)))
+
+    handled = 0
+    done = asyncio.Event()
+
+    async def handle(delivery):
+        nonlocal handled
+        delivery.decode()
+        await asyncio.sleep(work_seconds)
+        delivery.ack()
+        handled += 1
+        if handled == messages:
+            done.set()
+
+    handlers = set()
+    started = time.perf_counter()
+    received = 0
+    async for delivery in consumer.consume("bench.consume", prefetch=prefetch):
+        task = asyncio.ensure_future(handle(delivery))
+        handlers.add(task)
+        task.add_done_callback(handlers.discard)
+        received += 1
+        if received == messages:
+            break
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    await consumer.close()
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--publishers", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--prefetch", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--confirm-ms", type=float, default=1.0)
+    parser.add_argument("--work-ms", type=float, default=5.0)
+    parser.add_argument("--max-threads", type=int, default=1000, help="skip the threads variant above this")
+    args = parser.parse_args()
+
+    ready, port_sender = multiprocessing.Pipe(duplex=False)
+    broker = multiprocessing.Process(target=serve, args=(0, args.confirm_ms, 0, port_sender), daemon=True)
+    broker.start()
+    port = ready.recv()
+
+    try:
+        print(f"publish: {args.messages} messages, broker confirms in {args.confirm_ms} ms")
+        print(f"{'publishers':>10} {'threads msgs/sec':>17} {'asyncio msgs/sec':>17}")
+        for publishers in args.publishers:
+            threaded = publish_threads(port, publishers, args.messages) if publishers <= args.max_threads else None
+            single_loop = asyncio.run(publish_asyncio(port, publishers, args.messages))
+            print(f"{publishers:>10} {'skipped' if threaded is None else f'{threaded:.0f}':>17} {single_loop:>17.0f}")
+
+        print()
+        print(f"consume: {args.messages} messages, {args.work_ms} ms of work each")
+        print(f"{'prefetch':>10} {'msgs/sec':>17}")
+        for prefetch in args.prefetch:
+            rate = asyncio.run(consume(port, prefetch, args.messages, args.work_ms / 1000))
+            print(f"{prefetch:>10} {rate:>17.0f}")
+    finally:
+        broker.terminate()
+
+
+if __name__ == "__main__":
+    main()
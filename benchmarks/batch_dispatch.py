@@ -0,0 +1,97 @@
+"""
+Dispatch throughput benchmark: jobs dispatched per second.
+
+Seeds a scratch database with N ready jobs and drains them through the
+scheduler, either job by job (`dispatch_jobs`, one publish + commit + refresh
+per job) or in batches (`dispatch_batch`, one UPDATE ... RETURNING, one broker
+transaction and one commit per batch).
+
+The broker is replaced by an in-memory stand-in; --broker-rtt-ms adds a
+simulated round trip per broker acknowledgement (per message in single mode,
+per batch in batch mode).
+
+Usage:
+    python benchmarks/batch_dispatch.py --jobs 20000 --batch-sizes 100 1000 5000
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from common import DATABASE_URL, reset_schema
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import database
+from app.models.models import Job
+from app.services import scheduler
+
+
+class StandInBroker:
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.published = 0
+
+    def publish_message(self, exchange_name, routing_key, message, priority=None):
+        time.sleep(self.rtt)
+        self.published += 1
+        return True
+
+    def publish_batch(self, exchange_name, messages):
+        time.sleep(self.rtt)
+        self.published += len(messages)
+        return True
+
+
+def seed_ready_jobs(engine, total):
+    reset_schema(engine)
+    past = datetime.now(timezone.utc) - timedelta(minutes=1)
+    with engine.begin() as conn:
+        for start in range(0, total, 10_000):
+            conn.execute(insert(Job), [
+                {"job_id": uuid.uuid4(), "job_name": "bench", "type": "bench",
+                 "status": "waiting", "priority": "Normal", "run_at": past}
+                for _ in range(min(10_000, total - start))
+            ])
+
+
+def drain(session_factory, batch_size):
+    db = session_factory()
+    try:
+        started = time.perf_counter()
+        if batch_size is None:
+            scheduler.dispatch_jobs(db, scheduler.get_uncompleted_jobs(db))
+        else:
+            while scheduler.dispatch_batch(db, batch_size):
+                pass
+        return time.perf_counter() - started
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=20_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--broker-rtt-ms", type=float, default=0.5)
+    parser.add_argument("--skip-single", action="store_true", help="don't run the job-by-job baseline")
+    args = parser.parse_args()
+
+    database.engine.echo = False
+    engine = create_engine(DATABASE_URL)
+    session_factory = sessionmaker(bind=engine)
+
+    runs = ([] if args.skip_single else [None]) + args.batch_sizes
+    print(f"{'mode':>12} {'jobs':>8} {'seconds':>10} {'jobs/sec':>10}")
+    for batch_size in runs:
+        seed_ready_jobs(engine, args.jobs)
+        broker = StandInBroker(args.broker_rtt_ms / 1000)
+        scheduler.publisher = broker
+        elapsed = drain(session_factory, batch_size)
+        mode = "single" if batch_size is None else f"batch {batch_size}"
+        print(f"{mode:>12} {broker.published:>8} {elapsed:>10.2f} {broker.published / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Submission benchmark: jobs ingested per second, POST /jobs vs POST /jobs/batch.
+
+Runs the API in process (httpx over ASGI, no network) against a scratch
+database, or against a running server with --url. Submits --jobs jobs one
+POST /jobs at a time, then through POST /jobs/batch for each --batch-sizes.
+With --fan-in every job of a batch except the first depends on the
+batch's first job through a local ref, so dependency edges are ingested too.
+
+Usage:
+    python benchmarks/batch_submit.py --jobs 20000 --batch-sizes 1000 5000 10000 --fan-in
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from common import DATABASE_URL, reset_schema
+
+# the API imports its modules relative to app/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import httpx
+from sqlalchemy import create_engine
+
+from main import app
+
+
+def job(index, ref=None, depends_on_refs=()):
+    item = {"job_name": f"bench_{index}", "type": "sleep", "payload": {"duration_seconds": 0}, "priority": 3}
+    if ref:
+        item["ref"] = ref
+    if depends_on_refs:
+        item["depends_on_refs"] = list(depends_on_refs)
+    return item
+
+
+def batch(size, fan_in):
+    if not fan_in:
+        return [job(index) for index in range(size)]
+    return [job(0, ref="root")] + [job(index, depends_on_refs=["root"]) for index in range(1, size)]
+
+
+async def one_by_one(client, total):
+    started = time.perf_counter()
+    for index in range(total):
+        response = await client.post("/jobs", json=job(index))
+        assert response.status_code == 201, response.text
+    return time.perf_counter() - started
+
+
+async def batched(client, total, size, fan_in):
+    body = batch(size, fan_in)
+    started = time.perf_counter()
+    for _ in range(total // size):
+        response = await client.post("/jobs/batch", json=body)
+        assert response.status_code == 201, response.text
+    return time.perf_counter() - started
+
+
+async def run(args):
+    transport = None if args.url else httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(base_url=args.url or "http://api", transport=transport, timeout=120) as client:
+        print(f"{'mode':>12} {'jobs':>8} {'seconds':>9} {'jobs/sec':>9}")
+        if not args.skip_single:
+            total = min(args.jobs, args.single_jobs)
+            elapsed = await one_by_one(client, total)
+            print(f"{'single':>12} {total:>8} {elapsed:>9.2f} {total / elapsed:>9.0f}")
+        for size in args.batch_sizes:
+            total = args.jobs - args.jobs % size
+            elapsed = await batched(client, total, size, args.fan_in)
+            print(f"{'batch ' + str(size):>12} {total:>8} {elapsed:>9.2f} {total / elapsed:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=20_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1000, 5000, 10_000])
+    parser.add_argument("--fan-in", action="store_true", help="add a dependency edge per job")
+    parser.add_argument("--single-jobs", type=int, default=2000, help="jobs for the one-by-one baseline")
+    parser.add_argument("--skip-single", action="store_true")
+    parser.add_argument("--url", default=None, help="running API to submit to, instead of in process")
+    args = parser.parse_args()
+
+    if not args.url:
+        reset_schema(create_engine(DATABASE_URL))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
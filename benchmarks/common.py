@@ -0,0 +1,39 @@
+"""
+Shared helpers for the benchmarks: scratch database url and schema reset.
+
+The benchmarks expect the same DB_* environment variables as the app, with
+DB_NAME pointing at a scratch database (default: bench_smart_queue).
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DB_NAME", "bench_smart_queue")
+
+from sqlalchemy import text
+
+from app.models.models import Base
+
+DB_USER = os.getenv("DB_USER", "vast")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "qweasdzx")
+DB_NAME = os.getenv("DB_NAME")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+
+def reset_schema(engine):
+    Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "DO $$ BEGIN "
+            "CREATE TYPE job_priority_enum AS ENUM ('Critical', 'High', 'Normal', 'Low'); "
+            "EXCEPTION WHEN duplicate_object THEN NULL; END $$;"
+        ))
+    Base.metadata.create_all(bind=engine)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,170 @@
+"""
+Dependency graph benchmark: services/dag.py:DependencyGraph on --nodes jobs.
+
+The graph is --workflows workflows of equal size, each job depending on
+1 to 3 earlier jobs of its workflow (mostly recent ones, so chains are long).
+
+order only                DependencyGraph.insert, submission order: the cycle
+                          check and topological order without critical paths
+insert, submission order  add_edge one edge at a time, every edge from an
+                          existing job to a new one as POST /jobs creates them:
+                          O(1) for the order, but each new job at the end of a
+                          chain lengthens the critical path of the whole chain
+insert, shuffled          the same edges in random order: most of them go
+                          against the current order and make Pearce-Kelly
+                          search and reorder
+batches of --batch edges  add_edges, in submission order: one critical path
+                          pass per batch (a /jobs/batch, or the edges of the
+                          jobs the scheduler hears about in one wake up)
+naive DFS check           per edge, a search from the child for the parent
+                          over the whole graph (what a check without an
+                          order costs), on --naive-sample edges
+load                      DependencyGraph.load of all edges (the scheduler's
+                          startup and periodic reload)
+
+makespan: a list-scheduling simulation of the whole graph on --slots slots,
+job durations exponential with mean 1 s, every job submitted at t=0 with the
+same priority. A slot takes the next ready job by submission order (the claim
+without critical paths) or by longest critical path first.
+
+Usage:
+    python benchmarks/dag_engine.py --nodes 100000 --workflows 100 --slots 64
+"""
+import argparse
+import heapq
+import random
+import time
+
+from common import percentile
+
+from app.services.dag import DependencyGraph
+
+
+def workflow_edges(nodes, workflows, rng):
+    size = nodes // workflows
+    edges = []
+    for workflow in range(workflows):
+        first = workflow * size
+        for index in range(1, size):
+            window = min(index, 20)
+            for offset in rng.sample(range(1, window + 1), min(window, rng.randint(1, 3))):
+                edges.append((first + index - offset, first + index))
+    return edges
+
+
+def timed_inserts(edges, nodes, batch=1, order_only=False):
+    # timings per edge (per batch, divided by its size)
+    graph = DependencyGraph()
+    for node in range(nodes):
+        graph.add_node(node)
+    timings = []
+    started = time.perf_counter()
+    for start in range(0, len(edges), batch):
+        chunk = edges[start:start + batch]
+        before = time.perf_counter_ns()
+        if order_only:
+            graph.insert(*chunk[0])
+        else:
+            graph.add_edges(chunk)
+        timings.append((time.perf_counter_ns() - before) / len(chunk))
+    return graph, time.perf_counter() - started, timings
+
+
+def naive_has_path(children, start, target):
+    seen = {start}
+    stack = [start]
+    while stack:
+        node = stack.pop()
+        if node == target:
+            return True
+        for child in children.get(node, ()):
+            if child not in seen:
+                seen.add(child)
+                stack.append(child)
+    return False
+
+
+def naive_timings(edges, sample, rng):
+    children = {}
+    for parent, child in edges:
+        children.setdefault(parent, []).append(child)
+    timings = []
+    for parent, child in rng.sample(edges, sample):
+        before = time.perf_counter_ns()
+        naive_has_path(children, child, parent)
+        timings.append(time.perf_counter_ns() - before)
+    return timings
+
+
+def makespan(graph, nodes, slots, by_critical_path, rng):
+    durations = [rng.expovariate(1.0) for _ in range(nodes)]
+    unmet = {node: len(graph.parents.get(node, ())) for node in range(nodes)}
+    key = (lambda node: (-graph.critical_path(node), node)) if by_critical_path else (lambda node: (node,))
+    ready = [key(node) for node in range(nodes) if unmet[node] == 0]
+    heapq.heapify(ready)
+    running = []  # (finishes_at, node)
+    now = 0.0
+    while ready or running:
+        while ready and len(running) < slots:
+            node = heapq.heappop(ready)[-1]
+            heapq.heappush(running, (now + durations[node], node))
+        now, node = heapq.heappop(running)
+        for child in graph.children.get(node, ()):
+            unmet[child] -= 1
+            if unmet[child] == 0:
+                heapq.heappush(ready, key(child))
+    return now
+
+
+def report(name, count, seconds, timings):
+    print(f"{name:>26} {count:>8} {seconds:>9.3f} {count / seconds:>10.0f} {percentile(timings, 50) / 1000:>9.1f} "
+          f"{percentile(timings, 99) / 1000:>9.1f} {max(timings) / 1000:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--workflows", type=int, default=100)
+    parser.add_argument("--slots", type=int, default=64)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--naive-sample", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    edges = workflow_edges(args.nodes, args.workflows, rng)
+    print(f"{args.nodes} jobs, {len(edges)} edges, {args.workflows} workflows")
+    print(f"{'':>26} {'edges':>8} {'seconds':>9} {'edges/s':>10} {'p50 us':>9} {'p99 us':>9} {'max us':>9}")
+
+    _, seconds, timings = timed_inserts(edges, args.nodes, order_only=True)
+    report("order only", len(edges), seconds, timings)
+    graph, seconds, timings = timed_inserts(edges, args.nodes)
+    report("insert, submission order", len(edges), seconds, timings)
+    shuffled = list(edges)
+    rng.shuffle(shuffled)
+    shuffled_graph, seconds, timings = timed_inserts(shuffled, args.nodes)
+    report("insert, shuffled", len(edges), seconds, timings)
+    assert shuffled_graph.path == graph.path
+    batched_graph, seconds, timings = timed_inserts(edges, args.nodes, args.batch)
+    report(f"batches of {args.batch} edges", len(edges), seconds, timings)
+    assert batched_graph.path == graph.path
+
+    timings = naive_timings(edges, args.naive_sample, rng)
+    report("naive DFS check", len(timings), sum(timings) / 1e9, timings)
+
+    started = time.perf_counter()
+    loaded = DependencyGraph.load(edges)
+    print(f"{'load':>26} {len(edges):>8} {time.perf_counter() - started:>9.3f}")
+    assert loaded.path == graph.path
+
+    longest = max(graph.path.values())
+    print()
+    print(f"makespan on {args.slots} slots (longest chain: {longest + 1} jobs, "
+          f"lower bound ~{max(args.nodes / args.slots, longest + 1):.0f} s)")
+    for name, by_critical_path in (("submission order", False), ("critical path", True)):
+        seconds = makespan(graph, args.nodes, args.slots, by_critical_path, random.Random(args.seed))
+        print(f"{name:>26} {seconds:>9.0f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Submit-to-dispatch latency benchmark.
+
+Runs the scheduler in a background thread against a scratch database,
+submits jobs the same way `POST /jobs` does (insert + job event NOTIFY) and
+records how long each job takes to reach the dispatch exchange.
+
+Two modes are compared:
+    poll    the previous loop: scan, dispatch, time.sleep(--poll-interval)
+    notify  schedule_jobs: wake on LISTEN/NOTIFY or the nearest run_at
+
+Usage:
+    python benchmarks/dispatch_latency.py --jobs 50 --mode poll notify
+"""
+import argparse
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from common import DATABASE_URL, percentile, reset_schema
+
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import sessionmaker
+
+from app import database
+from app.models.models import Job
+from app.services import scheduler
+from app.services.job_events import notify_job_event
+
+
+class RecordingPublisher:
+    # stands in for the RabbitMQ client and timestamps every dispatch
+    def __init__(self):
+        self.dispatched_at = {}
+
+    def publish_message(self, exchange_name, routing_key, message, priority=None):
+        self.dispatched_at[message["job_id"]] = time.perf_counter()
+        return True
+
+    def publish_batch(self, exchange_name, messages):
+        for routing_key, message, priority in messages:
+            self.publish_message(exchange_name, routing_key, message, priority)
+        return True
+
+
+def polling_loop(db, stop, poll_interval):
+    try:
+        while not stop.is_set():
+            scheduler.dispatch_jobs(db, scheduler.get_uncompleted_jobs(db))
+            db.commit()
+            stop.wait(poll_interval)
+    finally:
+        db.close()
+
+
+def submit_jobs(session_factory, total, max_gap):
+    submitted_at = {}
+    db = session_factory()
+    try:
+        for _ in range(total):
+            time.sleep(random.uniform(0, max_gap))
+            job = Job(job_id=uuid.uuid4(), job_name="bench", type="bench", status="waiting",
+                      priority="Critical", run_at=datetime.now(timezone.utc))
+            db.add(job)
+            db.flush()
+            notify_job_event(db, job.job_id, job.status, job.run_at)
+            db.commit()
+            submitted_at[str(job.job_id)] = time.perf_counter()
+    finally:
+        db.close()
+    return submitted_at
+
+
+def run(mode, args, engine, session_factory):
+    with engine.begin() as conn:
+        conn.execute(delete(Job))
+    publisher = RecordingPublisher()
+    scheduler.publisher = publisher
+
+    stop = threading.Event()
+    if mode == "poll":
+        target = lambda: polling_loop(session_factory(), stop, args.poll_interval)
+    else:
+        target = lambda: scheduler.schedule_jobs(session_factory())
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    time.sleep(0.5) # let the scheduler reach its first wait
+
+    submitted_at = submit_jobs(session_factory, args.jobs, args.max_gap)
+    deadline = time.perf_counter() + args.poll_interval + 5
+    while len(publisher.dispatched_at) < len(submitted_at) and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    if mode == "poll":
+        thread.join()
+
+    latencies = [publisher.dispatched_at[job_id] - submitted_at[job_id]
+                 for job_id in submitted_at if job_id in publisher.dispatched_at]
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--mode", nargs="+", choices=["poll", "notify"], default=["poll", "notify"])
+    parser.add_argument("--poll-interval", type=float, default=10.0)
+    parser.add_argument("--max-gap", type=float, default=0.2, help="max seconds between two submissions")
+    args = parser.parse_args()
+
+    database.engine.echo = False
+    engine = create_engine(DATABASE_URL)
+    session_factory = sessionmaker(bind=engine)
+    reset_schema(engine)
+
+    print(f"{'mode':>8} {'dispatched':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for mode in args.mode:
+        latencies = run(mode, args, engine, session_factory)
+        if not latencies:
+            print(f"{mode:>8} {0:>10} {'-':>10} {'-':>10}")
+            continue
+        print(f"{mode:>8} {len(latencies):>10} {percentile(latencies, 50) * 1000:>10.1f} {percentile(latencies, 99) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+GET /jobs/{job_id} benchmark: clients polling jobs, with and without the job cache.
+
+Seeds a scratch database with --jobs jobs (--terminal-fraction of them already
+completed, the rest running), then sends --requests GETs through FastAPI's
+TestClient, 80% of them to the 20% most polled jobs. Meanwhile a thread
+records --change-rate attempts/sec on running jobs (times_attempted + 1 and a
+NOTIFY, as the workers do), which invalidates them in the cache.
+
+Reports requests/sec, latency, the SQL statements the API sent to the
+database, and for the cache its hit ratio and invalidations.
+
+Usage:
+    python benchmarks/job_cache.py --jobs 2000 --requests 20000 --change-rate 50
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from common import DATABASE_URL, percentile, reset_schema
+
+# the API imports its modules relative to app/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, insert, update
+
+from database import async_engine
+from main import app
+from models.models import Job
+from services.job_cache import job_cache
+from services.job_events import notify_job_changes
+
+
+def seed(engine, args):
+    reset_schema(engine)
+    now = datetime.now(timezone.utc)
+    rows = [{
+        "job_id": uuid.uuid4(), "job_name": "bench", "type": "sleep", "priority": "Normal", "run_at": now,
+        "status": "completed" if index < args.jobs * args.terminal_fraction else "running",
+        "times_attempted": 1, "results": {"ok": True},
+    } for index in range(args.jobs)]
+    with engine.begin() as conn:
+        conn.execute(insert(Job), rows)
+    random.shuffle(rows)
+    return [str(row["job_id"]) for row in rows], [row["job_id"] for row in rows if row["status"] == "running"]
+
+
+def record_attempts(engine, running, rate, stopping):
+    # a worker making progress: one attempt on a random running job at a time
+    interval, next_at = 1 / rate, time.perf_counter()
+    with engine.connect() as conn:
+        while not stopping.is_set():
+            job_id = random.choice(running)
+            conn.execute(update(Job).where(Job.job_id == job_id).values(times_attempted=Job.times_attempted + 1))
+            notify_job_changes(conn, [job_id])
+            conn.commit()
+            next_at += interval
+            time.sleep(max(0, next_at - time.perf_counter()))
+
+
+def run(client, engine, job_ids, running, args, cached):
+    job_cache.local.maxsize = args.cache_size if cached else 0
+    job_cache.local.clear()
+    hits, misses, invalidations = job_cache.local.hits, job_cache.local.misses, job_cache.invalidations
+    hot = job_ids[:max(1, len(job_ids) // 5)]
+
+    statements = 0
+
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    stopping = threading.Event()
+    changer = threading.Thread(target=record_attempts, args=(engine, running, args.change_rate, stopping))
+    changer.start()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    samples = []
+    started = time.perf_counter()
+    try:
+        for _ in range(args.requests):
+            job_id = random.choice(hot) if random.random() < 0.8 else random.choice(job_ids)
+            request_started = time.perf_counter()
+            assert client.get(f"/jobs/{job_id}").status_code == 200
+            samples.append(time.perf_counter() - request_started)
+    finally:
+        elapsed = time.perf_counter() - started
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+        stopping.set()
+        changer.join()
+
+    line = (f"{'cache' if cached else 'no cache':>9} {args.requests / elapsed:>9.0f} "
+            f"{percentile(samples, 50) * 1000:>8.2f} {percentile(samples, 99) * 1000:>8.2f} "
+            f"{statements:>11} {statements / args.requests:>9.2f}")
+    if cached:
+        lookups = job_cache.local.hits - hits + job_cache.local.misses - misses
+        line += (f"  hit ratio {(job_cache.local.hits - hits) / lookups:.1%}, "
+                 f"{job_cache.invalidations - invalidations} invalidations")
+    print(line)
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--terminal-fraction", type=float, default=0.5, help="share of jobs already completed")
+    parser.add_argument("--change-rate", type=float, default=50, help="attempts/sec recorded on running jobs")
+    parser.add_argument("--cache-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    engine = create_engine(DATABASE_URL)
+    job_ids, running = seed(engine, args)
+    print(f"{args.jobs} jobs ({args.terminal_fraction:.0%} completed), {args.requests} GETs, "
+          f"{args.change_rate:.0f} changes/sec")
+    print(f"{'':>9} {'req/sec':>9} {'p50 ms':>8} {'p99 ms':>8} {'statements':>11} {'per req':>9}")
+    with TestClient(app) as client:
+        client.get(f"/jobs/{job_ids[0]}") # starts the cache listener
+        while not job_cache.listening:
+            time.sleep(0.05)
+        uncached = run(client, engine, job_ids, running, args, cached=False)
+        cached = run(client, engine, job_ids, running, args, cached=True)
+    print(f"database statements: {uncached} -> {cached} ({1 - cached / uncached:.1%} fewer)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Lane simulation: one priority queue vs weighted fair priority lanes under a
+Critical overload.
+
+Event-driven simulation of --slots job slots (the fleet's workers x
+concurrency) fed by Poisson arrivals in every lane. No database or broker is
+involved. At --overload 10 Critical jobs arrive at 10x their base rate, which
+takes the fleet from ~23% to ~95% busy.
+
+    priority     whenever a slot frees up the highest priority job starts,
+                 oldest first: what the single x-max-priority queue does
+    lanes        services/lanes.py:LaneScheduler with the default weights
+                 (Critical 8, High 4, Normal 2, Low 1) and no aging
+    lanes+aging  the same with --aging seconds of aging
+
+Reports queue wait (arrival -> start) per lane, and how many jobs of each lane
+were still waiting at the end and for how long the oldest one had waited.
+Past 100% (--overload 12) no policy can bound every lane: strict priority
+starves Low, lanes leave the backlog to Critical, aging spreads it over all.
+
+Usage:
+    python benchmarks/lane_simulation.py --slots 32 --seconds 3600 --overload 10
+"""
+import argparse
+import heapq
+import random
+from collections import deque
+
+from common import percentile
+
+from app.services.lanes import LANE_WEIGHTS, LANES, LaneScheduler
+
+# base arrival rate of each lane, as a share of the fleet's capacity
+BASE_LOAD = {"Critical": 0.08, "High": 0.05, "Normal": 0.05, "Low": 0.05}
+
+
+class StrictPriority:
+    # same interface as LaneScheduler: the highest lane with work always goes first
+    def __init__(self):
+        self.queues = {lane: deque() for lane in LANES}
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def push(self, lane, item, queued_at):
+        self.queues[lane].append((queued_at, item))
+
+    def pop(self):
+        for lane in LANES:
+            if self.queues[lane]:
+                return lane, self.queues[lane].popleft()[1]
+        return None
+
+
+def simulate(policy, args):
+    rng = random.Random(args.seed)
+    clock = [0.0]
+    if policy == "priority":
+        scheduler = StrictPriority()
+    else:
+        scheduler = LaneScheduler(LANE_WEIGHTS, args.aging if policy == "lanes+aging" else 0, lambda: clock[0])
+    capacity = args.slots / args.duration
+    rates = {lane: share * capacity * (args.overload if lane == "Critical" else 1) for lane, share in BASE_LOAD.items()}
+
+    # (time, kind, lane): kind 0 is a job finishing, 1 a job arriving
+    events = [(rng.expovariate(rate), 1, lane) for lane, rate in rates.items()]
+    heapq.heapify(events)
+    free_slots = args.slots
+    waits = {lane: [] for lane in LANES}
+    while events:
+        now, kind, lane = heapq.heappop(events)
+        if now > args.seconds:
+            break
+        clock[0] = now
+        if kind == 0:
+            free_slots += 1
+        else:
+            scheduler.push(lane, now, now)
+            heapq.heappush(events, (now + rng.expovariate(rates[lane]), 1, lane))
+        while free_slots and len(scheduler):
+            started_lane, arrived_at = scheduler.pop()
+            waits[started_lane].append(now - arrived_at)
+            free_slots -= 1
+            heapq.heappush(events, (now + rng.expovariate(1 / args.duration), 0, None))
+
+    left = {lane: [arrived_at for arrived_at, _ in scheduler.queues[lane]] for lane in LANES}
+    return waits, left
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=1.0, help="mean job duration, seconds")
+    parser.add_argument("--seconds", type=float, default=3600)
+    parser.add_argument("--overload", type=float, default=10, help="Critical arrival rate x its base rate")
+    parser.add_argument("--aging", type=float, default=30, help="seconds for a lane's weight to double")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    load = sum(share * (args.overload if lane == "Critical" else 1) for lane, share in BASE_LOAD.items())
+    print(f"{args.slots} slots, {args.seconds:.0f} s, Critical at {args.overload:g}x, offered load {load:.0%}")
+    print(f"{'policy':>12} {'lane':>9} {'started':>8} {'wait p50 s':>11} {'wait p99 s':>11} {'wait max s':>11}"
+          f" {'waiting':>8} {'oldest s':>9}")
+    for policy in ("priority", "lanes", "lanes+aging"):
+        waits, left = simulate(policy, args)
+        for lane in LANES:
+            samples = waits[lane] or [0.0]
+            oldest = args.seconds - min(left[lane]) if left[lane] else 0.0
+            print(f"{policy:>12} {lane:>9} {len(waits[lane]):>8} {percentile(samples, 50):>11.2f} "
+                  f"{percentile(samples, 99):>11.2f} {max(samples):>11.2f} "
+                  f"{len(left[lane]):>8} {oldest:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+TCP proxy that adds a fixed delay to every packet, in both directions.
+
+Put it between the API and Postgres to get the round trip times of a
+database on another host when everything runs on one machine (local
+round trips hide the cost of blocking on the database).
+
+Usage:
+    python benchmarks/latency_proxy.py --listen 6432 --target 127.0.0.1:5432 --delay-ms 1
+    DB_PORT=6432 uvicorn main:app --app-dir app --port 8000
+"""
+import argparse
+import asyncio
+
+
+async def pipe(reader, writer, delay):
+    try:
+        while data := await reader.read(65536):
+            await asyncio.sleep(delay)
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listen", type=int, default=6432)
+    parser.add_argument("--target", default="127.0.0.1:5432")
+    parser.add_argument("--delay-ms", type=float, default=1)
+    args = parser.parse_args()
+    host, port = args.target.rsplit(":", 1)
+    delay = args.delay_ms / 1000
+
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(host, int(port))
+        await asyncio.gather(
+            pipe(client_reader, server_writer, delay),
+            pipe(server_reader, client_writer, delay),
+        )
+
+    server = await asyncio.start_server(handle, "127.0.0.1", args.listen)
+    print(f"Forwarding :{args.listen} -> {args.target} with {args.delay_ms} ms per direction")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""
+List endpoint benchmark: GET /jobs?limit=100 latency by dependencies per job.
+
+Seeds a scratch database with 100 waiting jobs that each depend on D completed
+parents, then times GET /jobs?status=waiting&limit=100 through FastAPI's
+TestClient. Runs both the batched dependency lookup (services/api.py) and the
+previous per-job, per-dependency lookup (--skip-legacy to leave it out), and
+counts the SQL statements each request issues.
+
+Usage:
+    python benchmarks/list_jobs_latency.py --deps 0 5 50 --requests 50
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from common import DATABASE_URL, percentile, reset_schema
+
+# the API imports its modules relative to app/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.engine import Engine
+
+from main import app
+from models.models import Job, JobDependency
+from services import api
+
+PAGE_SIZE = 100
+
+
+async def legacy_jobs_out_from_db(jobs, db):
+    # the lookup this benchmark compares against: one query for the edges of
+    # each job, then one query per edge for the parent's UUID
+    out = []
+    for job in jobs:
+        depends_on_uuids = []
+        edges = await db.execute(select(JobDependency).where(JobDependency.dependant_id == job.id))
+        for dep in edges.scalars().all():
+            dep_job = (await db.execute(select(Job).where(Job.id == dep.depends_on_id))).scalars().first()
+            if dep_job:
+                depends_on_uuids.append(dep_job.job_id)
+        out.append(api.job_out(job, depends_on_uuids))
+    return out
+
+
+def seed(engine, deps):
+    reset_schema(engine)
+    now = datetime.now(timezone.utc)
+    job = {"job_name": "bench", "type": "sleep", "priority": "Normal", "run_at": now}
+    with engine.begin() as conn:
+        parents = conn.execute(insert(Job).returning(Job.id), [
+            {**job, "job_id": uuid.uuid4(), "status": "completed"} for _ in range(deps)
+        ]).scalars().all() if deps else []
+        children = conn.execute(insert(Job).returning(Job.id), [
+            {**job, "job_id": uuid.uuid4(), "status": "waiting"} for _ in range(PAGE_SIZE)
+        ]).scalars().all()
+        if parents:
+            conn.execute(insert(JobDependency), [
+                {"dependant_id": child, "depends_on_id": parent} for child in children for parent in parents
+            ])
+
+
+def measure(client, requests):
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    event.listen(Engine, "before_cursor_execute", count)
+    try:
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get("/jobs", params={"status": "waiting", "limit": PAGE_SIZE})
+            samples.append(time.perf_counter() - started)
+            assert response.status_code == 200 and len(response.json()["items"]) == PAGE_SIZE
+    finally:
+        event.remove(Engine, "before_cursor_execute", count)
+    return samples, statements[0] // requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deps", type=int, nargs="+", default=[0, 5, 50])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    batched = api.jobs_out_from_db
+    modes = [("batched", batched)] + ([] if args.skip_legacy else [("per-job", legacy_jobs_out_from_db)])
+
+    print(f"{'deps':>5} {'mode':>8} {'queries':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    with TestClient(app) as client:
+        for deps in args.deps:
+            seed(engine, deps)
+            for name, jobs_out_from_db in modes:
+                api.jobs_out_from_db = jobs_out_from_db
+                client.get("/jobs", params={"status": "waiting", "limit": PAGE_SIZE})  # warm up
+                samples, queries = measure(client, args.requests)
+                print(f"{deps:>5} {name:>8} {queries:>8} "
+                      f"{percentile(samples, 50) * 1000:>8.1f} {percentile(samples, 95) * 1000:>8.1f}")
+            api.jobs_out_from_db = batched
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Pagination benchmark: cost of page N of GET /jobs, OFFSET vs cursor.
+
+Seeds a scratch database with --jobs rows (one third each waiting, completed
+and failed), then times fetching page 1, 100, 1000 and 10,000 of
+--limit jobs through services/api.py:list_jobs with a cursor, against the
+same ORDER BY with OFFSET (the previous implementation, plus the ordering
+it was missing).
+
+Usage:
+    python benchmarks/list_jobs_pagination.py --jobs 1000000 --pages 1 100 1000 10000
+    python benchmarks/list_jobs_pagination.py --status waiting
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from common import DATABASE_URL, percentile, reset_schema
+
+# the API imports its modules relative to app/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from sqlalchemy import create_engine, select, text
+
+from database import AsyncSessionLocal, async_engine
+from models.models import Job
+from services import api
+
+
+def seed(engine, jobs):
+    reset_schema(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO jobs (job_id, job_name, type, status, priority, run_at, created_time) "
+            "SELECT gen_random_uuid(), 'bench', 'sleep', "
+            "(ARRAY['waiting', 'completed', 'failed'])[1 + i % 3], 'Normal', now(), "
+            "now() + i * interval '1 millisecond' "
+            "FROM generate_series(1, :jobs) AS i"
+        ), {"jobs": jobs})
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE jobs"))
+
+
+async def offset_page(db, status, page, limit):
+    query = select(Job)
+    if status:
+        query = query.where(Job.status == status)
+    query = query.order_by(Job.created_time, Job.id).offset((page - 1) * limit).limit(limit)
+    jobs = (await db.execute(query)).scalars().all()
+    return await api.jobs_out_from_db(jobs, db)
+
+
+async def cursor_for_page(db, status, page, limit):
+    # the cursor a client holds after walking to page - 1, looked up once, not timed
+    if page == 1:
+        return None
+    query = select(Job)
+    if status:
+        query = query.where(Job.status == status)
+    query = query.order_by(Job.created_time, Job.id).offset((page - 1) * limit - 1).limit(1)
+    last = (await db.execute(query)).scalars().first()
+    return api.encode_cursor(last)
+
+
+async def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return percentile(samples, 50) * 1000
+
+
+async def run(args):
+    async with AsyncSessionLocal() as db:
+        for page in args.pages:
+            cursor = await cursor_for_page(db, args.status, page, args.limit)
+            offset_ms = await timed(lambda: offset_page(db, args.status, page, args.limit), args.repeat)
+            cursor_ms = await timed(lambda: api.list_jobs(args.status, None, cursor, args.limit, db), args.repeat)
+            print(f"{page:>7} {offset_ms:>14.1f} {cursor_ms:>14.1f}")
+            await db.rollback()
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=1_000_000)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 100, 1000, 10_000])
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--status", default=None, help="filter, exercises the (status, created_time, id) index")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    seed(create_engine(DATABASE_URL), args.jobs)
+
+    print(f"{'page':>7} {'offset p50 ms':>14} {'cursor p50 ms':>14}")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Log writer benchmark: ExecutionLog rows written per second by batch size.
+
+Feeds N log messages (shaped like the ones workers publish to
+job_logs_db_queue) through services/log_writer.py's LogBatchWriter and flushes
+whenever a batch fills up, exactly as the service does. Batch size 1 is the
+row-per-commit baseline that writing from every worker amounts to.
+
+Usage:
+    python benchmarks/log_writer_throughput.py --rows 20000 --batch-sizes 1 100 1000
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime, timezone
+
+from common import DATABASE_URL, reset_schema
+
+from sqlalchemy import create_engine, delete, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import database
+from app.models.models import ExecutionLog, Job
+from app.services.log_writer import LogBatchWriter
+
+
+def seed_job(engine):
+    with engine.begin() as conn:
+        return conn.execute(insert(Job).returning(Job.id, Job.job_id), [{
+            "job_id": uuid.uuid4(), "job_name": "bench", "type": "sleep", "status": "completed",
+            "priority": "Normal", "run_at": datetime.now(timezone.utc),
+        }]).first()
+
+
+def log_message(job, attempt):
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "job_id": job.id, "job_uuid": str(job.job_id), "log_timestamp": now,
+        "message": "Job completed successfully", "duration_seconds": 0.01, "is_successful": True,
+        "results": {"slept": 0.01}, "cpu_units": 1, "memory_mb": 128,
+        "execution_start_time": now, "execution_end_time": now, "attempt_number": attempt,
+    }
+
+
+def write(session_factory, messages, batch_size):
+    writer = LogBatchWriter(session_factory, batch_size=batch_size, flush_seconds=60)
+    started = time.perf_counter()
+    for tag, message in enumerate(messages, start=1):
+        if writer.add(tag, message):
+            writer.flush()
+    writer.flush()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100, 1000])
+    args = parser.parse_args()
+
+    database.engine.echo = False
+    engine = create_engine(DATABASE_URL)
+    session_factory = sessionmaker(bind=engine)
+    reset_schema(engine)
+    job = seed_job(engine)
+    messages = [log_message(job, attempt) for attempt in range(args.rows)]
+
+    print(f"{'batch size':>10} {'rows':>8} {'seconds':>10} {'rows/sec':>10}")
+    for batch_size in args.batch_sizes:
+        with engine.begin() as conn:
+            conn.execute(delete(ExecutionLog))
+        elapsed = write(session_factory, messages, batch_size)
+        print(f"{batch_size:>10} {args.rows:>8} {elapsed:>10.2f} {args.rows / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Message encoding benchmark: bytes and encode / decode time per dispatch message.
+
+Builds a job with a payload of each --payload-sizes (bytes of JSON) and
+encodes its dispatch message three ways:
+
+to_dict+json:      the whole row (payload, results and all), json.dumps, as
+                   the scheduler used to publish it.
+envelope+json:     scheduler.dispatch_message, the payload inline only up to
+                   --inline-bytes, compact JSON.
+envelope+msgpack:  the same envelope, msgpack.
+
+Also reports a log event (the worker's attempt record) in each codec.
+
+Usage:
+    python benchmarks/message_codecs.py --payload-sizes 0 100 1000 10000 100000
+"""
+import argparse
+import json
+import timeit
+import uuid
+from datetime import datetime, timezone
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+
+from app.models.models import Job
+from app.services.rabbitmq_client import CODECS
+from app.services.scheduler import dispatch_message
+
+
+def make_job(payload_size):
+    now = datetime.now(timezone.utc)
+    payload = {"items": []} if payload_size else None
+    while payload_size and len(json.dumps(payload)) < payload_size:
+        payload["items"].append({"id": len(payload["items"]), "name": "item", "weight": 0.5, "tags": ["a", "b"]})
+    return Job(id=12345, job_id=uuid.uuid4(), job_name="nightly report", type="http", status="claimed",
+               priority="Normal", payload=payload, results=None, timeout=300, max_attempts=3, backoff_multiplier=2.0,
+               initial_delay=1.0, times_attempted=0, unmet_dependencies=0,
+               cpu_units=1, memory_mb=256, created_time=now, modified_time=now, run_at=now,
+               claimed_by="scheduler-1", lease_expires_at=now)
+
+
+def measure(encode, decode, number):
+    body = encode()
+    encode_ns = timeit.timeit(encode, number=number) / number * 1e9
+    decode_ns = timeit.timeit(lambda: decode(body), number=number) / number * 1e9
+    return len(body), encode_ns, decode_ns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payload-sizes", type=int, nargs="+", default=[0, 100, 1000, 10000, 100000])
+    parser.add_argument("--inline-bytes", type=int, default=2048)
+    parser.add_argument("--number", type=int, default=2000, help="encodes / decodes timed per cell")
+    args = parser.parse_args()
+
+    json_codec, msgpack_codec = CODECS["json"], CODECS["msgpack"]
+    print(f"{'payload':>8} {'variant':>17} {'bytes':>8} {'encode ns':>10} {'decode ns':>10}")
+    for size in args.payload_sizes:
+        job = make_job(size)
+        inline = size <= args.inline_bytes
+        envelope = lambda: dispatch_message(job, inline, job.payload if inline else None)
+        variants = (
+            ("to_dict+json", lambda: json.dumps(job.to_dict()).encode(), json.loads),
+            ("envelope+json", lambda: json_codec.encode(envelope()), json_codec.decode),
+            ("envelope+msgpack", lambda: msgpack_codec.encode(envelope()), msgpack_codec.decode),
+        )
+        # fewer rounds for the big payloads, the old format carries them every time
+        number = max(20, args.number * 1000 // max(size, 1000))
+        for name, encode, decode in variants:
+            length, encode_ns, decode_ns = measure(encode, decode, number)
+            print(f"{size:>8} {name:>17} {length:>8} {encode_ns:>10.0f} {decode_ns:>10.0f}")
+
+    now = datetime.now(timezone.utc)
+    event = {"job_id": 12345, "job_uuid": str(uuid.uuid4()), "log_timestamp": now.isoformat(),
+             "message": "Job completed successfully", "duration_seconds": 1.25, "is_successful": True,
+             "results": {"status_code": 200}, "cpu_units": 1, "memory_mb": 256,
+             "execution_start_time": now.isoformat(), "execution_end_time": now.isoformat(),
+             "attempt_number": 1, "type": "http"}
+    print()
+    print(f"{'log event':>8} {'variant':>17} {'bytes':>8} {'encode ns':>10} {'decode ns':>10}")
+    for codec in (json_codec, msgpack_codec):
+        length, encode_ns, decode_ns = measure(lambda: codec.encode(event), codec.decode, args.number)
+        print(f"{'':>8} {codec.name:>17} {length:>8} {encode_ns:>10.0f} {decode_ns:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
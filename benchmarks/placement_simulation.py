@@ -0,0 +1,162 @@
+"""
+Placement simulation: resource-aware packing vs blind dispatch.
+
+Discrete-time simulation of a worker fleet receiving a stream of mixed-size
+jobs. No database or broker is involved.
+
+    blind      every job is pushed to a worker round-robin as soon as it is
+               ready; the worker starts jobs from its queue in FIFO order
+               whenever the head job fits (what a shared queue does today)
+    first_fit  the scheduler keeps ready jobs and places them, in priority
+    best_fit   order, on a worker with enough free cpu/memory using
+               services/resources.py:CapacityTracker fed by heartbeats
+
+Reports cpu utilization and queue wait (ready -> started) per strategy.
+
+Usage:
+    python benchmarks/placement_simulation.py --workers 10 --seconds 600
+"""
+import argparse
+import random
+
+from common import percentile
+
+from app.services.resources import CapacityTracker
+
+WORKER_CPU = 8
+WORKER_MEMORY_MB = 16384
+# (share, cpu_units, memory_mb, mean duration seconds)
+JOB_MIX = [
+    (0.6, 1, 512, 5),
+    (0.3, 2, 4096, 10),
+    (0.1, 6, 12288, 20),
+]
+PRIORITIES = ["Critical", "High", "Normal", "Low"]
+PRIORITY_ORDER = {name: rank for rank, name in enumerate(PRIORITIES)}
+
+
+class SimJob:
+    def __init__(self, job_id, arrived_at, rng):
+        roll = rng.random()
+        for share, cpu, memory, duration in JOB_MIX:
+            if roll < share:
+                break
+            roll -= share
+        self.job_id = job_id
+        self.cpu_units = cpu
+        self.memory_mb = memory
+        self.duration = rng.expovariate(1 / duration)
+        self.priority = rng.choice(PRIORITIES)
+        self.arrived_at = arrived_at
+        self.started_at = None
+
+
+class SimWorker:
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.cpu_free = WORKER_CPU
+        self.memory_free = WORKER_MEMORY_MB
+        self.queue = []     # jobs delivered but not started (blind dispatch)
+        self.running = []   # (finishes_at, job)
+
+    def fits(self, job):
+        return job.cpu_units <= self.cpu_free and job.memory_mb <= self.memory_free
+
+    def start(self, job, now):
+        self.cpu_free -= job.cpu_units
+        self.memory_free -= job.memory_mb
+        job.started_at = now
+        self.running.append((now + job.duration, job))
+
+    def finish(self, now):
+        still_running = []
+        for finishes_at, job in self.running:
+            if finishes_at <= now:
+                self.cpu_free += job.cpu_units
+                self.memory_free += job.memory_mb
+            else:
+                still_running.append((finishes_at, job))
+        self.running = still_running
+
+    def heartbeat(self, now):
+        return {"worker_id": self.worker_id, "cpu_units_free": self.cpu_free,
+                "memory_mb_free": self.memory_free, "cpu_units_total": WORKER_CPU,
+                "memory_mb_total": WORKER_MEMORY_MB, "sent_at": now}
+
+
+def simulate(strategy, args):
+    rng = random.Random(args.seed)
+    clock = [0.0]
+    tracker = CapacityTracker(clock=lambda: clock[0])
+    workers = [SimWorker(f"w{n}") for n in range(args.workers)]
+    by_id = {worker.worker_id: worker for worker in workers}
+    pending, jobs = [], []
+    busy_cpu_seconds = 0.0
+    next_worker = 0
+    steps = int(args.seconds / args.tick)
+    next_arrival = rng.expovariate(args.rate)
+
+    for step in range(steps):
+        now = step * args.tick
+        clock[0] = now
+        for worker in workers:
+            worker.finish(now)
+
+        # Poisson arrivals over this tick
+        while next_arrival < now + args.tick:
+            next_arrival += rng.expovariate(args.rate)
+            job = SimJob(len(jobs), now, rng)
+            jobs.append(job)
+            if strategy == "blind":
+                workers[next_worker].queue.append(job)
+                next_worker = (next_worker + 1) % len(workers)
+            else:
+                pending.append(job)
+
+        if strategy == "blind":
+            for worker in workers:
+                while worker.queue and worker.fits(worker.queue[0]):
+                    worker.start(worker.queue.pop(0), now)
+        else:
+            if step % max(1, int(args.heartbeat / args.tick)) == 0:
+                for worker in workers:
+                    tracker.update(worker.heartbeat(now))
+            pending.sort(key=lambda job: (PRIORITY_ORDER[job.priority], job.arrived_at))
+            placed, pending = tracker.place(pending, strategy)
+            for job, worker_id in placed:
+                worker = by_id[worker_id]
+                if worker.fits(job):
+                    worker.start(job, now)
+                else:
+                    # stale view of the worker, it queues the job until it fits
+                    worker.queue.append(job)
+            for worker in workers:
+                while worker.queue and worker.fits(worker.queue[0]):
+                    worker.start(worker.queue.pop(0), now)
+
+        busy_cpu_seconds += sum(WORKER_CPU - worker.cpu_free for worker in workers) * args.tick
+
+    waits = [job.started_at - job.arrived_at for job in jobs if job.started_at is not None]
+    utilization = busy_cpu_seconds / (len(workers) * WORKER_CPU * args.seconds)
+    return utilization, waits, len(jobs) - len(waits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=600)
+    parser.add_argument("--rate", type=float, default=3.2, help="job arrivals per second (3.2 is ~85%% of the default fleet)")
+    parser.add_argument("--tick", type=float, default=0.1)
+    parser.add_argument("--heartbeat", type=float, default=1.0, help="seconds between worker heartbeats")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'strategy':>10} {'cpu util':>9} {'wait p50 s':>11} {'wait p95 s':>11} {'wait p99 s':>11} {'not started':>12}")
+    for strategy in ("blind", "first_fit", "best_fit"):
+        utilization, waits, not_started = simulate(strategy, args)
+        print(f"{strategy:>10} {utilization:>9.1%} {percentile(waits, 50):>11.2f} "
+              f"{percentile(waits, 95):>11.2f} {percentile(waits, 99):>11.2f} {not_started:>12}")
+
+
+if __name__ == "__main__":
+    main()
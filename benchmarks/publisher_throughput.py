@@ -0,0 +1,93 @@
+"""
+Publisher benchmark: confirmed messages/sec with 1, 8 and 32 concurrent publishers.
+
+Starts the stand-in broker (benchmarks/amqp_stand_in.py) in its own process
+and has N threads publish through services/publisher.py:PublisherPool:
+
+shared: a pool of one connection, i.e. the old single RabbitMQClient made
+        safe for threads with a lock: publishers take turns.
+pool:   a pool of --pool-size connections (default: one per publisher).
+
+--mode single publishes message by message, each one confirmed by the broker;
+--mode batch publishes --batch-size messages per transaction. --confirm-ms is
+how long the broker takes per confirm (durable write); --drop-after makes it
+drop each connection after that many messages, so reconnects are included.
+
+Usage:
+    python benchmarks/publisher_throughput.py --publishers 1 8 32 --messages 20000 --confirm-ms 1
+"""
+import argparse
+import multiprocessing
+import threading
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+
+import pika
+
+from amqp_stand_in import serve
+from app.services.publisher import PublisherPool
+
+MESSAGE = {"job_id": "0b9a6c1e-8d0f-4a53-9d3e-2f6a1f0c7e21", "type": "sleep", "payload": {"duration_seconds": 0.1}}
+
+
+def run(port, publishers, pool_size, args):
+    parameters = pika.ConnectionParameters("127.0.0.1", port)
+    pool = PublisherPool(size=pool_size, connect=lambda: pika.BlockingConnection(parameters),
+                         initial_delay=0.01)
+    per_publisher = args.messages // publishers
+    failures = [0]
+
+    def publish():
+        if args.mode == "single":
+            for _ in range(per_publisher):
+                if not pool.publish_message("job_dispatch_exchange", "job.dispatch.bench", MESSAGE, 4):
+                    failures[0] += 1
+        else:
+            batch = [("job.dispatch.bench", MESSAGE, 4)] * args.batch_size
+            for _ in range(per_publisher // args.batch_size):
+                if not pool.publish_batch("job_dispatch_exchange", batch):
+                    failures[0] += 1
+
+    threads = [threading.Thread(target=publish) for _ in range(publishers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stats = pool.stats()
+    pool.close()
+    return stats["published"] / elapsed, stats["opened"], failures[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--publishers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--messages", type=int, default=20000, help="per run, split between the publishers")
+    parser.add_argument("--mode", choices=["single", "batch"], default="single")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--pool-size", type=int, default=None, help="default: one connection per publisher")
+    parser.add_argument("--confirm-ms", type=float, default=1.0)
+    parser.add_argument("--drop-after", type=int, default=0)
+    args = parser.parse_args()
+
+    ready, port_sender = multiprocessing.Pipe(duplex=False)
+    broker = multiprocessing.Process(target=serve, args=(0, args.confirm_ms, args.drop_after, port_sender), daemon=True)
+    broker.start()
+    port = ready.recv()
+
+    print(f"{args.messages} messages, {args.mode}, broker confirms in {args.confirm_ms} ms"
+          + (f", drops connections every {args.drop_after} messages" if args.drop_after else ""))
+    print(f"{'publishers':>10} {'variant':>8} {'connections':>11} {'msgs/sec':>10} {'opened':>7} {'failed':>7}")
+    try:
+        for publishers in args.publishers:
+            for variant, pool_size in (("shared", 1), ("pool", args.pool_size or publishers)):
+                rate, opened, failed = run(port, publishers, pool_size, args)
+                print(f"{publishers:>10} {variant:>8} {pool_size:>11} {rate:>10.0f} {opened:>7} {failed:>7}")
+    finally:
+        broker.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Scheduler tick latency benchmark.
+
+Seeds a scratch database with N jobs and times one call to
+`get_uncompleted_jobs` (the readiness query the scheduler runs every tick).
+
+Usage (from the repo root, with the DB_* env vars pointing at a scratch db):
+    python benchmarks/scheduler_tick.py --jobs 10000 100000 1000000
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from common import DATABASE_URL, reset_schema
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+
+from app.models.models import Job
+from app.services.scheduler import get_uncompleted_jobs
+
+CHUNK_SIZE = 10_000
+WAITING_RATIO = 0.2      # share of jobs still waiting to be scheduled
+DEPENDENT_RATIO = 0.1    # share of waiting jobs that depend on another job
+
+
+def seed_jobs(engine, total):
+    past = datetime.now(timezone.utc) - timedelta(minutes=1)
+    priorities = ["Critical", "High", "Normal", "Low"]
+    with engine.begin() as conn:
+        for start in range(0, total, CHUNK_SIZE):
+            rows = []
+            for _ in range(min(CHUNK_SIZE, total - start)):
+                rows.append({
+                    "job_id": uuid.uuid4(),
+                    "job_name": "bench",
+                    "type": "bench",
+                    "status": "waiting" if random.random() < WAITING_RATIO else "completed",
+                    "priority": random.choice(priorities),
+                    "run_at": past,
+                })
+            conn.execute(insert(Job), rows)
+
+        # wire a share of the waiting jobs to a random earlier job
+        conn.execute(text(
+            "INSERT INTO job_dependencies (dependant_id, depends_on_id) "
+            "SELECT id, (id * 7919) % (id - 1) + 1 FROM jobs "
+            "WHERE status = 'waiting' AND id > 1 AND random() < :ratio"
+        ), {"ratio": DEPENDENT_RATIO})
+        conn.execute(text(
+            "UPDATE jobs SET unmet_dependencies = 1 FROM job_dependencies d "
+            "JOIN jobs parent ON parent.id = d.depends_on_id "
+            "WHERE jobs.id = d.dependant_id AND parent.status != 'completed'"
+        ))
+        conn.execute(text("ANALYZE jobs"))
+        conn.execute(text("ANALYZE job_dependencies"))
+
+
+def time_ticks(session_factory, rounds):
+    samples = []
+    ready = 0
+    for _ in range(rounds):
+        db = session_factory()
+        try:
+            started = time.perf_counter()
+            ready = len(get_uncompleted_jobs(db))
+            samples.append(time.perf_counter() - started)
+        finally:
+            db.close()
+    return ready, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    session_factory = sessionmaker(bind=engine)
+
+    print(f"{'jobs':>10} {'ready':>8} {'p50 ms':>10} {'max ms':>10}")
+    for total in args.jobs:
+        reset_schema(engine)
+        seed_jobs(engine, total)
+        ready, samples = time_ticks(session_factory, args.rounds)
+        print(f"{total:>10} {ready:>8} {statistics.median(samples) * 1000:>10.1f} {max(samples) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Live stream benchmark: 1,000 clients on GET /jobs/stream, shared hub vs polling.
+
+hub:     one StreamHub fed from a thread (as the broker consumer does) at
+         --rate events/sec. Clients subscribe with a mix of filters (job_id,
+         status, none) and a --slow-fraction of them take --slow-ms per send.
+polling: the previous implementation, every client runs its own
+         SELECT ... WHERE id > last every 2 seconds, while rows are inserted
+         into execution_logs at --rate (needs the scratch database).
+reconnect: a reconnect storm after a deploy. --rows logs are stored, then
+         every client reconnects at once with ?since= somewhere in the last
+         --since-window events to a freshly started hub (replay buffer empty).
+         With --legacy each client instead reads everything again, as a
+         client that lost its last_log_id did.
+
+Reports delivery latency (event created -> client has it) for the clients
+keeping up, events dropped for the slow ones, and for polling the queries/sec
+sent to the database.
+
+Usage:
+    python benchmarks/stream_fanout.py --mode hub --clients 1000 --rate 100 --duration 10
+    python benchmarks/stream_fanout.py --mode polling --clients 1000 --rate 100 --duration 10
+    python benchmarks/stream_fanout.py --mode reconnect --clients 1000 --rows 100000 --since-window 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from common import DATABASE_URL, percentile, reset_schema
+
+# the hub imports its modules relative to app/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models.models import ExecutionLog, Job
+from services.stream import StreamHub, fetch_events
+
+STATUSES = ["completed", "failed", "retrying"]
+
+
+def client_filters(args, job_uuids):
+    # 70% follow one job, 20% one status, 10% everything
+    draw = random.random()
+    if draw < 0.7:
+        return {"job_ids": [random.choice(job_uuids)]}
+    if draw < 0.9:
+        return {"statuses": [random.choice(STATUSES)]}
+    return {}
+
+
+def report(latencies, received, dropped, elapsed, extra=""):
+    print(f"{'received':>10} {'dropped':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}  {extra}")
+    if not latencies:
+        print(f"{received:>10} {dropped:>8}  no event delivered")
+        return
+    print(f"{received:>10} {dropped:>8} {percentile(latencies, 50) * 1000:>8.1f} "
+          f"{percentile(latencies, 99) * 1000:>8.1f} {max(latencies) * 1000:>8.1f}")
+
+
+async def run_hub(args, job_uuids):
+    hub = StreamHub(queue_size=args.queue_size)
+    hub.start = lambda: None # events come from the feeder thread below, not from a broker
+    hub.loop = asyncio.get_running_loop()
+    latencies, received = [], 0
+    publish = hub.publish
+    publish_seconds = []
+
+    def timed_publish(event):
+        started = time.perf_counter()
+        publish(event)
+        publish_seconds.append(time.perf_counter() - started)
+    hub.publish = timed_publish
+
+    async def client(subscription, send_seconds):
+        nonlocal received
+        while (event := await subscription.queue.get()) is not None:
+            if send_seconds:
+                await asyncio.sleep(send_seconds) # a socket that drains slowly
+            else:
+                latencies.append(time.perf_counter() - event["sent_at"])
+            received += 1
+
+    subscriptions = []
+    tasks = []
+    for index in range(args.clients):
+        subscription = hub.subscribe(**client_filters(args, job_uuids))
+        slow = index < args.clients * args.slow_fraction
+        subscriptions.append((subscription, slow))
+        tasks.append(asyncio.ensure_future(client(subscription, args.slow_ms / 1000 if slow else 0)))
+
+    def feed():
+        interval, next_at, seq = 1 / args.rate, time.perf_counter(), 0
+        deadline = next_at + args.duration
+        while next_at < deadline:
+            seq += 1
+            hub.publish_threadsafe({
+                "id": seq, "job_uuid": random.choice(job_uuids), "status": random.choice(STATUSES),
+                "type": "sleep", "sent_at": time.perf_counter(),
+            })
+            next_at += interval
+            time.sleep(max(0, next_at - time.perf_counter()))
+
+    started = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(None, feed)
+    await asyncio.sleep(1) # let the fast clients drain
+    elapsed = time.perf_counter() - started
+    dropped_slow = sum(s.dropped for s, slow in subscriptions if slow)
+    dropped_fast = sum(s.dropped for s, slow in subscriptions if not slow)
+    for subscription, _ in subscriptions:
+        subscription.offer(None) # stop
+    await asyncio.gather(*tasks)
+
+    report(latencies, received, dropped_slow + dropped_fast, elapsed,
+           f"{hub.events} events, dropped by slow clients {dropped_slow}, by others {dropped_fast}, 0 queries")
+    print(f"hub.publish per event: p50 {percentile(publish_seconds, 50) * 1e6:.0f} us, "
+          f"p99 {percentile(publish_seconds, 99) * 1e6:.0f} us")
+
+
+async def run_polling(args, job_uuids):
+    engine = create_engine(DATABASE_URL)
+    reset_schema(engine)
+    with engine.begin() as conn:
+        job_pks = conn.execute(insert(Job).returning(Job.id, Job.job_id), [{
+            "job_id": job_uuid, "job_name": "stream", "type": "sleep", "status": "running",
+            "priority": "Normal", "run_at": datetime.now(timezone.utc),
+        } for job_uuid in job_uuids]).all()
+
+    async_engine = create_async_engine(DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"),
+                                       pool_size=10, max_overflow=0, pool_timeout=args.pool_timeout)
+    sessions = async_sessionmaker(async_engine, expire_on_commit=False)
+    latencies, received, queries, errors = [], 0, 0, 0
+    stopping = asyncio.Event()
+
+    async def client(filters):
+        # the old job_stream loop (it did not filter, the filter is applied here)
+        nonlocal received, queries, errors
+        last_log_id = 0
+        while not stopping.is_set():
+            try:
+                async with sessions() as db:
+                    logs = (await db.execute(
+                        select(ExecutionLog).where(ExecutionLog.id > last_log_id).order_by(ExecutionLog.id)
+                    )).scalars().all()
+            except Exception: # pool timeout: more pollers than connections
+                errors += 1
+                await asyncio.sleep(2)
+                continue
+            queries += 1
+            now = datetime.now(timezone.utc)
+            for log in logs:
+                if "job_ids" not in filters or str(log.job_uuid) in filters["job_ids"]:
+                    latencies.append((now - log.log_timestamp).total_seconds())
+                    received += 1
+            if logs:
+                last_log_id = logs[-1].id
+            await asyncio.sleep(2)
+
+    def feed():
+        interval, next_at = 1 / args.rate, time.perf_counter()
+        deadline = next_at + args.duration
+        with engine.connect() as conn:
+            while next_at < deadline:
+                job_pk, job_uuid = random.choice(job_pks)
+                now = datetime.now(timezone.utc)
+                conn.execute(insert(ExecutionLog), [{
+                    "job_id": job_pk, "job_uuid": job_uuid, "log_timestamp": now, "message": "ok",
+                    "is_successful": True, "attempt_number": 1,
+                }])
+                conn.commit()
+                next_at += interval
+                time.sleep(max(0, next_at - time.perf_counter()))
+
+    tasks = [asyncio.ensure_future(client(client_filters(args, job_uuids))) for _ in range(args.clients)]
+    started = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(None, feed)
+    await asyncio.sleep(2.5) # one more poll round
+    elapsed = time.perf_counter() - started
+    stopping.set()
+    issued = queries
+    await asyncio.gather(*tasks)
+    await async_engine.dispose()
+    report(latencies, received, 0, elapsed, f"{issued / elapsed:.0f} queries/sec, {errors} pool timeouts")
+
+
+async def run_reconnect(args, job_uuids):
+    engine = create_engine(DATABASE_URL)
+    reset_schema(engine)
+    with engine.begin() as conn:
+        job_pks = conn.execute(insert(Job).returning(Job.id, Job.job_id), [{
+            "job_id": job_uuid, "job_name": "stream", "type": "sleep", "status": "running",
+            "priority": "Normal", "run_at": datetime.now(timezone.utc),
+        } for job_uuid in job_uuids]).all()
+        now = datetime.now(timezone.utc)
+        for start in range(0, args.rows, 10_000):
+            conn.execute(insert(ExecutionLog), [{
+                "job_id": job_pk, "job_uuid": job_uuid, "log_timestamp": now, "message": "ok",
+                "is_successful": True, "attempt_number": 1,
+            } for job_pk, job_uuid in random.choices(job_pks, k=min(10_000, args.rows - start))])
+        last_id = conn.execute(select(ExecutionLog.id).order_by(ExecutionLog.id.desc()).limit(1)).scalar()
+
+    queries = 0
+
+    async def counted_fetch(**kwargs):
+        nonlocal queries
+        queries += 1
+        return await fetch_events(**kwargs)
+
+    hub = StreamHub(fetch=counted_fetch)
+    hub.start = lambda: None
+    samples, events, errors = [], 0, 0
+
+    async def reconnect(filters):
+        nonlocal events, errors
+        since = last_id - random.randint(0, args.since_window)
+        started = time.perf_counter()
+        try:
+            if args.legacy:
+                replayed = await counted_fetch(after=0, limit=args.rows) # lost last_log_id: everything again
+            else:
+                replayed = await hub.replay(hub.subscribe(**filters), since)
+        except Exception: # pool timeout
+            errors += 1
+            return
+        samples.append(time.perf_counter() - started)
+        events += len(replayed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(reconnect(client_filters(args, job_uuids)) for _ in range(args.clients)))
+    elapsed = time.perf_counter() - started
+    print(f"{'clients':>8} {'queries':>8} {'errors':>7} {'events':>9} {'seconds':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    print(f"{args.clients:>8} {queries:>8} {errors:>7} {events:>9} {elapsed:>8.2f} "
+          f"{percentile(samples, 50) * 1000:>8.1f} {percentile(samples, 99) * 1000:>8.1f}" if samples else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["hub", "polling", "reconnect"], default="hub")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--jobs", type=int, default=200, help="distinct jobs the events belong to")
+    parser.add_argument("--rate", type=float, default=100, help="events/sec")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--slow-fraction", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=200, help="time a slow client takes per send")
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument("--rows", type=int, default=100_000, help="reconnect: stored log rows")
+    parser.add_argument("--since-window", type=int, default=20_000, help="reconnect: how far back clients resume")
+    parser.add_argument("--legacy", action="store_true", help="reconnect: every client reads the whole table")
+    parser.add_argument("--pool-timeout", type=float, default=30, help="polling: seconds to wait for a connection")
+    args = parser.parse_args()
+
+    random.seed(1)
+    job_uuids = [str(uuid.uuid4()) for _ in range(args.jobs)]
+    if args.mode != "reconnect":
+        print(f"{args.mode}: {args.clients} clients, {args.rate:.0f} events/sec for {args.duration:.0f}s")
+    modes = {"hub": run_hub, "polling": run_polling, "reconnect": run_reconnect}
+    asyncio.run(modes[args.mode](args, job_uuids))
+
+
+if __name__ == "__main__":
+    main()
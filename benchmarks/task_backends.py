@@ -0,0 +1,100 @@
+"""
+Task backend benchmark: async vs thread pool vs process pool.
+
+Runs the same CPU-bound task (iterated sha256) and I/O-bound task (sleep)
+through services/tasks.py on each backend, with --concurrency tasks in flight,
+and reports tasks/sec.
+
+Usage:
+    python benchmarks/task_backends.py --tasks 200 --concurrency 32
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+
+from app.services.tasks import TaskRegistry, create_process_pool
+
+registry = TaskRegistry()
+
+
+def cpu_work(payload):
+    digest = b"payload"
+    for _ in range(payload["rounds"]):
+        digest = hashlib.sha256(digest).digest()
+    return digest.hex()
+
+
+async def cpu_work_async(payload):
+    return cpu_work(payload)
+
+
+def io_work(payload):
+    time.sleep(payload["seconds"])
+
+
+async def io_work_async(payload):
+    await asyncio.sleep(payload["seconds"])
+
+
+for backend in ("async", "thread", "process"):
+    registry.task(f"cpu.{backend}", backend=backend)(cpu_work_async if backend == "async" else cpu_work)
+    registry.task(f"io.{backend}", backend=backend)(io_work_async if backend == "async" else io_work)
+
+
+async def run(task, payload, total, concurrency, thread_pool, process_pool):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with slots:
+            await task.execute(payload, thread_pool, process_pool)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+async def main_async(args):
+    thread_pool = ThreadPoolExecutor(max_workers=args.threads)
+    process_pool = create_process_pool(args.processes)
+    # warm the process pool up, spawn cost is paid once per worker, not per task
+    await asyncio.gather(*(registry.get("cpu.process").execute({"rounds": 1}, thread_pool, process_pool)
+                           for _ in range(args.processes)))
+
+    workloads = {
+        "cpu": {"rounds": args.cpu_rounds},
+        "io": {"seconds": args.io_ms / 1000},
+    }
+    results = []
+    for workload, payload in workloads.items():
+        for backend in ("async", "thread", "process"):
+            task = registry.get(f"{workload}.{backend}")
+            results.append((workload, backend, await run(task, payload, args.tasks, args.concurrency,
+                                                         thread_pool, process_pool)))
+    thread_pool.shutdown()
+    process_pool.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cpu-rounds", type=int, default=50_000)
+    parser.add_argument("--io-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    print(f"{'workload':>8} {'backend':>8} {'tasks/sec':>10}")
+    for workload, backend, rate in results:
+        print(f"{workload:>8} {backend:>8} {rate:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Worker throughput benchmark: jobs/sec for a grid of concurrency, prefetch and
+task duration.
+
+Drives services/worker.py:JobExecutor with an in-memory job store and a
+stand-in broker that, like RabbitMQ with basic_qos, never has more than
+`prefetch` unacked deliveries outstanding. Jobs use the built-in "sleep" task
+(asyncio.sleep), so the numbers reflect executor overhead and pipelining,
+not task work.
+
+Usage:
+    python benchmarks/worker_throughput.py --jobs 2000 --concurrency 8 64 256 \
+        --prefetch 1 16 256 --duration-ms 10 50
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+
+from app.services.worker import JobExecutor
+
+
+class MemoryStore:
+    # stands in for the database side of a job attempt
+    def __init__(self, duration):
+        self.duration = duration
+
+    def start(self, job_id, with_payload=True):
+        return {"id": job_id, "job_id": job_id, "type": "sleep", "timeout": None, "attempt": 1,
+                "payload": {"duration_seconds": self.duration}, "cpu_units": 0, "memory_mb": 0}
+
+    def finish(self, job, is_successful, results, log=None):
+        pass
+
+
+async def run(concurrency, prefetch, duration, total, delivery_latency):
+    executor = JobExecutor(MemoryStore(duration), concurrency=concurrency)
+    credits = asyncio.Semaphore(prefetch)
+    finished = asyncio.Event()
+    acked = [0]
+
+    def ack(requeue=False):
+        acked[0] += 1
+        credits.release()
+        if acked[0] == total:
+            finished.set()
+
+    started = time.perf_counter()
+    for job_id in range(total):
+        await credits.acquire()
+        if delivery_latency:
+            await asyncio.sleep(delivery_latency)
+        executor.submit({"job_id": job_id}, ack)
+    await finished.wait()
+    elapsed = time.perf_counter() - started
+    await executor.drain()
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 64, 256])
+    parser.add_argument("--prefetch", type=int, nargs="+", default=[1, 16, 256])
+    parser.add_argument("--duration-ms", type=float, nargs="+", default=[10, 50])
+    parser.add_argument("--delivery-latency-ms", type=float, default=0.0,
+                        help="simulated broker latency per delivery")
+    args = parser.parse_args()
+
+    print(f"{'concurrency':>11} {'prefetch':>9} {'task ms':>8} {'jobs/sec':>10}")
+    for concurrency, prefetch, duration_ms in itertools.product(args.concurrency, args.prefetch, args.duration_ms):
+        rate = asyncio.run(run(concurrency, prefetch, duration_ms / 1000, args.jobs, args.delivery_latency_ms / 1000))
+        print(f"{concurrency:>11} {prefetch:>9} {duration_ms:>8.0f} {rate:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
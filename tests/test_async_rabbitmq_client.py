@@ -0,0 +1,328 @@
+import asyncio
+from collections import deque
+from types import SimpleNamespace
+
+import pytest
+from pika import spec
+from pika.exceptions import AMQPConnectionError, NackError, StreamLostError
+
+from app.services import worker
+from app.services.lanes import LaneScheduler
+from app.services.rabbitmq_client import AsyncRabbitMQClient, RabbitMQClient
+
+class FakeBroker:
+    # stands in for RabbitMQ: queues, bindings (exact routing keys), confirms
+    def __init__(self):
+        self.queues = {}
+        self.bindings = []  # (exchange, routing key, queue)
+        self.connections = []
+        self.down = False
+        self.nack = False           # refuse the next publishes
+        self.confirm_together = True # one multiple ack per loop iteration, as RabbitMQ batches them
+
+    def connect(self, parameters, on_open_callback, on_open_error_callback, on_close_callback, custom_ioloop):
+        connection = FakeConnection(self, custom_ioloop, on_close_callback)
+        self.connections.append(connection)
+        if self.down:
+            custom_ioloop.call_soon(on_open_error_callback, connection, AMQPConnectionError("broker down"))
+        else:
+            connection.is_open = True
+            custom_ioloop.call_soon(on_open_callback, connection)
+        return connection
+
+class FakeConnection:
+    def __init__(self, broker, loop, on_close_callback):
+        self.broker = broker
+        self.loop = loop
+        self.on_close_callback = on_close_callback
+        self.is_open = False
+        self.is_closing = False
+        self.channels = []
+
+    def channel(self, on_open_callback):
+        channel = FakeChannel(self)
+        self.channels.append(channel)
+        self.loop.call_soon(on_open_callback, channel)
+        return channel
+
+    def close(self, reason=None):
+        self.is_open = False
+        for channel in self.channels:
+            channel.closed(reason or "closed")
+        self.loop.call_soon(self.on_close_callback, self, reason or "closed")
+
+    def lose(self):
+        self.close(StreamLostError("connection reset"))
+
+class FakeChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.loop = connection.loop
+        self.is_open = True
+        self.on_close = []
+        self.publish_tag = 0
+        self.unconfirmed = []
+        self.prefetch = 0
+        self.consumers = {}  # tag -> [queue, callback, auto_ack, unacked tags]
+        self.delivery_tag = 0
+        self.unacked = {}    # delivery tag -> (consumer tag, queue, body, properties)
+
+    def add_on_close_callback(self, callback):
+        self.on_close.append(callback)
+
+    def add_on_cancel_callback(self, callback):
+        pass
+
+    def closed(self, reason):
+        self.is_open = False
+        for callback in self.on_close:
+            self.loop.call_soon(callback, self, reason)
+
+    def reply(self, callback, method):
+        self.loop.call_soon(callback, SimpleNamespace(method=method))
+
+    def confirm_delivery(self, ack_nack_callback, callback):
+        self.on_confirm = ack_nack_callback
+        self.reply(callback, spec.Confirm.SelectOk())
+
+    def exchange_declare(self, exchange, exchange_type, durable, callback):
+        self.reply(callback, spec.Exchange.DeclareOk())
+
+    def queue_declare(self, queue, callback, durable=True, arguments=None, exclusive=False, auto_delete=False):
+        queue = queue or f"amq.gen-{len(self.broker.queues)}"
+        self.broker.queues.setdefault(queue, deque())
+        self.reply(callback, spec.Queue.DeclareOk(queue=queue))
+
+    def queue_bind(self, queue, exchange, routing_key, callback):
+        if (exchange, routing_key, queue) not in self.broker.bindings: # binding again changes nothing
+            self.broker.bindings.append((exchange, routing_key, queue))
+        self.reply(callback, spec.Queue.BindOk())
+
+    def basic_qos(self, prefetch_count, callback):
+        self.prefetch = prefetch_count
+        self.reply(callback, spec.Basic.QosOk())
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        for bound_exchange, bound_key, queue in self.broker.bindings:
+            if (bound_exchange, bound_key) == (exchange, routing_key):
+                self.broker.queues[queue].append((body, properties))
+        self.publish_tag += 1
+        if not self.broker.confirm_together:
+            self.loop.call_soon(self.confirm, self.publish_tag, False)
+        elif not self.unconfirmed:
+            self.loop.call_soon(lambda: self.confirm(self.unconfirmed[-1], True))
+        self.unconfirmed.append(self.publish_tag)
+        self.loop.call_soon(self.deliver)
+
+    def confirm(self, delivery_tag, multiple):
+        if not self.is_open:
+            return
+        self.unconfirmed = [tag for tag in self.unconfirmed if tag > delivery_tag]
+        method = spec.Basic.Nack if self.broker.nack else spec.Basic.Ack
+        self.on_confirm(SimpleNamespace(method=method(delivery_tag=delivery_tag, multiple=multiple)))
+
+    def basic_consume(self, queue, on_message_callback, auto_ack, callback):
+        tag = f"ctag-{len(self.consumers)}"
+        self.consumers[tag] = [queue, on_message_callback, auto_ack, set()]
+        self.reply(callback, spec.Basic.ConsumeOk(consumer_tag=tag))
+        self.loop.call_soon(self.deliver)
+        return tag
+
+    def basic_cancel(self, consumer_tag):
+        self.consumers.pop(consumer_tag, None)
+
+    def deliver(self):
+        for tag, (queue, callback, auto_ack, unacked) in list(self.consumers.items()):
+            messages = self.broker.queues[queue]
+            while messages and self.is_open and (auto_ack or not self.prefetch or len(unacked) < self.prefetch):
+                body, properties = messages.popleft()
+                self.delivery_tag += 1
+                if not auto_ack:
+                    unacked.add(self.delivery_tag)
+                    self.unacked[self.delivery_tag] = (tag, queue, body, properties)
+                method = spec.Basic.Deliver(consumer_tag=tag, delivery_tag=self.delivery_tag, routing_key=queue)
+                callback(self, method, properties, body)
+
+    def settle(self, delivery_tag, requeue):
+        tag, queue, body, properties = self.unacked.pop(delivery_tag)
+        if tag in self.consumers:
+            self.consumers[tag][3].discard(delivery_tag)
+        if requeue:
+            self.broker.queues[queue].appendleft((body, properties))
+        self.loop.call_soon(self.deliver)
+
+    def basic_ack(self, delivery_tag):
+        self.settle(delivery_tag, requeue=False)
+
+    def basic_nack(self, delivery_tag, requeue):
+        self.settle(delivery_tag, requeue)
+
+async def connected_client(broker, **kwargs):
+    client = AsyncRabbitMQClient(connection_class=broker.connect, **kwargs)
+    await client.connect()
+    await client.declare_exchange("exchange")
+    await client.declare_queue("queue")
+    await client.bind_queue("queue", "exchange", "key")
+    return client
+
+async def test_many_publishes_wait_for_their_confirms_at_once():
+    for confirm_together in (True, False):
+        broker = FakeBroker()
+        broker.confirm_together = confirm_together
+        client = await connected_client(broker)
+        await asyncio.gather(*(client.publish_message("exchange", "key", {"n": n}) for n in range(1000)))
+        assert len(broker.queues["queue"]) == 1000 and not client.confirms
+
+async def test_refused_message_raises():
+    broker = FakeBroker()
+    client = await connected_client(broker)
+    broker.nack = True
+    with pytest.raises(NackError):
+        await client.publish_message("exchange", "key", {"n": 1})
+
+async def test_consume_holds_at_most_prefetch_unacked():
+    broker = FakeBroker()
+    client = await connected_client(broker)
+    for n in range(50):
+        client.publish("exchange", "key", {"n": n})
+    held = []
+    async for delivery in client.consume("queue", prefetch=10):
+        held.append(delivery)
+        if len(held) == 10:
+            break
+    await asyncio.sleep(0.01)
+    assert len(broker.queues["queue"]) == 40 # the other 40 were never sent ahead
+
+    received = []
+    async for delivery in client.consume("queue", prefetch=10):
+        received.append(delivery.decode()["n"])
+        delivery.ack()
+        if len(received) == 40:
+            break
+    for delivery in held:
+        delivery.ack()
+    assert received == list(range(10, 50))
+
+async def test_lost_connection_fails_confirms_and_consumers():
+    broker = FakeBroker()
+    broker.confirm_together = False
+    client = await connected_client(broker)
+    confirmed = client.publish("exchange", "key", {"n": 1})
+    broker.connections[-1].channels[-1].is_open = False # the confirm never comes
+    consuming = asyncio.ensure_future(client.consume("queue").__anext__())
+    await asyncio.sleep(0)
+    broker.connections[-1].lose()
+    with pytest.raises(StreamLostError):
+        await confirmed
+    with pytest.raises(StreamLostError):
+        await consuming
+    assert not client.is_open
+    await client.close() # nothing left to close
+
+async def test_unreachable_broker_raises_on_connect():
+    broker = FakeBroker()
+    broker.down = True
+    with pytest.raises(AMQPConnectionError):
+        await AsyncRabbitMQClient(connection_class=broker.connect).connect()
+
+class MemoryStore:
+    def __init__(self):
+        self.finished = []
+
+    def start(self, job_id, with_payload=True):
+        return {"id": 1, "job_id": job_id, "type": "sleep", "timeout": None, "attempt": 1,
+                "payload": {"duration_seconds": 0.01}, "cpu_units": 0, "memory_mb": 0}
+
+    def finish(self, job, is_successful, results, log=None):
+        self.finished.append(job["job_id"])
+        return "completed"
+
+async def test_worker_consumes_runs_and_acks_on_the_event_loop():
+    broker = FakeBroker()
+    store = MemoryStore()
+    executor = worker.JobExecutor(store, concurrency=4)
+    consumer = worker.DispatchConsumer(executor, prefetch=4,
+                                       client=AsyncRabbitMQClient(connection_class=broker.connect))
+    executor.log_sink = consumer.publish_log
+    running = asyncio.ensure_future(consumer.run())
+    while not consumer.consumers:
+        await asyncio.sleep(0.01)
+
+    publisher = AsyncRabbitMQClient(connection_class=broker.connect)
+    await publisher.connect()
+    await publisher.declare_queue("logs")
+    await publisher.bind_queue("logs", RabbitMQClient.JOB_LOGS_DB_EXCHANGE, "job.logs.db.job-7")
+    for n in range(10):
+        await publisher.publish_message(RabbitMQClient.JOB_DISPATCH_EXCHANGE, "job.dispatch.*",
+                                        {"job_id": f"job-{n}", "type": "sleep"})
+    while len(store.finished) < 10:
+        await asyncio.sleep(0.01)
+
+    consumer.stop()
+    await executor.drain()
+    await running
+    channel = consumer.client.channel
+    assert not channel.unacked and not broker.queues[RabbitMQClient.JOB_DISPATCH_QUEUE]
+    assert len(broker.queues["logs"]) == 1
+    await consumer.close()
+
+async def test_worker_with_lanes_starts_low_jobs_under_a_critical_flood():
+    broker = FakeBroker()
+    store = MemoryStore()
+    executor = worker.JobExecutor(store, concurrency=1, lanes=LaneScheduler())
+    consumer = worker.DispatchConsumer(executor, prefetch=4, queues="lanes",
+                                       client=AsyncRabbitMQClient(connection_class=broker.connect))
+    running = asyncio.ensure_future(consumer.run())
+    while not consumer.consumers:
+        await asyncio.sleep(0.01)
+
+    publisher = AsyncRabbitMQClient(connection_class=broker.connect)
+    await publisher.connect()
+    for n in range(20):
+        await publisher.publish_message(RabbitMQClient.JOB_DISPATCH_EXCHANGE, "job.lane.critical.*",
+                                        {"job_id": f"critical-{n}", "type": "sleep", "priority": "Critical"})
+    await publisher.publish_message(RabbitMQClient.JOB_DISPATCH_EXCHANGE, "job.lane.low.*",
+                                    {"job_id": "low", "type": "sleep", "priority": "Low"})
+    while len(store.finished) < 21:
+        await asyncio.sleep(0.01)
+
+    consumer.stop()
+    await executor.drain()
+    await running
+    # a single priority queue would have run it last
+    assert store.finished.index("low") < 10
+    assert executor.heartbeat()["lanes"]["Low"]["started"] == 1
+    await consumer.close()
+
+async def test_worker_reconnects_until_stopped(monkeypatch):
+    monkeypatch.setattr(worker, "RECONNECT_INITIAL_DELAY", 0.01)
+    broker = FakeBroker()
+    broker.down = True
+    store = MemoryStore()
+    executor = worker.JobExecutor(store, concurrency=4)
+    consumer = worker.DispatchConsumer(executor, prefetch=4,
+                                       client=AsyncRabbitMQClient(connection_class=broker.connect))
+    running = asyncio.ensure_future(consumer.run())
+    while len(broker.connections) < 2:
+        await asyncio.sleep(0.01)
+    broker.down = False
+
+    publisher = AsyncRabbitMQClient(connection_class=broker.connect)
+    await publisher.connect()
+    for lost in range(2):
+        while not consumer.client.is_open or not consumer.consumers:
+            await asyncio.sleep(0.01)
+        await publisher.publish_message(RabbitMQClient.JOB_DISPATCH_EXCHANGE, "job.dispatch.*",
+                                        {"job_id": f"job-{lost}", "type": "sleep"})
+        while len(store.finished) <= lost:
+            await asyncio.sleep(0.01)
+        consumer.client.connection.lose()
+        await asyncio.sleep(0.05)
+    assert not running.done()
+
+    consumer.stop()
+    await executor.drain()
+    await running
+    assert store.finished == ["job-0", "job-1"]
+    await consumer.close()
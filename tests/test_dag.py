@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from app.services.dag import CycleError, DependencyGraph
+
+
+def assert_topological(graph):
+    for parent, children in graph.children.items():
+        for child in children:
+            assert graph.ord[parent] < graph.ord[child]
+
+
+def longest_chain(graph, node, known=None):
+    known = {} if known is None else known
+    if node not in known:
+        known[node] = max((longest_chain(graph, child, known) + 1 for child in graph.children.get(node, ())), default=0)
+    return known[node]
+
+
+def test_edges_in_any_order_keep_a_topological_order_and_critical_paths():
+    rng = random.Random(3)
+    # a random DAG over 300 nodes (edges from lower to higher numbers), added shuffled
+    edges = [(parent, child) for child in range(300) for parent in rng.sample(range(child), min(child, 3))]
+    rng.shuffle(edges)
+    graph = DependencyGraph()
+    for node in rng.sample(range(300), 300):
+        graph.add_node(node)
+    for parent, child in edges:
+        graph.add_edge(parent, child)
+    assert_topological(graph)
+    for node in range(0, 300, 7):
+        assert graph.critical_path(node) == longest_chain(graph, node)
+
+    loaded = DependencyGraph.load(edges)
+    assert_topological(loaded)
+    assert loaded.path == graph.path
+
+
+def test_edge_closing_a_cycle_is_rejected_with_the_cycle():
+    graph = DependencyGraph()
+    graph.add_edge(1, 2)
+    graph.add_edge(2, 3)
+    graph.add_edge(3, 4)
+    with pytest.raises(CycleError) as error:
+        graph.add_edge(4, 1)
+    assert error.value.cycle == [4, 1, 2, 3, 4]
+    assert 1 not in graph.children[4] and 4 not in graph.parents[1]
+    assert_topological(graph)
+    assert graph.critical_path(1) == 3
+    with pytest.raises(CycleError):
+        graph.add_edge(5, 5)
+
+    with pytest.raises(CycleError) as error:
+        DependencyGraph.load([(1, 2), (2, 3), (3, 1), (0, 1)])
+    assert error.value.cycle in ([1, 2, 3, 1], [2, 3, 1, 2], [3, 1, 2, 3])
+
+
+def test_new_job_under_old_ones_needs_no_reordering():
+    graph = DependencyGraph()
+    for node in range(1000):
+        graph.add_edge(node, node + 1)
+    before = dict(graph.ord)
+    graph.add_edge(500, 2000)
+    assert all(graph.ord[node] == position for node, position in before.items())
+    assert graph.critical_path(0) == 1000 and graph.critical_path(500) == 500
+
+
+def test_changed_critical_paths_are_reported_once():
+    graph = DependencyGraph()
+    graph.add_edge(1, 2)
+    graph.add_edge(2, 3)
+    assert graph.take_changed() == {1: 2, 2: 1}
+    graph.add_edge(1, 4) # no longer than what 1 has already
+    assert graph.take_changed() == {}
+    graph.add_edge(3, 5)
+    assert graph.take_changed() == {1: 3, 2: 2, 3: 1}
+
+    graph.remove_node(1)
+    assert 1 not in graph and 2 in graph and not graph.parents[2]
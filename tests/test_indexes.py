@@ -0,0 +1,75 @@
+import json
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, select, text
+
+from app.models.models import Job, JobDependency
+from app.services.scheduler import ready_job_ids
+from services.api import dependants_query, job_logs_query
+
+DB_USER = os.getenv("DB_USER", "vast")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "qweasdzx")
+DB_NAME = os.getenv("DB_NAME", "test_smart_queue")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+def indexes_used(statement):
+    # Index names in the plan. The test tables are tiny and a sequential scan
+    # would always win, so it is ruled out: what is left is whether an index
+    # can serve the query at all.
+    plan_indexes = set()
+
+    def walk(node):
+        if "Index Name" in node:
+            plan_indexes.add(node["Index Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    with engine.connect() as conn:
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+        plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+        walk((plan if isinstance(plan, list) else json.loads(plan))[0]["Plan"])
+        # an index of a partition stands for the index of the partitioned table
+        names = {conn.execute(text("SELECT coalesce(pg_partition_root(CAST(:name AS regclass))::text, :name)"), {"name": name}).scalar()
+                 for name in plan_indexes}
+        conn.rollback()
+    return names
+
+def test_scheduler_claim_matches_the_ready_index():
+    # Whether the planner picks the index for the claim depends on the table
+    # statistics the other tests leave behind, so instead of the plan this
+    # checks that the index can serve it: the claim's sort order as its
+    # columns, the claim's conditions inside its predicate.
+    with engine.connect() as conn:
+        definition = conn.execute(
+            text("SELECT pg_get_indexdef(CAST('ix_jobs_ready_priority_path_run_at' AS regclass))")
+        ).scalar()
+    assert "(priority, critical_path DESC, run_at)" in definition
+    assert "unmet_dependencies = 0" in definition
+    now = datetime.now(timezone.utc)
+    for statuses in (("retrying",), ("waiting", "ready")):
+        compiled = ready_job_ids(statuses, 100, now).compile(
+            dialect=engine.dialect, compile_kwargs={"render_postcompile": True}
+        )
+        assert "ORDER BY jobs.priority, jobs.critical_path DESC, jobs.run_at" in str(compiled)
+        assert "jobs.unmet_dependencies = %(unmet_dependencies_1)s" in str(compiled)
+        assert compiled.params["unmet_dependencies_1"] == 0
+        assert all(f"'{status}'" in definition for status in statuses)
+
+def test_job_lookup_uses_the_unique_job_id_index():
+    import uuid
+    assert indexes_used(select(Job).where(Job.job_id == uuid.uuid4())) == {"uq_jobs_job_id"}
+
+def test_dependants_use_the_depends_on_index():
+    assert indexes_used(dependants_query(1)) == {"ix_job_dependencies_depends_on_id"}
+    # complete_job's children
+    children = select(JobDependency.dependant_id).where(JobDependency.depends_on_id == 1)
+    assert indexes_used(children) == {"ix_job_dependencies_depends_on_id"}
+
+def test_job_logs_use_the_job_id_log_timestamp_index():
+    assert indexes_used(job_logs_query(1)) == {"ix_execution_logs_job_id_log_timestamp"}
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import uuid
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.services.cache import MemorySharedCache, TTLCache
+from app.services.job_events import notify_job_changes
+from services.job_cache import JobCache
+
+DB_USER = os.getenv("DB_USER", "vast")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "qweasdzx")
+DB_NAME = os.getenv("DB_NAME", "test_smart_queue")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class FakeJob:
+    def __init__(self, status):
+        self.status = status
+
+    def model_dump_json(self):
+        return f'{{"status": "{self.status}"}}'
+
+class Loader:
+    def __init__(self, status="running"):
+        self.status = status
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return FakeJob(self.status)
+
+async def listening(cache):
+    cache.start()
+    for _ in range(100):
+        if cache.listening:
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError("job cache listener did not connect")
+
+def test_ttl_cache_expires_entries():
+    now = [0.0]
+    cache = TTLCache(2, clock=lambda: now[0])
+    cache.set("a", 1, ttl=5)
+    cache.set("b", 2, ttl=50)
+    assert cache.get("a") == 1
+    now[0] = 10
+    assert cache.get("a") is None and cache.get("b") == 2
+    cache.set("c", 3, ttl=50)
+    cache.set("d", 4, ttl=50) # b is the least recently used
+    assert cache.get("b") is None
+    assert cache.stats()["expired"] == 1
+
+async def test_notification_invalidates_cached_job():
+    cache = JobCache(maxsize=100, ttl=60, terminal_ttl=600, shared=MemorySharedCache(), dsn=SQLALCHEMY_DATABASE_URL)
+    await listening(cache)
+    try:
+        job_id, load = uuid.uuid4(), Loader()
+        assert await cache.get(job_id, load) == b'{"status": "running"}'
+        assert await cache.get(job_id, load) == b'{"status": "running"}'
+        assert load.calls == 1
+
+        load.status = "completed"
+        with TestingSessionLocal() as db:
+            notify_job_changes(db, [job_id, uuid.uuid4()])
+            db.commit()
+        for _ in range(100):
+            if cache.invalidations:
+                break
+            await asyncio.sleep(0.02)
+        assert await cache.get(job_id, load) == b'{"status": "completed"}'
+        assert load.calls == 2
+        assert cache.local.entries[str(job_id)][1] - cache.local.clock() > 60 # terminal ttl
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["loads"] == 2 and stats["invalidations"] == 2
+    finally:
+        await cache.stop()
+
+async def test_job_invalidated_while_loading_is_not_stored():
+    cache = JobCache(maxsize=100, ttl=60, terminal_ttl=600, dsn=SQLALCHEMY_DATABASE_URL)
+    await listening(cache)
+    try:
+        job_id = uuid.uuid4()
+
+        async def load():
+            cache.invalidate(job_id) # changed while it was read
+            return FakeJob("running")
+
+        await cache.get(job_id, load)
+        assert str(job_id) not in cache.local.entries
+    finally:
+        await cache.stop()
+
+async def test_nothing_is_cached_without_listener():
+    cache = JobCache(maxsize=100, ttl=60, terminal_ttl=600)
+    cache.start = lambda: None
+    job_id, load = uuid.uuid4(), Loader()
+    await cache.get(job_id, load)
+    await cache.get(job_id, load)
+    assert load.calls == 2
@@ -2,11 +2,15 @@
 import pytest
 from fastapi.testclient import TestClient
 from fastapi import status
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.database import Base, get_db
+from app.models.models import Job
 import os
+import time
 import uuid
 
 # Use a separate in-memory SQLite database for testing
@@ -19,14 +23,13 @@ SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_P
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"))
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Override the get_db dependency to use the test database
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingAsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
 
@@ -36,7 +39,10 @@ def anyio_backend():
 
 @pytest.fixture(scope="module")
 def client():
-    return TestClient(app)
+    # one event loop for the whole module, the async engine's pooled
+    # connections belong to the loop they were opened on
+    with TestClient(app) as client:
+        yield client
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_test_db():
@@ -83,7 +89,7 @@ async def test_list_jobs(client):
     response = client.get("/jobs")
     assert response.status_code == status.HTTP_200_OK
     data = response.json()
-    assert len(data) >= 2 # May contain jobs from other tests if not cleaned up properly
+    assert len(data["items"]) >= 2 # May contain jobs from other tests if not cleaned up properly
 
 async def test_cancel_job(client):
     job_id = await create_test_job(client)
@@ -148,3 +154,247 @@ async def test_job_stream(client):
         except Exception as e:
             pytest.fail(f"WebSocket connection or initial message failed: {e}")
 
+
+async def test_list_jobs_cursor_pagination(client):
+    created = [await create_test_job(client, job_name=f"page_{i}") for i in range(5)]
+
+    seen, cursor = [], None
+    while True:
+        params = {"status": "waiting", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/jobs", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        assert len(page["items"]) <= 2
+        seen.extend(job["job_id"] for job in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == len(set(seen))
+    # oldest first, so the jobs created above come back in creation order
+    assert [job_id for job_id in seen if job_id in created] == created
+
+async def test_list_jobs_invalid_cursor(client):
+    response = client.get("/jobs", params={"cursor": "not-a-cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+class QueryCounter:
+    # counts statements on every engine, the app may not be using the one above
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(Engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, "before_cursor_execute", self)
+
+async def test_list_jobs_query_count_is_independent_of_dependencies(client):
+    parents = [await create_test_job(client, job_name="qc_parent") for _ in range(5)]
+    children = [await create_test_job(client, job_name="qc_child", job_type="qc", depends_on=parents) for _ in range(3)]
+
+    with QueryCounter() as queries:
+        response = client.get("/jobs", params={"status": "waiting", "limit": 100})
+    assert response.status_code == status.HTTP_200_OK
+    by_id = {job["job_id"]: job for job in response.json()["items"]}
+    for child in children:
+        assert by_id[child]["depends_on"] == parents
+    # one query for the page, one for every dependency on it
+    assert queries.count == 2
+
+    with QueryCounter() as queries:
+        response = client.get(f"/jobs/{children[0]}")
+    assert response.json()["depends_on"] == parents
+    assert queries.count == 2
+
+async def test_fan_in_submissions_do_not_wait_on_each_other(client):
+    import threading
+    parent = await create_test_job(client, job_name="fan_in_parent")
+    with engine.connect() as other_submission:
+        # what a concurrent submission depending on the same parent holds until it commits
+        other_submission.execute(select(Job.id).where(Job.job_id == parent).with_for_update(read=True))
+        responses = []
+        submitting = threading.Thread(target=lambda: responses.append(client.post("/jobs", json={
+            "job_name": "fan_in_child", "type": "test", "payload": {}, "depends_on": [parent]})))
+        submitting.start()
+        submitting.join(5)
+        blocked = submitting.is_alive()
+        other_submission.rollback()
+    submitting.join()
+    assert not blocked
+    assert responses[0].status_code == status.HTTP_201_CREATED
+
+async def test_create_jobs_batch_with_local_refs(client):
+    parent = await create_test_job(client, job_name="batch_parent")
+    response = client.post("/jobs/batch", json=[
+        {"job_name": "extract", "type": "test", "payload": {}, "ref": "extract", "depends_on": [parent]},
+        {"job_name": "transform", "type": "test", "payload": {}, "ref": "transform", "depends_on_refs": ["extract"]},
+        {"job_name": "load", "type": "test", "payload": {}, "depends_on_refs": ["extract", "transform"]},
+    ])
+    assert response.status_code == status.HTTP_201_CREATED
+    extract, transform, load = response.json()["job_ids"]
+
+    assert client.get(f"/jobs/{extract}").json()["depends_on"] == [parent]
+    assert client.get(f"/jobs/{transform}").json()["depends_on"] == [extract]
+    loaded = client.get(f"/jobs/{load}").json()
+    assert loaded["job_name"] == "load" and loaded["depends_on"] == [extract, transform]
+
+async def test_create_jobs_batch_rejects_cycles_and_unknown_refs(client):
+    cycle = [
+        {"job_name": "a", "type": "test", "payload": {}, "ref": "a", "depends_on_refs": ["c"]},
+        {"job_name": "b", "type": "test", "payload": {}, "ref": "b", "depends_on_refs": ["a"]},
+        {"job_name": "c", "type": "test", "payload": {}, "ref": "c", "depends_on_refs": ["b"]},
+    ]
+    response = client.post("/jobs/batch", json=cycle)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "Dependency cycle between refs: b -> c -> a -> b"
+
+    response = client.post("/jobs/batch", json=[
+        {"job_name": "a", "type": "test", "payload": {}, "depends_on_refs": ["missing"]},
+    ])
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "Unknown ref" in response.json()["detail"]
+
+    response = client.post("/jobs/batch", json=[
+        {"job_name": "a", "type": "test", "payload": {}, "ref": "x"},
+        {"job_name": "b", "type": "test", "payload": {}, "ref": "x"},
+    ])
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+async def test_create_jobs_batch_with_optional_fields_on_some_items(client):
+    configured = {"job_name": "configured", "type": "test", "payload": {},
+                  "resource_requirements": {"cpu_units": 2, "memory_mb": 512},
+                  "retry_config": {"max_attempts": 3, "backoff_multiplier": 2, "initial_delay_seconds": 5}}
+    plain = {"job_name": "plain", "type": "test", "payload": {}}
+    for batch in ([plain, configured], [configured, plain]):
+        response = client.post("/jobs/batch", json=batch)
+        assert response.status_code == status.HTTP_201_CREATED
+        db = TestingSessionLocal()
+        try:
+            rows = {job.job_name: job for job in db.query(Job).filter(Job.job_id.in_(response.json()["job_ids"]))}
+        finally:
+            db.close()
+        assert (rows["configured"].cpu_units, rows["configured"].memory_mb, rows["configured"].max_attempts) == (2, 512, 3)
+        assert (rows["plain"].cpu_units, rows["plain"].max_attempts) == (None, 1)
+
+async def test_null_run_at_is_scheduled_now(client):
+    item = {"job_name": "no_run_at", "type": "test", "payload": {}, "run_at": None}
+    batch = client.post("/jobs/batch", json=[item, {**item, "run_at": "2030-01-01T00:00:00Z"}])
+    assert batch.status_code == status.HTTP_201_CREATED
+    single = client.post("/jobs", json=item)
+    assert single.status_code == status.HTTP_201_CREATED
+    db = TestingSessionLocal()
+    try:
+        run_ats = db.query(Job.run_at).filter(Job.job_id.in_([batch.json()["job_ids"][0], single.json()["job_id"]])).all()
+    finally:
+        db.close()
+    assert len(run_ats) == 2 and all(run_at is not None for run_at, in run_ats)
+
+async def test_idempotency_key_returns_existing_job(client):
+    from services.api import recent_submissions
+    body = {"job_name": "idempotent", "type": "test", "payload": {}, "idempotency_key": f"key-{uuid.uuid4()}"}
+    first = client.post("/jobs", json=body)
+    assert first.status_code == status.HTTP_201_CREATED
+
+    # a hot retry is answered from the cache
+    with QueryCounter() as queries:
+        retry = client.post("/jobs", json=body)
+    assert retry.json()["job_id"] == first.json()["job_id"]
+    assert queries.count == 0
+
+    # a retry that misses the cache (other API process, evicted) hits the unique index
+    recent_submissions.clear()
+    retry = client.post("/jobs", json=body)
+    assert retry.status_code == status.HTTP_201_CREATED
+    assert retry.json()["job_id"] == first.json()["job_id"]
+
+    db = TestingSessionLocal()
+    try:
+        assert db.query(Job).filter(Job.idempotency_key == body["idempotency_key"]).count() == 1
+    finally:
+        db.close()
+
+async def test_batch_rejects_used_idempotency_key(client):
+    key = f"key-{uuid.uuid4()}"
+    assert client.post("/jobs", json={"job_name": "a", "type": "test", "payload": {}, "idempotency_key": key}).status_code == 201
+    response = client.post("/jobs/batch", json=[
+        {"job_name": "b", "type": "test", "payload": {}},
+        {"job_name": "c", "type": "test", "payload": {}, "idempotency_key": key},
+    ])
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+async def test_job_stream_delivers_filtered_events(client):
+    from services.stream import stream_hub
+    job_id = await create_test_job(client, job_name="stream_filter")
+    with client.websocket_connect(f"/jobs/stream?job_id={job_id}&status=failed,retrying") as websocket:
+        # the subscription exists once the socket is accepted
+        stream_hub.publish_threadsafe({"id": 1, "job_uuid": job_id, "status": "completed", "type": "test"})
+        stream_hub.publish_threadsafe({"id": 2, "job_uuid": str(uuid.uuid4()), "status": "failed", "type": "test"})
+        stream_hub.publish_threadsafe({"id": 3, "job_uuid": job_id, "status": "retrying", "type": "test"})
+        assert websocket.receive_json()["id"] == 3
+    # made up seqs, keep them out of the replay buffer of the next tests
+    stream_hub.buffer.clear()
+
+async def test_job_stream_rejects_invalid_job_id(client):
+    from starlette.websockets import WebSocketDisconnect
+    with pytest.raises(WebSocketDisconnect) as e:
+        with client.websocket_connect("/jobs/stream?job_id=nope") as websocket:
+            websocket.receive_json()
+    assert e.value.code == status.WS_1008_POLICY_VIOLATION
+
+async def test_job_stream_resumes_after_since(client):
+    from app.models.models import ExecutionLog
+    from datetime import datetime, timezone
+    job_id = await create_test_job(client, job_name="stream_resume")
+    db = TestingSessionLocal()
+    try:
+        job = db.query(Job).filter(Job.job_id == job_id).one()
+        logs = [ExecutionLog(job_id=job.id, job_uuid=job.job_id, message=f"attempt {n}", is_successful=False,
+                             attempt_number=n, log_timestamp=datetime.now(timezone.utc)) for n in (1, 2, 3)]
+        db.add_all(logs)
+        db.commit()
+        seqs = [log.id for log in logs]
+    finally:
+        db.close()
+
+    with client.websocket_connect(f"/jobs/stream?job_id={job_id}&since={seqs[0]}") as websocket:
+        replayed = [websocket.receive_json(), websocket.receive_json()]
+    assert [event["seq"] for event in replayed] == seqs[1:]
+    assert [event["message"] for event in replayed] == ["attempt 2", "attempt 3"]
+    assert replayed[0]["type"] == "test" and replayed[0]["status"] == "failed"
+
+async def test_get_job_cache_follows_status_changes(client):
+    from app.services.job_state import complete_job
+    from services.job_cache import job_cache
+    job_id = await create_test_job(client, job_name="cached")
+    client.get(f"/jobs/{job_id}")
+    for _ in range(100): # the listener connects with the first request
+        if job_cache.listening:
+            break
+        time.sleep(0.02)
+    assert client.get(f"/jobs/{job_id}").json()["status"] == "waiting"
+    with QueryCounter() as queries:
+        assert client.get(f"/jobs/{job_id}").json()["status"] == "waiting"
+    assert queries.count == 0
+
+    db = TestingSessionLocal()
+    try:
+        db.query(Job).filter(Job.job_id == job_id).update({"status": "running"}) # as a worker would have
+        db.commit()
+        complete_job(db, db.query(Job).filter(Job.job_id == job_id).one(), {"ok": True})
+    finally:
+        db.close()
+    for _ in range(100): # until the notification arrives
+        data = client.get(f"/jobs/{job_id}").json()
+        if data["status"] == "completed":
+            break
+        time.sleep(0.02)
+    assert data["status"] == "completed" and data["results"] == {"ok": True}
+
+    client.patch(f"/jobs/{job_id}/cancel")
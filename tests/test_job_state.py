@@ -0,0 +1,123 @@
+import pytest
+from fastapi.testclient import TestClient
+from fastapi import status
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.models.models import Job
+from app.services.job_state import complete_job
+import os
+
+DB_USER = os.getenv("DB_USER", "vast")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "qweasdzx")
+DB_NAME = os.getenv("DB_NAME", "test_smart_queue")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def db():
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+
+def create_test_job(client, job_name="test_job", depends_on=[]):
+    response = client.post("/jobs", json={
+        "job_name": job_name,
+        "type": "test",
+        "payload": {},
+        "depends_on": depends_on
+    })
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()["job_id"]
+
+def get_job_row(db, job_id):
+    db.expire_all()
+    return db.query(Job).filter(Job.job_id == job_id).one()
+
+def run_and_complete(db, job_id):
+    # a worker only completes a job it is running
+    db.query(Job).filter(Job.job_id == job_id).update({"status": "running"})
+    db.commit()
+    return complete_job(db, get_job_row(db, job_id))
+
+def test_unmet_dependencies_set_on_create(client, db):
+    parent_a = create_test_job(client, "parent_a")
+    parent_b = create_test_job(client, "parent_b")
+    child = create_test_job(client, "child", depends_on=[parent_a, parent_b])
+
+    assert get_job_row(db, parent_a).unmet_dependencies == 0
+    assert get_job_row(db, child).unmet_dependencies == 2
+
+def test_child_ready_when_last_parent_completes(client, db):
+    parent_a = create_test_job(client, "parent_a")
+    parent_b = create_test_job(client, "parent_b")
+    child = create_test_job(client, "child", depends_on=[parent_a, parent_b])
+
+    assert run_and_complete(db, parent_a)
+    child_row = get_job_row(db, child)
+    assert child_row.unmet_dependencies == 1
+    assert child_row.status == "waiting"
+
+    assert run_and_complete(db, parent_b)
+    child_row = get_job_row(db, child)
+    assert child_row.unmet_dependencies == 0
+    assert child_row.status == "ready"
+
+def test_complete_job_twice_only_decrements_once(client, db):
+    parent = create_test_job(client, "parent")
+    child = create_test_job(client, "child", depends_on=[parent])
+
+    assert run_and_complete(db, parent)
+    assert not complete_job(db, get_job_row(db, parent))
+    assert get_job_row(db, child).unmet_dependencies == 0
+
+def test_late_completion_does_not_overwrite_a_cancelled_job(client, db):
+    parent = create_test_job(client, "parent")
+    child = create_test_job(client, "child", depends_on=[parent])
+    db.query(Job).filter(Job.job_id == parent).update({"status": "cancelled"})
+    db.commit()
+
+    assert not complete_job(db, get_job_row(db, parent))
+    assert get_job_row(db, parent).status == "cancelled"
+    assert get_job_row(db, child).unmet_dependencies == 1
+
+def test_completed_parent_is_not_counted(client, db):
+    parent = create_test_job(client, "parent")
+    run_and_complete(db, parent)
+    child = create_test_job(client, "child", depends_on=[parent])
+    assert get_job_row(db, child).unmet_dependencies == 0
+
+def test_missing_dependency_does_not_create_job(client, db):
+    before = db.query(Job).count()
+    response = client.post("/jobs", json={
+        "job_name": "orphan",
+        "type": "test",
+        "payload": {},
+        "depends_on": ["00000000-0000-0000-0000-000000000000"]
+    })
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert db.query(Job).count() == before
+
+def test_batch_unmet_dependencies_count_local_and_existing_parents(client, db):
+    done = create_test_job(client, "done_parent")
+    pending = create_test_job(client, "pending_parent")
+    assert run_and_complete(db, done)
+
+    response = client.post("/jobs/batch", json=[
+        {"job_name": "root", "type": "test", "payload": {}, "ref": "root", "depends_on": [done]},
+        {"job_name": "leaf", "type": "test", "payload": {}, "depends_on": [done, pending], "depends_on_refs": ["root"]},
+    ])
+    assert response.status_code == status.HTTP_201_CREATED
+    root, leaf = response.json()["job_ids"]
+
+    assert get_job_row(db, root).unmet_dependencies == 0
+    assert get_job_row(db, leaf).unmet_dependencies == 2
@@ -0,0 +1,89 @@
+from collections import Counter
+
+import pytest
+
+from app.services.lanes import LaneScheduler, parse_weights
+
+WEIGHTS = {"Critical": 8, "High": 4, "Normal": 2, "Low": 1}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def backlogged(scheduler, jobs_per_lane, clock):
+    for lane in WEIGHTS:
+        for n in range(jobs_per_lane):
+            scheduler.push(lane, f"{lane}-{n}", clock.now)
+
+
+def test_backlogged_lanes_share_starts_by_weight():
+    clock = Clock()
+    scheduler = LaneScheduler(WEIGHTS, aging_seconds=0, clock=clock)
+    backlogged(scheduler, 1000, clock)
+    starts = Counter(scheduler.pop()[0] for _ in range(150))
+    assert starts == {"Critical": 80, "High": 40, "Normal": 20, "Low": 10}
+
+
+def test_low_is_not_starved_by_a_steady_stream_of_critical():
+    clock = Clock()
+    scheduler = LaneScheduler(WEIGHTS, aging_seconds=0, clock=clock)
+    scheduler.push("Low", "low-job", clock.now)
+    started = []
+    for n in range(20):
+        scheduler.push("Critical", f"critical-{n}", clock.now)
+        started.append(scheduler.pop()[1])
+    assert "low-job" in started[:10]
+
+
+def test_old_jobs_overtake_fresh_ones():
+    clock = Clock()
+    scheduler = LaneScheduler(WEIGHTS, aging_seconds=10, clock=clock)
+    scheduler.push("Low", "old-low", clock.now - 100)
+    for n in range(5):
+        scheduler.push("Critical", f"critical-{n}", clock.now)
+    assert scheduler.pop() == ("Low", "old-low")
+
+    without_aging = LaneScheduler(WEIGHTS, aging_seconds=0, clock=clock)
+    without_aging.push("Low", "old-low", clock.now - 100)
+    for n in range(5):
+        without_aging.push("Critical", f"critical-{n}", clock.now)
+    assert without_aging.pop()[0] == "Critical"
+
+
+def test_idle_lane_gets_no_credit_for_the_time_it_was_idle():
+    clock = Clock()
+    scheduler = LaneScheduler(WEIGHTS, aging_seconds=0, clock=clock)
+    for n in range(100):
+        scheduler.push("Low", n, clock.now)
+    for _ in range(100):
+        scheduler.pop()
+    # Low ran alone for a while, Critical arriving now is not made to wait for it
+    backlogged(scheduler, 100, clock)
+    starts = Counter(scheduler.pop()[0] for _ in range(15))
+    assert starts == {"Critical": 8, "High": 4, "Normal": 2, "Low": 1}
+
+
+def test_stats_report_queue_wait_per_lane():
+    clock = Clock()
+    scheduler = LaneScheduler(WEIGHTS, clock=clock)
+    scheduler.push("High", "a", clock.now - 3)
+    scheduler.push("High", "b", clock.now - 1)
+    scheduler.push("Unknown", "c", clock.now)  # goes to Normal
+    scheduler.pop()
+    scheduler.pop()
+    stats = scheduler.stats()
+    assert stats["High"]["started"] == 2 and stats["High"]["wait_max_seconds"] == 3
+    assert stats["Normal"]["waiting"] == 1 and len(scheduler) == 1
+    assert stats["Low"] == {"waiting": 0, "oldest_seconds": 0.0, "started": 0, "wait_p50_seconds": 0.0,
+                            "wait_p99_seconds": 0.0, "wait_max_seconds": 0.0}
+
+
+def test_parse_weights():
+    assert parse_weights("Critical=10, Low=0.5") == {"Critical": 10, "High": 1, "Normal": 1, "Low": 0.5}
+    with pytest.raises(ValueError):
+        parse_weights("Urgent=3")
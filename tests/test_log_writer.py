@@ -0,0 +1,88 @@
+import uuid
+from datetime import datetime, timezone
+import threading
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.orm import sessionmaker
+from app.models.models import Job, ExecutionLog
+from app.services.log_writer import STREAM_ORDER_LOCK, LogBatchWriter
+import os
+
+DB_USER = os.getenv("DB_USER", "vast")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "qweasdzx")
+DB_NAME = os.getenv("DB_NAME", "test_smart_queue")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def seed_job():
+    job_id = uuid.uuid4()
+    with engine.begin() as conn:
+        row = conn.execute(insert(Job).returning(Job.id), [{
+            "job_id": job_id, "job_name": "log_writer_test", "type": "sleep", "status": "running",
+            "priority": "Normal", "run_at": datetime.now(timezone.utc),
+        }]).first()
+    return row.id, job_id
+
+def log_message(job_pk, job_uuid, attempt=1):
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "job_id": job_pk, "job_uuid": str(job_uuid), "log_timestamp": now, "message": "ok",
+        "duration_seconds": 0.01, "is_successful": True, "execution_start_time": now,
+        "execution_end_time": now, "attempt_number": attempt, "unknown_key": "ignored",
+    }
+
+def logs_for(job_pk):
+    db = TestingSessionLocal()
+    try:
+        return db.query(ExecutionLog).filter(ExecutionLog.job_id == job_pk).all()
+    finally:
+        db.close()
+
+def test_batch_is_written_and_last_tag_returned():
+    job_pk, job_uuid = seed_job()
+    events = []
+    writer = LogBatchWriter(TestingSessionLocal, batch_size=3, flush_seconds=60, event_sink=events.extend)
+
+    assert not writer.add(1, log_message(job_pk, job_uuid, 1))
+    assert not writer.add(2, log_message(job_pk, job_uuid, 2))
+    assert writer.add(3, log_message(job_pk, job_uuid, 3))
+    assert writer.flush() == 3
+
+    logs = logs_for(job_pk)
+    assert sorted(log.attempt_number for log in logs) == [1, 2, 3]
+    assert writer.rows == [] and writer.flush() is None
+    # committed rows are handed on with their id, extra keys kept
+    assert [(event["id"], event["attempt_number"]) for event in events] == \
+        sorted((log.id, log.attempt_number) for log in logs)
+    assert all(event["unknown_key"] == "ignored" for event in events)
+
+def test_invalid_row_does_not_block_batch():
+    job_pk, job_uuid = seed_job()
+    events = []
+    writer = LogBatchWriter(TestingSessionLocal, batch_size=10, flush_seconds=60, event_sink=events.extend)
+    writer.add(1, log_message(job_pk, job_uuid))
+    writer.add(2, dict(log_message(job_pk, job_uuid), message=None))  # fails NOT NULL
+
+    assert writer.flush() == 2
+    assert len(logs_for(job_pk)) == 1
+    assert [event["id"] for event in events] == [logs_for(job_pk)[0].id]
+
+def test_flushes_take_turns_until_their_events_are_published():
+    # another writer between its INSERT and its publish holds the lock
+    job_pk, job_uuid = seed_job()
+    published = threading.Event()
+    writer = LogBatchWriter(TestingSessionLocal, batch_size=10, flush_seconds=60,
+                            event_sink=lambda events: published.set())
+    writer.add(1, log_message(job_pk, job_uuid))
+    with engine.connect() as other_writer:
+        other_writer.execute(select(func.pg_advisory_lock(STREAM_ORDER_LOCK)))
+        flushing = threading.Thread(target=writer.flush)
+        flushing.start()
+        assert not published.wait(0.3) and logs_for(job_pk) == []
+        other_writer.execute(select(func.pg_advisory_unlock(STREAM_ORDER_LOCK)))
+        other_writer.commit()
+    flushing.join(5)
+    assert published.is_set() and len(logs_for(job_pk)) == 1
@@ -0,0 +1,152 @@
+import threading
+import time
+
+from pika.exceptions import AMQPConnectionError, NackError, StreamLostError
+
+from app.services.publisher import PublisherPool
+from app.services.rabbitmq_client import CODECS, decode_message
+
+class FakeBroker:
+    # stands in for RabbitMQ: hands out connections, records what they publish
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = []
+        self.messages = []
+        self.down = False
+        self.fail_next = []  # exceptions raised by the next publishes
+
+    def connect(self):
+        if self.down:
+            raise AMQPConnectionError("broker down")
+        connection = FakeConnection(self)
+        with self.lock:
+            self.connections.append(connection)
+        return connection
+
+class FakeConnection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+        self.in_use = threading.Lock()
+
+    def channel(self):
+        return FakeChannel(self)
+
+    def process_data_events(self, time_limit=None):
+        if not self.is_open:
+            raise StreamLostError("gone")
+
+    def close(self):
+        self.is_open = False
+
+class FakeChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.is_open = True
+        self.pending = None
+
+    def confirm_delivery(self):
+        pass
+
+    def tx_select(self):
+        self.pending = []
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        broker = self.connection.broker
+        broker.properties = properties
+        # a connection used by two threads at once would be corrupted
+        assert self.connection.in_use.acquire(blocking=False), "connection shared between threads"
+        try:
+            time.sleep(0.001) # the confirm round trip
+            with broker.lock:
+                error = broker.fail_next.pop(0) if broker.fail_next else None
+            if error is not None:
+                if isinstance(error, StreamLostError):
+                    self.connection.is_open = False
+                raise error
+            if self.pending is not None:
+                self.pending.append(body)
+            else:
+                with broker.lock:
+                    broker.messages.append(body)
+        finally:
+            self.connection.in_use.release()
+
+    def tx_commit(self):
+        with self.connection.broker.lock:
+            self.connection.broker.messages.extend(self.pending)
+        self.pending = []
+
+    def tx_rollback(self):
+        self.pending = []
+
+def test_threads_never_share_a_connection():
+    broker = FakeBroker()
+    pool = PublisherPool(size=4, connect=broker.connect)
+    results = []
+
+    def publish(thread):
+        for index in range(20):
+            results.append(pool.publish_message("exchange", "key", {"thread": thread, "index": index}))
+
+    threads = [threading.Thread(target=publish, args=(thread,)) for thread in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(results) and len(broker.messages) == 16 * 20
+    assert len(broker.connections) <= 4
+
+def test_lost_connection_is_reopened_and_publish_retried():
+    broker = FakeBroker()
+    pool = PublisherPool(size=1, connect=broker.connect)
+    assert pool.publish_message("exchange", "key", {"n": 1})
+    broker.fail_next = [StreamLostError("reset by peer")]
+    assert pool.publish_message("exchange", "key", {"n": 2})
+    assert len(broker.messages) == 2 and len(broker.connections) == 2
+    assert pool.stats()["opened"] == 2
+
+def test_broker_outage_backs_off_then_recovers():
+    broker = FakeBroker()
+    broker.down = True
+    pool = PublisherPool(size=2, connect=broker.connect, attempts=3, initial_delay=0.01, max_delay=0.05)
+    started = time.monotonic()
+    assert not pool.publish_message("exchange", "key", {"n": 1})
+    # waited between the attempts: 0.01 then 0.02 (+/- 20%)
+    assert time.monotonic() - started >= 0.02
+    assert pool.delay == 0.04 and pool.stats()["failed"] == 1
+
+    broker.down = False
+    time.sleep(0.06)
+    assert pool.publish_message("exchange", "key", {"n": 2})
+    assert pool.delay == 0 and len(broker.messages) == 1
+
+def test_nacked_message_is_retried():
+    broker = FakeBroker()
+    pool = PublisherPool(size=1, connect=broker.connect, attempts=2)
+    broker.fail_next = [NackError([])]
+    assert pool.publish_message("exchange", "key", {"n": 1})
+    broker.fail_next = [NackError([]), NackError([])]
+    assert not pool.publish_message("exchange", "key", {"n": 2})
+    assert len(broker.messages) == 1
+
+def test_batch_is_all_or_nothing():
+    broker = FakeBroker()
+    pool = PublisherPool(size=1, connect=broker.connect, attempts=1)
+    batch = [(f"key.{index}", {"n": index}, 4) for index in range(5)]
+    assert pool.publish_batch("exchange", batch)
+    assert len(broker.messages) == 5
+    broker.fail_next = [None, None, StreamLostError("reset by peer")]
+    assert not pool.publish_batch("exchange", batch)
+    assert len(broker.messages) == 5 # nothing of the failed batch was committed
+
+def test_messages_are_decoded_by_their_content_type():
+    broker = FakeBroker()
+    message = {"job_id": "0b9a6c1e-8d0f-4a53-9d3e-2f6a1f0c7e21", "attempt": 2, "payload": {"rounds": [1, 2.5, None]}}
+    for name in ("json", "msgpack"):
+        pool = PublisherPool(size=1, connect=broker.connect, codec=CODECS[name])
+        assert pool.publish_message("exchange", "key", message)
+        assert broker.properties.content_type == CODECS[name].content_type
+        assert decode_message(broker.properties, broker.messages[-1]) == message
+    # published before messages had a content type
+    assert decode_message(None, b'{"job_id": "a"}') == {"job_id": "a"}
@@ -0,0 +1,122 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.orm import sessionmaker
+from app.models.models import Job, JobDependency, ExecutionLog, jobs_archive, job_dependencies_archive
+from app.services.retention import archive_jobs, detach_old_log_partitions, ensure_log_partitions, log_partitions
+import os
+
+DB_USER = os.getenv("DB_USER", "vast")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "qweasdzx")
+DB_NAME = os.getenv("DB_NAME", "test_smart_queue")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def seed_job(status, age_days):
+    modified_time = datetime.now(timezone.utc) - timedelta(days=age_days)
+    with engine.begin() as conn:
+        return conn.execute(insert(Job).returning(Job.id), [{
+            "job_id": uuid.uuid4(), "job_name": "retention_test", "type": "sleep", "status": status,
+            "priority": "Normal", "run_at": modified_time, "modified_time": modified_time,
+        }]).scalar_one()
+
+def depends(child, parent):
+    with engine.begin() as conn:
+        conn.execute(insert(JobDependency), [{"dependant_id": child, "depends_on_id": parent}])
+
+def live_and_archived(ids):
+    with engine.connect() as conn:
+        live = set(conn.execute(select(Job.id).where(Job.id.in_(ids))).scalars())
+        archived = set(conn.execute(select(jobs_archive.c.id).where(jobs_archive.c.id.in_(ids))).scalars())
+    return live, archived
+
+def test_partitions_are_created_ahead():
+    db = TestingSessionLocal()
+    try:
+        now = datetime.now(timezone.utc) + timedelta(days=20)
+        ensure_log_partitions(db, now, days_ahead=3)
+        names = {name for name, _, _ in log_partitions(db)}
+        for offset in range(4):
+            assert f"execution_logs_p{(now + timedelta(days=offset)).date():%Y%m%d}" in names
+        # contiguous: every partition starts where the previous one ends
+        partitions = log_partitions(db)
+        assert all(previous[2] == current[1] for previous, current in zip(partitions, partitions[1:]))
+    finally:
+        db.close()
+
+def test_rows_in_the_default_partition_move_to_their_new_partition():
+    # the maintenance loop fell behind: logs past the last partition went to the default one
+    db = TestingSessionLocal()
+    job_pk = seed_job("completed", 0)
+    try:
+        last_upper = max(upper for _, _, upper in log_partitions(db) if upper is not None)
+        logged_at = last_upper + timedelta(days=1, hours=1)
+        with engine.begin() as conn:
+            conn.execute(insert(ExecutionLog), [{
+                "job_id": job_pk, "job_uuid": uuid.uuid4(), "message": "late", "attempt_number": 1,
+                "log_timestamp": logged_at,
+            }])
+        created = ensure_log_partitions(db, logged_at, days_ahead=0)
+        assert f"execution_logs_p{logged_at.date():%Y%m%d}" in created
+        with engine.connect() as conn:
+            partition = conn.execute(
+                text("SELECT tableoid::regclass::text FROM execution_logs WHERE job_id = :id"), {"id": job_pk}
+            ).scalar_one()
+        assert partition == f"execution_logs_p{logged_at.date():%Y%m%d}"
+        partitions = log_partitions(db)
+        assert all(previous[2] == current[1] for previous, current in zip(partitions, partitions[1:]))
+    finally:
+        db.close()
+
+def test_old_partitions_are_detached():
+    db = TestingSessionLocal()
+    job_pk = seed_job("completed", 0)
+    with engine.begin() as conn:
+        conn.execute(insert(ExecutionLog), [{
+            "job_id": job_pk, "job_uuid": uuid.uuid4(), "message": "old", "attempt_number": 1,
+            "log_timestamp": datetime(2020, 1, 1, tzinfo=timezone.utc),
+        }])
+    name, lower, upper = log_partitions(db)[0]
+    try:
+        # only the first partition has fallen out of retention
+        assert detach_old_log_partitions(db, upper + timedelta(days=30), retention_days=30) == [name]
+        with engine.connect() as conn:
+            assert not conn.execute(select(ExecutionLog).where(ExecutionLog.job_id == job_pk)).first()
+            assert conn.execute(text(f"SELECT count(*) FROM {name} WHERE job_id = :id"), {"id": job_pk}).scalar() == 1
+    finally:
+        lower_bound = "MINVALUE" if lower is None else f"'{lower.isoformat()}'"
+        db.execute(text(f"ALTER TABLE execution_logs ATTACH PARTITION {name} FOR VALUES FROM ({lower_bound}) TO ('{upper.isoformat()}')"))
+        db.commit()
+        db.close()
+
+def test_terminal_jobs_are_archived_with_their_children_only():
+    old_parent = seed_job("completed", 100)
+    old_child = seed_job("completed", 90)
+    live_grandchild = seed_job("waiting", 0)
+    depends(old_child, old_parent)
+    depends(live_grandchild, old_child)
+    lone_failure = seed_job("failed", 100)
+    recent = seed_job("completed", 1)
+    ids = [old_parent, old_child, live_grandchild, lone_failure, recent]
+
+    db = TestingSessionLocal()
+    try:
+        # the chain is held back by its live grandchild, a single batch does not matter
+        archive_jobs(db, datetime.now(timezone.utc), retention_days=30, batch_size=1)
+        assert live_and_archived(ids) == ({old_parent, old_child, live_grandchild, recent}, {lone_failure})
+
+        with engine.begin() as conn:
+            conn.execute(Job.__table__.update().where(Job.id == live_grandchild).values(
+                status="cancelled", modified_time=datetime.now(timezone.utc) - timedelta(days=40)))
+        archive_jobs(db, datetime.now(timezone.utc), retention_days=30)
+        assert live_and_archived(ids) == ({recent}, {old_parent, old_child, live_grandchild, lone_failure})
+        with engine.connect() as conn:
+            edges = conn.execute(select(job_dependencies_archive.c.dependant_id, job_dependencies_archive.c.depends_on_id)
+                                 .where(job_dependencies_archive.c.depends_on_id.in_(ids))).all()
+        assert sorted(edges) == sorted([(old_child, old_parent), (live_grandchild, old_child)])
+    finally:
+        db.close()
@@ -0,0 +1,365 @@
+import pytest
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.orm import sessionmaker
+from app.models.models import ExecutionLog, Job, JobDependency
+from app.services import job_state, scheduler
+from app.services.resources import CapacityTracker
+import os
+
+DB_USER = os.getenv("DB_USER", "vast")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "qweasdzx")
+DB_NAME = os.getenv("DB_NAME", "test_smart_queue")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class RecordingPublisher:
+    # in-memory stand-in for the RabbitMQ client, shared by all scheduler threads
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.published = []
+        self.routing_keys = {}
+        self.messages = {}
+
+    def publish_batch(self, exchange_name, messages):
+        with self.lock:
+            for routing_key, message, _ in messages:
+                self.published.append(message["job_id"])
+                self.routing_keys[message["job_id"]] = routing_key
+                self.messages[message["job_id"]] = message
+        return True
+
+@pytest.fixture
+def publisher(monkeypatch):
+    recorder = RecordingPublisher()
+    monkeypatch.setattr(scheduler, "publisher", recorder)
+    return recorder
+
+def seed_ready_jobs(count, status="waiting", priority="Normal", cpu_units=None, memory_mb=None, payload=None):
+    job_ids = [uuid.uuid4() for _ in range(count)]
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    with engine.begin() as conn:
+        conn.execute(insert(Job), [
+            {"job_id": job_id, "job_name": "sched_test", "type": "test",
+             "status": status, "priority": priority, "run_at": past,
+             "cpu_units": cpu_units, "memory_mb": memory_mb, "payload": payload}
+            for job_id in job_ids
+        ])
+    return {str(job_id) for job_id in job_ids}
+
+def seed_job_pks(count, status, unmet=0, run_at_offset=-1):
+    # jobs with dependencies are wired by primary key, returns them
+    run_at = datetime.now(timezone.utc) + timedelta(seconds=run_at_offset)
+    with engine.begin() as conn:
+        return conn.execute(insert(Job).returning(Job.id), [
+            {"job_id": uuid.uuid4(), "job_name": "sched_graph_test", "type": "test", "status": status,
+             "priority": "Low", "run_at": run_at, "unmet_dependencies": unmet}
+            for _ in range(count)
+        ]).scalars().all()
+
+def critical_paths(job_pks):
+    with engine.connect() as conn:
+        return dict(conn.execute(select(Job.id, Job.critical_path).where(Job.id.in_(job_pks))).all())
+
+def job_statuses(job_ids):
+    db = TestingSessionLocal()
+    try:
+        rows = db.query(Job.job_id, Job.status).filter(Job.job_id.in_(job_ids)).all()
+        return {str(job_id): status for job_id, status in rows}
+    finally:
+        db.close()
+
+def test_concurrent_schedulers_dispatch_each_job_once(publisher):
+    job_ids = seed_ready_jobs(500)
+    replicas = 6
+    start = threading.Barrier(replicas)
+    errors = []
+
+    def run_scheduler(replica):
+        db = TestingSessionLocal()
+        try:
+            start.wait()
+            while scheduler.dispatch_batch(db, batch_size=25, scheduler_id=f"test-scheduler-{replica}"):
+                pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=run_scheduler, args=(n,)) for n in range(replicas)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    counts = Counter(publisher.published)
+    assert all(counts[job_id] == 1 for job_id in job_ids)
+    assert max(counts.values()) == 1
+    assert set(job_statuses(job_ids).values()) == {"queued"}
+
+def test_failed_publish_hands_claims_back(monkeypatch):
+    class FailingPublisher:
+        def publish_batch(self, exchange_name, messages):
+            return False
+
+    monkeypatch.setattr(scheduler, "publisher", FailingPublisher())
+    job_ids = seed_ready_jobs(3)
+    db = TestingSessionLocal()
+    try:
+        assert scheduler.dispatch_batch(db, batch_size=1000, scheduler_id="test-failing") == 0
+    finally:
+        db.close()
+    assert set(job_statuses(job_ids).values()) == {"ready"}
+
+def test_job_started_before_its_claim_is_settled_keeps_running(monkeypatch):
+    # a worker can receive the message before the scheduler marks the batch queued
+    class EagerWorkerPublisher:
+        def publish_batch(self, exchange_name, messages):
+            db = TestingSessionLocal()
+            try:
+                for _, message, _ in messages:
+                    assert job_state.start_job(db, message["job_id"]) is not None
+            finally:
+                db.close()
+            return True
+
+    monkeypatch.setattr(scheduler, "publisher", EagerWorkerPublisher())
+    job_ids = seed_ready_jobs(2, priority="Critical")
+    db = TestingSessionLocal()
+    try:
+        assert scheduler.dispatch_batch(db, batch_size=1000, scheduler_id="test-eager") >= 2
+    finally:
+        db.close()
+    assert set(job_statuses(job_ids).values()) == {"running"}
+
+def test_expired_lease_returns_job_to_pool(publisher):
+    job_ids = seed_ready_jobs(1, status="claimed")
+    with engine.begin() as conn:
+        conn.execute(
+            update(Job)
+            .where(Job.job_id.in_(job_ids))
+            .values(claimed_by="dead-scheduler", lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        )
+
+    db = TestingSessionLocal()
+    try:
+        assert scheduler.release_expired_claims(db) >= 1
+        while scheduler.dispatch_batch(db, batch_size=1000, scheduler_id="test-survivor"):
+            pass
+    finally:
+        db.close()
+
+    assert job_ids <= set(publisher.published)
+    assert set(job_statuses(job_ids).values()) == {"queued"}
+
+def test_expired_run_lease_retries_or_fails_the_job(publisher):
+    retried = seed_ready_jobs(1, status="running")
+    failed = seed_ready_jobs(1, status="running")
+    alive = seed_ready_jobs(1, status="running")
+    now = datetime.now(timezone.utc)
+    with engine.begin() as conn:
+        for job_ids, max_attempts, lease in ((retried, 2, -1), (failed, 1, -1), (alive, 2, 60)):
+            conn.execute(
+                update(Job)
+                .where(Job.job_id.in_(job_ids))
+                .values(claimed_by="a-worker", lease_expires_at=now + timedelta(seconds=lease),
+                        times_attempted=1, max_attempts=max_attempts, initial_delay=60, backoff_multiplier=1)
+            )
+
+    db = TestingSessionLocal()
+    try:
+        assert scheduler.release_expired_runs(db) >= 2
+    finally:
+        db.close()
+
+    assert job_statuses(retried | failed | alive) == {
+        **dict.fromkeys(retried, "retrying"), **dict.fromkeys(failed, "failed"), **dict.fromkeys(alive, "running"),
+    }
+    with engine.connect() as conn:
+        # retried after the backoff, as fail_job does, not straight away
+        run_at = conn.execute(select(Job.run_at).where(Job.job_id.in_(retried))).scalar()
+        assert run_at > now + timedelta(seconds=50)
+        logs = conn.execute(
+            select(ExecutionLog.job_uuid, ExecutionLog.is_successful, ExecutionLog.attempt_number)
+            .where(ExecutionLog.job_uuid.in_(retried | failed | alive))
+        ).all()
+    assert sorted((str(job_uuid), ok, attempt) for job_uuid, ok, attempt in logs) == sorted(
+        (job_id, False, 1) for job_id in retried | failed
+    )
+
+def test_best_fit_packs_jobs_onto_workers_with_room(publisher, monkeypatch):
+    tracker = CapacityTracker()
+    tracker.update({"worker_id": "small", "cpu_units_free": 2, "memory_mb_free": 2048,
+                    "cpu_units_total": 2, "memory_mb_total": 2048})
+    tracker.update({"worker_id": "large", "cpu_units_free": 8, "memory_mb_free": 16384,
+                    "cpu_units_total": 8, "memory_mb_total": 16384})
+    monkeypatch.setattr(scheduler, "capacity_tracker", tracker)
+
+    big_jobs = seed_ready_jobs(2, priority="Critical", cpu_units=4, memory_mb=8192)
+    small_jobs = seed_ready_jobs(1, priority="Critical", cpu_units=2, memory_mb=1024)
+    oversized_jobs = seed_ready_jobs(1, priority="Critical", cpu_units=16, memory_mb=1024)
+
+    db = TestingSessionLocal()
+    try:
+        scheduler.dispatch_batch(db, batch_size=1000, scheduler_id="test-packing", placement="best_fit")
+    finally:
+        db.close()
+
+    assert {publisher.routing_keys[job_id] for job_id in big_jobs} == {"job.worker.large"}
+    assert {publisher.routing_keys[job_id] for job_id in small_jobs} == {"job.worker.small"}
+    assert set(job_statuses(oversized_jobs).values()) == {"ready"}
+
+def test_short_capacity_goes_to_the_highest_priorities(publisher, monkeypatch):
+    db = TestingSessionLocal()
+    try:
+        # earlier tests' leftovers would compete for the room
+        while scheduler.dispatch_batch(db, batch_size=1000, scheduler_id="test-drain", placement="none"):
+            pass
+        # inserted interleaved, so the table's physical order is not the priority order
+        jobs = {priority: set() for priority in ("Low", "Normal", "High", "Critical")}
+        for _ in range(5):
+            for priority in jobs:
+                jobs[priority] |= seed_ready_jobs(1, priority=priority, cpu_units=1, memory_mb=256)
+        low_retry = seed_ready_jobs(1, status="retrying", priority="Low", cpu_units=1, memory_mb=256)
+
+        tracker = CapacityTracker()
+        tracker.update({"worker_id": "only", "cpu_units_free": 10, "memory_mb_free": 16384,
+                        "cpu_units_total": 10, "memory_mb_total": 16384})
+        monkeypatch.setattr(scheduler, "capacity_tracker", tracker)
+        assert scheduler.dispatch_batch(db, batch_size=1000, scheduler_id="test-short", placement="first_fit") == 10
+    finally:
+        db.close()
+
+    assert set(publisher.routing_keys) >= jobs["Critical"] | jobs["High"]
+    assert not set(publisher.routing_keys) & (jobs["Normal"] | jobs["Low"] | low_retry)
+    assert [publisher.messages[job_id]["priority"] for job_id in publisher.published[-10:]] == ["Critical"] * 5 + ["High"] * 5
+
+def test_retries_take_at_most_their_share_of_a_batch(monkeypatch):
+    monkeypatch.setattr(scheduler, "RETRY_SHARE", 0.25)
+    retry_ids = seed_ready_jobs(20, status="retrying", priority="Critical")
+    seed_ready_jobs(20, priority="Critical")
+
+    db = TestingSessionLocal()
+    try:
+        claimed = scheduler.claim_ready_jobs(db, batch_size=8, scheduler_id="test-retry-share")
+        claimed_ids = {str(job.job_id) for job in claimed}
+        scheduler.finish_claim(db, [job.id for job in claimed], "test-retry-share", "ready")
+    finally:
+        db.close()
+
+    assert len(claimed_ids) == 8
+    assert len(claimed_ids & retry_ids) == 2
+    assert len(claimed_ids - retry_ids) == 6 # fresh work, ours or left over by earlier tests
+
+def test_small_payloads_go_inline_large_ones_by_reference(publisher):
+    small_jobs = seed_ready_jobs(3, priority="Critical", payload={"n": 1})
+    large_jobs = seed_ready_jobs(3, priority="Critical", payload={"data": "x" * (scheduler.INLINE_PAYLOAD_BYTES + 1)})
+
+    db = TestingSessionLocal()
+    try:
+        while scheduler.dispatch_batch(db, batch_size=1000, scheduler_id="test-inline"):
+            pass
+    finally:
+        db.close()
+
+    for job_id in small_jobs:
+        assert publisher.messages[job_id]["payload"] == {"n": 1}
+    for job_id in large_jobs:
+        message = publisher.messages[job_id]
+        assert "payload" not in message and "results" not in message
+        assert message["type"] == "test" and message["attempt"] == 1
+
+def test_lanes_route_each_job_to_its_priority_queue(publisher):
+    critical_jobs = seed_ready_jobs(2, priority="Critical")
+    low_jobs = seed_ready_jobs(2, priority="Low")
+
+    db = TestingSessionLocal()
+    try:
+        while scheduler.dispatch_batch(db, batch_size=1000, scheduler_id="test-lanes", queues="lanes"):
+            pass
+    finally:
+        db.close()
+
+    for job_id in critical_jobs:
+        assert publisher.routing_keys[job_id] == f"job.lane.critical.{job_id}"
+    for job_id in low_jobs:
+        assert publisher.routing_keys[job_id] == f"job.lane.low.{job_id}"
+        assert publisher.messages[job_id]["priority"] == "Low" and publisher.messages[job_id]["queued_at"]
+
+def test_longest_chain_of_dependants_is_dispatched_first_within_a_priority(publisher):
+    # two ready parents of the same priority: `short` has one dependant,
+    # `long` a chain of three and was submitted last. Jobs of a priority share
+    # a queue, so the order that matters is the order they are published in.
+    short = seed_job_pks(1, "ready", run_at_offset=-60)[0]
+    long = seed_job_pks(1, "ready")[0]
+    short_child = seed_job_pks(1, "waiting", unmet=1)[0]
+    chain = seed_job_pks(3, "waiting", unmet=1)
+    with engine.begin() as conn:
+        conn.execute(insert(JobDependency), [
+            {"depends_on_id": parent, "dependant_id": child}
+            for parent, child in [(short, short_child), (long, chain[0]), (chain[0], chain[1])]
+        ])
+
+    db = TestingSessionLocal()
+    try:
+        scheduler.load_dependency_graph(db)
+        assert scheduler.dependency_graph.critical_path(long) == 2
+        # submitted later, extends the chain through the notification path
+        with engine.begin() as conn:
+            conn.execute(insert(JobDependency), [{"depends_on_id": chain[1], "dependant_id": chain[2]}])
+        scheduler.add_dependants(db, [chain[2]])
+        assert critical_paths([short, long]) == {short: 1, long: 3}
+        while scheduler.dispatch_batch(db, batch_size=1000, scheduler_id="test-critical-path"):
+            pass
+        job_ids = dict(db.execute(select(Job.id, Job.job_id).where(Job.id.in_([short, long]))).all())
+    finally:
+        db.close()
+
+    order = [job_id for job_id in publisher.published if job_id in {str(job_ids[short]), str(job_ids[long])}]
+    assert order == [str(job_ids[long]), str(job_ids[short])]
+
+def test_scheduler_reconnects_after_losing_the_database(monkeypatch):
+    import psycopg2
+
+    class Stop(Exception):
+        pass
+
+    class Listener:
+        def close(self):
+            pass
+
+    calls = Counter()
+
+    def count(name, result=None):
+        def call(*args):
+            calls[name] += 1
+            return result
+        return call
+
+    def wait_for_job_events(listen_conn, timeout):
+        calls["wait"] += 1
+        if calls["wait"] == 1:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        raise Stop()
+
+    monkeypatch.setattr(scheduler, "RECONNECT_SECONDS", 0)
+    monkeypatch.setattr(scheduler, "open_job_events_listener", count("listen", result=Listener()))
+    monkeypatch.setattr(scheduler, "load_dependency_graph", count("graph"))
+    monkeypatch.setattr(scheduler, "dispatch_ready_jobs", count("dispatch"))
+    monkeypatch.setattr(scheduler, "wait_for_job_events", wait_for_job_events)
+    db = TestingSessionLocal()
+    try:
+        with pytest.raises(Stop):
+            scheduler.schedule_jobs(db)
+    finally:
+        db.close()
+    # a new listener, the graph reloaded and a full pass for what was missed
+    assert (calls["listen"], calls["graph"], calls["dispatch"]) == (2, 2, 2)
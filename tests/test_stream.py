@@ -0,0 +1,139 @@
+from app.services.stream import StreamHub
+
+def event(id, job_uuid="a", status="completed", type="sleep"):
+    return {"id": id, "job_uuid": job_uuid, "status": status, "type": type}
+
+async def replayed(hub, subscription, since):
+    return [e["seq"] async for e in hub.replay(subscription, since)]
+
+def drain(subscription):
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait()["id"])
+    return events
+
+async def test_events_reach_matching_subscriptions_only():
+    hub = StreamHub()
+    hub.start = lambda: None # no broker
+    everything = hub.subscribe()
+    job_a = hub.subscribe(job_ids=["a"])
+    failed_sleeps = hub.subscribe(statuses=["failed"], types=["sleep"])
+    hub.publish(event(1))
+    hub.publish(event(2, job_uuid="b", status="failed"))
+    hub.publish(event(3, job_uuid="b", status="failed", type="http"))
+
+    assert drain(everything) == [1, 2, 3]
+    assert drain(job_a) == [1]
+    assert drain(failed_sleeps) == [2]
+
+    hub.unsubscribe(job_a)
+    hub.publish(event(4))
+    assert drain(job_a) == [] and not hub.by_job
+
+async def test_slow_subscription_drops_oldest_events():
+    hub = StreamHub(queue_size=3)
+    hub.start = lambda: None
+    slow, fast = hub.subscribe(), hub.subscribe()
+    for id in range(5):
+        hub.publish(event(id))
+        fast.queue.get_nowait()
+    assert drain(slow) == [2, 3, 4]
+    assert slow.dropped == 2 and fast.dropped == 0
+
+class FakeLog:
+    # execution_logs as the hub's fetch sees it
+    def __init__(self, ids):
+        self.ids = ids
+        self.queries = []
+
+    async def fetch(self, after=None, before=None, job_ids=None, limit=1000, newest=False):
+        self.queries.append((after, before, newest))
+        ids = [id for id in self.ids if (after is None or id > after) and (before is None or id < before)]
+        ids = ids[-limit:] if newest else ids[:limit]
+        return [event(id) for id in ids]
+
+async def test_replay_is_served_from_memory_after_one_load():
+    log = FakeLog(list(range(1, 11)))
+    hub = StreamHub(buffer_size=5, fetch=log.fetch)
+    hub.start = lambda: None
+    subscription = hub.subscribe()
+
+    assert await replayed(hub, subscription, since=7) == [8, 9, 10]
+    hub.publish(event(11))
+    assert await replayed(hub, subscription, since=9) == [10, 11]
+    # the newest rows were loaded once, everything else came from the buffer
+    assert log.queries == [(None, None, True)]
+    assert hub.replayed_from_memory == 2
+
+async def test_replay_older_than_buffer_reads_the_gap_only():
+    log = FakeLog(list(range(1, 11)))
+    hub = StreamHub(buffer_size=5, fetch=log.fetch)
+    hub.start = lambda: None
+    subscription = hub.subscribe()
+    await replayed(hub, subscription, since=10)
+    assert hub.complete_after == 5
+
+    assert await replayed(hub, subscription, since=2) == list(range(3, 11))
+    assert log.queries[-1] == (2, 6, False)
+    assert hub.replayed_from_database == 1
+
+async def test_concurrent_reconnects_share_one_load():
+    import asyncio
+    log = FakeLog(list(range(1, 4)))
+    hub = StreamHub(fetch=log.fetch)
+    hub.start = lambda: None
+    subscriptions = [hub.subscribe() for _ in range(50)]
+    replays = await asyncio.gather(*(replayed(hub, s, since=1) for s in subscriptions))
+    assert all(replay == [2, 3] for replay in replays)
+    assert len(log.queries) == 1
+
+async def test_replay_pages_through_a_gap_larger_than_a_page(monkeypatch):
+    from app.services import stream
+    monkeypatch.setattr(stream, "REPLAY_MAX_ROWS", 4)
+    log = FakeLog(list(range(1, 21)))
+    hub = StreamHub(buffer_size=5, fetch=log.fetch)
+    hub.start = lambda: None
+    subscription = hub.subscribe()
+
+    assert await replayed(hub, subscription, since=1) == list(range(2, 21))
+    # the newest rows, then pages of 4 up to the buffer
+    assert log.queries == [(None, None, True), (1, 16, False), (5, 16, False), (9, 16, False), (13, 16, False)]
+
+async def test_late_event_is_buffered_in_seq_order():
+    hub = StreamHub(fetch=FakeLog([]).fetch)
+    hub.start = lambda: None
+    subscription = hub.subscribe()
+    for id in (1, 2, 4, 3, 4):
+        hub.publish(event(id))
+    assert [e["seq"] for e in hub.buffer] == [1, 2, 3, 4]
+    assert await replayed(hub, subscription, since=2) == [3, 4]
+
+async def test_consumer_reconnects_after_any_error(monkeypatch):
+    import asyncio
+    from app.services import stream
+
+    class FlakyClient:
+        connects = 0
+
+        async def connect(self):
+            FlakyClient.connects += 1
+            if FlakyClient.connects == 1:
+                raise RuntimeError("not a broker error")
+
+        async def close(self):
+            pass
+
+    monkeypatch.setattr(stream, "AsyncRabbitMQClient", FlakyClient)
+    monkeypatch.setattr(stream, "RECONNECT_SECONDS", 0)
+    consumed = asyncio.Event()
+    consumer = stream.StreamConsumer(StreamHub())
+
+    async def consume():
+        consumed.set()
+        await asyncio.Event().wait()
+
+    consumer.consume = consume
+    consumer.start()
+    await asyncio.wait_for(consumed.wait(), 1)
+    assert FlakyClient.connects == 2
+    await consumer.stop()
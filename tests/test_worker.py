@@ -0,0 +1,167 @@
+import pytest
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.models.models import Job, ExecutionLog
+from app.services.worker import WORKER_ID, JobExecutor, JobStore
+from app.services.tasks import TaskRegistry
+import os
+
+DB_USER = os.getenv("DB_USER", "vast")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "qweasdzx")
+DB_NAME = os.getenv("DB_NAME", "test_smart_queue")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def seed_queued_job(job_type="sleep", payload=None, timeout=None, **retry_config):
+    job_id = uuid.uuid4()
+    with engine.begin() as conn:
+        conn.execute(insert(Job), [{
+            "job_id": job_id, "job_name": "worker_test", "type": job_type, "status": "queued",
+            "priority": "Normal", "run_at": datetime.now(timezone.utc),
+            "payload": payload or {"duration_seconds": 0.01}, "timeout": timeout,
+            **retry_config,
+        }])
+    return job_id
+
+def job_row(job_id):
+    db = TestingSessionLocal()
+    try:
+        job = db.query(Job).filter(Job.job_id == job_id).one()
+        logs = db.query(ExecutionLog).filter(ExecutionLog.job_id == job.id).all()
+        return job, logs
+    finally:
+        db.close()
+
+async def run_messages(*job_ids, **message):
+    executor = JobExecutor(JobStore(TestingSessionLocal), concurrency=4)
+    acks = []
+    for job_id in job_ids:
+        executor.submit({"job_id": str(job_id), **message}, acks.append)
+    await executor.drain()
+    return acks
+
+async def test_worker_completes_job_and_acks():
+    job_id = seed_queued_job()
+    acks = await run_messages(job_id)
+
+    job, logs = job_row(job_id)
+    assert acks == [False]
+    assert job.status == "completed"
+    assert job.times_attempted == 1
+    assert len(logs) == 1 and logs[0].is_successful
+
+async def test_duplicate_delivery_runs_once():
+    job_id = seed_queued_job()
+    acks = await run_messages(job_id, job_id)
+
+    job, logs = job_row(job_id)
+    assert acks == [False, False]
+    assert job.times_attempted == 1
+    assert len(logs) == 1
+
+async def test_inline_payload_is_used_over_the_row():
+    # the row's payload would time out, the one in the message doesn't
+    job_id = seed_queued_job(payload={"duration_seconds": 30}, timeout=1)
+    await asyncio.wait_for(run_messages(job_id, payload={"duration_seconds": 0.01}), timeout=5)
+
+    job, logs = job_row(job_id)
+    assert job.status == "completed"
+
+async def test_timeout_cancels_job():
+    job_id = seed_queued_job(payload={"duration_seconds": 30}, timeout=1)
+    await asyncio.wait_for(run_messages(job_id), timeout=5)
+
+    job, logs = job_row(job_id)
+    assert job.status == "failed"
+    assert "timed out" in logs[0].message
+
+async def test_unknown_job_type_fails():
+    job_id = seed_queued_job(job_type="no_such_type")
+    await run_messages(job_id)
+
+    job, logs = job_row(job_id)
+    assert job.status == "failed"
+    assert "No handler registered" in logs[0].message
+
+async def test_process_backend_task_completes():
+    job_id = seed_queued_job(job_type="checksum", payload={"data": "abc", "rounds": 10})
+    await asyncio.wait_for(run_messages(job_id), timeout=30)
+
+    job, logs = job_row(job_id)
+    assert job.status == "completed"
+    assert len(job.results["checksum"]) == 64
+
+async def test_failed_attempt_is_retried_with_backoff():
+    job_id = seed_queued_job(job_type="no_such_type", max_attempts=3, initial_delay=2, backoff_multiplier=3)
+    before = datetime.now(timezone.utc)
+    acks = await run_messages(job_id)
+
+    job, logs = job_row(job_id)
+    assert acks == [False] # acked, the retry is not a broker redelivery
+    assert job.status == "retrying"
+    assert job.times_attempted == 1
+    # initial_delay * backoff_multiplier ^ 1 = 6s, +/- 10% jitter
+    delay = (job.run_at - before).total_seconds()
+    assert 5.3 <= delay <= 6.7
+
+async def test_job_fails_after_max_attempts():
+    job_id = seed_queued_job(job_type="no_such_type", max_attempts=3, times_attempted=2)
+    await run_messages(job_id)
+
+    job, logs = job_row(job_id)
+    assert job.status == "failed"
+    assert job.times_attempted == 3
+
+def test_registry_rejects_mismatched_backend():
+    registry = TaskRegistry()
+    with pytest.raises(TypeError):
+        registry.task("blocking_on_loop", backend="async")(lambda payload: None)
+    with pytest.raises(ValueError):
+        registry.task("gpu", backend="gpu")
+
+    @registry.task("once", backend="thread")
+    def once(payload):
+        return payload
+
+    assert once({"a": 1}) == {"a": 1} # the decorator leaves the function callable as is
+    with pytest.raises(ValueError):
+        registry.task("once", backend="thread")(once)
+
+async def test_log_sink_receives_log_instead_of_db_row():
+    job_id = seed_queued_job()
+    published = []
+    executor = JobExecutor(JobStore(TestingSessionLocal), concurrency=4, log_sink=published.append)
+    acks = []
+    executor.submit({"job_id": str(job_id)}, acks.append)
+    await executor.drain()
+
+    job, logs = job_row(job_id)
+    assert job.status == "completed"
+    assert logs == []
+    assert len(published) == 1
+    assert published[0]["job_uuid"] == str(job_id) and published[0]["is_successful"]
+
+async def test_running_job_lease_is_renewed_until_it_finishes():
+    job_id = seed_queued_job(payload={"duration_seconds": 0.5})
+    executor = JobExecutor(JobStore(TestingSessionLocal), concurrency=4)
+    executor.start_lease_renewal(interval=0.1)
+    acks = []
+    executor.submit({"job_id": str(job_id)}, acks.append)
+    await asyncio.sleep(0.2)
+    job, _ = job_row(job_id)
+    assert job.status == "running" and job.claimed_by == WORKER_ID
+    first_lease = job.lease_expires_at
+    await asyncio.sleep(0.2)
+    assert job_row(job_id)[0].lease_expires_at > first_lease
+
+    await executor.drain()
+    job, _ = job_row(job_id)
+    assert acks == [False]
+    assert job.status == "completed" and job.claimed_by is None and job.lease_expires_at is None